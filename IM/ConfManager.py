@@ -76,6 +76,69 @@ class ConfManager(LoggerMixin, threading.Thread):
         self._stop_thread = False
         self.ansible_process = None
         self.logger = logging.getLogger('ConfManager')
+        self._event_cond = threading.Condition()
+        self._event_version = 0
+        self._vm_updates = {}
+
+    def notify_event(self):
+        """
+        Notify an event that may change the state of the contextualization (a ctxt process
+        or a configuration thread has finished, a VM has changed its state or IPs, new tasks
+        have been added, ...) to wake up the threads waiting for it
+        """
+        with self._event_cond:
+            self._event_version += 1
+            self._event_cond.notify_all()
+
+    def get_event_version(self):
+        """
+        Get the number of events notified
+        """
+        with self._event_cond:
+            return self._event_version
+
+    def wait_event(self, since, timeout):
+        """
+        Wait (up to timeout secs) for an event notified after the version since (or the thread to be stopped)
+
+        Returns: True if some event has been notified or False if the timeout has passed
+        """
+        end = time.time() + timeout
+        with self._event_cond:
+            while self._event_version == since and not self._stop_thread:
+                remaining = end - time.time()
+                if remaining <= 0:
+                    return False
+                self._event_cond.wait(remaining)
+            return True
+
+    def _update_vm_status(self, vm):
+        """
+        Update the status of a VM waited by the ConfManager threads. As all of them are woken up
+        on each event, it is updated at most once every CHECK_CTXT_PROCESS_INTERVAL secs.
+
+        Returns: True if the status has been updated or False otherwise
+        """
+        now = time.time()
+        with self._event_cond:
+            if now - self._vm_updates.get(vm.im_id, 0) < Config.CHECK_CTXT_PROCESS_INTERVAL:
+                return False
+            self._vm_updates[vm.im_id] = now
+        return vm.update_status(self.auth)
+
+    def _run_conf_thread(self, conf_threads, target, *args):
+        """
+        Run a configuration task and notify its end to the ConfManager
+        """
+        try:
+            target(*args)
+        finally:
+            try:
+                # It has finished, do not wait it to exit
+                conf_threads.remove(threading.current_thread())
+            except ValueError:
+                pass
+            self.notify_event()
 
     def check_running_pids(self, vms_configuring):
         """
@@ -125,6 +188,7 @@ class ConfManager(LoggerMixin, threading.Thread):
         self._stop_thread = True
         # put a task to assure to wake up the thread
         self.inf.add_ctxt_tasks([(-10, 0, None, None)])
+        self.notify_event()
         self.log_info("Stop Configuration thread.")
         if self.ansible_process and self.ansible_process.is_alive():
             self.log_info("Stopping pending Ansible process.")
@@ -134,9 +198,9 @@ class ConfManager(LoggerMixin, threading.Thread):
         """
         Assure that all the VMs of the Inf. have all the requested public IPs assigned
         """
-        wait = 0
+        end = time.time() + timeout
         success = False
-        while not success and wait < timeout and not self._stop_thread:
+        while not success and time.time() < end and not self._stop_thread:
             success = True
             for vm in self.inf.get_vm_list():
                 if not vm.contextualize():
@@ -152,12 +216,12 @@ class ConfManager(LoggerMixin, threading.Thread):
                     if not vm.getPublicIP():
                         self.log_debug("And it does not have it assigned yet.")
                         success = False
-                        vm.update_status(self.auth)
+                        self._update_vm_status(vm)
 
             if not success:
                 self.log_warn("Still waiting all the VMs to have all the requested IPs")
-                wait += Config.CONFMAMAGER_CHECK_STATE_INTERVAL
-                time.sleep(Config.CONFMAMAGER_CHECK_STATE_INTERVAL)
+                # Wait for the VMs to change (or to update them again)
+                self.wait_event(self.get_event_version(), Config.CONFMAMAGER_CHECK_STATE_INTERVAL)
 
         if not success:
             self.inf.set_configured(False)
@@ -176,10 +240,10 @@ class ConfManager(LoggerMixin, threading.Thread):
         """
         Assure that all the VMs of the Inf. have at least one IP
         """
-        wait = 0
+        end = time.time() + timeout
 
         success = False
-        while not success and wait < timeout and not self._stop_thread:
+        while not success and time.time() < end and not self._stop_thread:
             success = True
             for vm in self.inf.get_vm_list():
                 if not vm.contextualize():
@@ -195,7 +259,7 @@ class ConfManager(LoggerMixin, threading.Thread):
 
                 if not ip:
                     # If the IP is not Available try to update the info
-                    vm.update_status(self.auth)
+                    self._update_vm_status(vm)
 
                     # If the VM is not in a "running" state, ignore it
                     if vm.state in VirtualMachine.NOT_RUNNING_STATES:
@@ -218,8 +282,8 @@ class ConfManager(LoggerMixin, threading.Thread):
 
             if not success:
                 self.log_warn("Still waiting all the VMs to have a correct IP")
-                wait += Config.CONFMAMAGER_CHECK_STATE_INTERVAL
-                time.sleep(Config.CONFMAMAGER_CHECK_STATE_INTERVAL)
+                # Wait for the VMs to change (or to update them again)
+                self.wait_event(self.get_event_version(), Config.CONFMAMAGER_CHECK_STATE_INTERVAL)
 
         if not success:
             self.log_error("Error waiting all the VMs to have a correct IP")
@@ -266,12 +330,14 @@ class ConfManager(LoggerMixin, threading.Thread):
                         vm.configured = False
                 return
 
+            # Get the version before checking the processes to avoid losing any event
+            since = self.get_event_version()
             vms_configuring = self.check_running_pids(vms_configuring)
 
-            # If the queue is empty but there are vms configuring wait and test
-            # again
+            # If the queue is empty but there are vms configuring wait for them to finish
+            # (or new tasks) and test again
             if self.inf.ctxt_tasks.empty() and vms_configuring:
-                time.sleep(Config.CONFMAMAGER_CHECK_STATE_INTERVAL)
+                self.wait_event(since, Config.CONFMAMAGER_CHECK_STATE_INTERVAL)
                 continue
 
             (step, prio, vm, tasks) = self.inf.ctxt_tasks.get()
@@ -293,7 +359,7 @@ class ConfManager(LoggerMixin, threading.Thread):
                     # If there are any process running of last step, wait
                     if last_step in vms_configuring and len(vms_configuring[last_step]) > 0:
                         self.log_info("Waiting processes of step " + str(last_step) + " to finish.")
-                        time.sleep(Config.CONFMAMAGER_CHECK_STATE_INTERVAL)
+                        self.wait_event(since, Config.CONFMAMAGER_CHECK_STATE_INTERVAL)
                     else:
                         # if not, update the step, to go ahead with the new step
                         self.log_info("Step " + str(last_step) + " finished. Go to step: " + str(step))
@@ -315,8 +381,8 @@ class ConfManager(LoggerMixin, threading.Thread):
                         # priority enabling to select other items of the queue
                         # before
                         self.inf.add_ctxt_tasks([(step, prio + 1, vm, tasks)])
-                        # Sleep to check this later
-                        time.sleep(Config.CONFMAMAGER_CHECK_STATE_INTERVAL)
+                        # Wait the process to finish to check this again
+                        self.wait_event(since, Config.CONFMAMAGER_CHECK_STATE_INTERVAL)
                     else:
                         if not tasks:
                             self.log_info("No tasks to execute. Ignore this step.")
@@ -325,8 +391,8 @@ class ConfManager(LoggerMixin, threading.Thread):
                             # Mark this VM as configuring
                             vm.configured = None
                             # Launch the ctxt_agent using a thread
-                            t = threading.Thread(name="launch_ctxt_agent_" + str(
-                                vm.id), target=self.launch_ctxt_agent, args=(vm, tasks))
+                            t = threading.Thread(name="launch_ctxt_agent_" + str(vm.id), target=self._run_conf_thread,
+                                                 args=(vm.inf.conf_threads, self.launch_ctxt_agent, vm, tasks))
                             t.daemon = True
                             t.start()
                             vm.inf.conf_threads.append(t)
@@ -344,7 +410,8 @@ class ConfManager(LoggerMixin, threading.Thread):
                     # Launch the Infrastructure tasks
                     vm.configured = None
                     for task in tasks:
-                        t = threading.Thread(name=task, target=getattr(self, task))
+                        t = threading.Thread(name=task, target=self._run_conf_thread,
+                                             args=(vm.conf_threads, getattr(self, task)))
                         t.daemon = True
                         t.start()
                         vm.conf_threads.append(t)
@@ -1104,10 +1171,10 @@ class ConfManager(LoggerMixin, threading.Thread):
         Returns: True if all the VMs are running or false otherwise
         """
         delay = Config.CHECK_CTXT_PROCESS_INTERVAL
-        wait = 0
-        while not self._stop_thread and wait < timeout:
+        end = time.time() + timeout
+        while not self._stop_thread and time.time() < end:
             if not vm.destroy:
-                vm.update_status(self.auth)
+                self._update_vm_status(vm)
 
                 if vm.state == VirtualMachine.RUNNING:
                     self.log_info("VM " + str(vm.id) + " is Running.")
@@ -1120,8 +1187,8 @@ class ConfManager(LoggerMixin, threading.Thread):
                 return False
 
             self.log_info("VM " + str(vm.id) + " is not running yet.")
-            time.sleep(delay)
-            wait += delay
+            # Wait for the VM to change (or to update it again)
+            self.wait_event(self.get_event_version(), delay)
 
         # Timeout, return False
         return False
@@ -1136,17 +1203,17 @@ class ConfManager(LoggerMixin, threading.Thread):
         Returns: True if the VM have the SSH port open or false otherwise
         """
         delay = 10
-        wait = 0
+        end = time.time() + timeout
         auth_errors = 0
         auth_error_retries = 3
         connected = False
         ip = None
-        while not self._stop_thread and wait < timeout:
+        while not self._stop_thread and time.time() < end:
             if vm.destroy:
                 # in this case ignore it
                 return False, "VM destroyed."
             else:
-                vm.update_status(self.auth)
+                self._update_vm_status(vm)
                 if vm.state == VirtualMachine.FAILED:
                     self.log_warn('VM: ' + str(vm.id) + " is in state Failed. Does not wait for SSH.")
                     return False, "VM Failure."
@@ -1175,13 +1242,11 @@ class ConfManager(LoggerMixin, threading.Thread):
                         return True, ""
                     else:
                         self.log_info('do not connect, wait ...')
-                        wait += delay
                         time.sleep(delay)
                 else:
                     self.log_warn('VM ' + str(vm.id) + ' with no IP')
-                    # Update the VM info and wait to have a valid public IP
-                    wait += delay
-                    time.sleep(delay)
+                    # Update the VM info and wait to have a valid public IP (or the VM to change)
+                    self.wait_event(self.get_event_version(), delay)
 
         # Timeout, return False
         if ip:
@@ -1241,6 +1306,7 @@ class ConfManager(LoggerMixin, threading.Thread):
 
                 if change_creds:
                     self.inf.vm_master.info.systems[0].updateNewCredentialValues()
+                    self.inf.vm_master.changed()
         except Exception:
             self.log_exception("Error changing credentials to master VM.")
 
@@ -1297,7 +1363,7 @@ class ConfManager(LoggerMixin, threading.Thread):
                 return (False, "Timeout. Ansible process terminated.")
             else:
                 self.log_info('Waiting Ansible process to finish (%d/%d).' % (wait, Config.ANSIBLE_INSTALL_TIMEOUT))
-                time.sleep(Config.CHECK_CTXT_PROCESS_INTERVAL)
+                self.ansible_process.join(Config.CHECK_CTXT_PROCESS_INTERVAL)
                 wait += Config.CHECK_CTXT_PROCESS_INTERVAL
 
         self.log_info('Ansible process finished.')
@@ -0,0 +1,235 @@
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import logging
+import threading
+import time
+import zlib
+
+from IM.db import DataBase
+from IM.config import Config
+
+
+class ContMsgStore:
+    """
+    Storage of the contextualization messages of the infrastructures and VMs in a separate
+    table of the DATA_DB (if CONTMSG_STORE is set), so that they are not rewritten with the
+    infrastructure data. Each message is stored as a list of compressed segments: the new
+    parts of the message are appended as new segments and the oldest ones are removed when
+    the size of the message exceeds CONTMSG_MAX_SIZE.
+    """
+
+    logger = logging.getLogger('InfrastructureManager')
+    """Logger object."""
+
+    TABLE = "inf_contmsg"
+    """Name of the table used to store the messages."""
+
+    INF_MSG = -1
+    """ID used to store the message of the infrastructure (the VMs use their IM ID)."""
+
+    _tables = set()
+    """DB URLs where the table has been created."""
+
+    _lock = threading.Lock()
+    """Threading Lock to create the table."""
+
+    @staticmethod
+    def truncate(msg, max_size=None):
+        """
+        Get the last part of a message limiting its size (CONTMSG_MAX_SIZE by default)
+        """
+        if max_size is None:
+            max_size = Config.CONTMSG_MAX_SIZE
+        if max_size and msg and len(msg) > max_size:
+            return msg[-max_size:]
+        return msg
+
+    @staticmethod
+    def init_table(db):
+        """
+        Create the table to store the messages (if it does not exist)
+        """
+        with ContMsgStore._lock:
+            if db.db_url in ContMsgStore._tables:
+                return
+            if not db.table_exists(ContMsgStore.TABLE):
+                ContMsgStore.logger.debug("Creating the table of contextualization messages.")
+                if db.db_type == DataBase.MONGO:
+                    db.create_index(ContMsgStore.TABLE, "id")
+                else:
+                    db.execute("CREATE TABLE %s(id VARCHAR(255), vm_id INTEGER, seq INTEGER, size INTEGER,"
+                               " date TIMESTAMP, data LONGBLOB, PRIMARY KEY (id, vm_id, seq))" % ContMsgStore.TABLE)
+            ContMsgStore._tables.add(db.db_url)
+
+    @staticmethod
+    def _get_state(msg, segments, digest=None):
+        """
+        Get the state of a message stored in the DB: the length and digest of the message
+        in memory and the list of (seq, size) of the segments stored.
+        """
+        if digest is None:
+            digest = hashlib.sha1(msg.encode("utf-8")).hexdigest()
+        return (Config.DATA_DB, len(msg), digest, segments)
+
+    @staticmethod
+    def load(obj, inf_id, vm_id):
+        """
+        Load a message from the DB setting the stored state in the object.
+
+        Args:
+
+        - obj(InfrastructureInfo or VirtualMachine): object that owns the message.
+        - inf_id(str): infrastructure id.
+        - vm_id(int): IM ID of the VM or INF_MSG.
+
+        Return: a str with the message.
+        """
+        segments = []
+        data = []
+        db = DataBase(Config.DATA_DB, pooled=True)
+        if db.connect():
+            try:
+                ContMsgStore.init_table(db)
+                if db.db_type == DataBase.MONGO:
+                    res = db.find(ContMsgStore.TABLE, {"id": inf_id, "vm_id": vm_id},
+                                  {"seq": True, "size": True, "data": True}, [('seq', 1)])
+                    res = [(elem["seq"], elem["size"], elem["data"]) for elem in res]
+                else:
+                    res = db.select("select seq, size, data from %s where id = %%s and vm_id = %%s order by seq" %
+                                    ContMsgStore.TABLE, (inf_id, vm_id))
+            finally:
+                db.close()
+            for seq, size, segment in res:
+                segments.append((seq, size))
+                data.append(zlib.decompress(segment).decode("utf-8"))
+        else:
+            ContMsgStore.logger.error("ERROR connecting with the database!.")
+
+        msg = "".join(data)
+        obj.__dict__['_contmsg_state'] = ContMsgStore._get_state(msg, segments)
+        return msg
+
+    @staticmethod
+    def _get_msgs(inf):
+        """
+        Get the list of (vm_id, object) with the messages loaded in memory of an Inf and its VMs
+        """
+        res = [(ContMsgStore.INF_MSG, inf)] + [(vm.im_id, vm) for vm in inf.vm_list]
+        return [(vm_id, obj) for vm_id, obj in res if 'cont_out' in obj.__dict__]
+
+    @staticmethod
+    def _get_changes(obj):
+        """
+        Get the changes in the message of an object since it was stored.
+
+        Return: a tuple with the seq of the oldest segment to keep (None to remove all the
+        segments), the list of (seq, size, text) to add and the new state (None if the message
+        has not changed).
+        """
+        msg = obj.cont_out or ""
+        state = obj.__dict__.get('_contmsg_state')
+        segments = []
+        if state and state[0] == Config.DATA_DB:
+            _, length, digest, segments = state
+            if len(msg) >= length:
+                msg_hash = hashlib.sha1(msg[:length].encode("utf-8"))
+                if msg_hash.hexdigest() == digest:
+                    if len(msg) == length:
+                        return segments[0][0] if segments else 0, [], None
+                    # Only new text has been appended to the message
+                    new_text = msg[length:]
+                    msg_hash.update(new_text.encode("utf-8"))
+                    if not Config.CONTMSG_MAX_SIZE or len(new_text) < Config.CONTMSG_MAX_SIZE:
+                        seq = segments[-1][0] + 1 if segments else 0
+                        segments = segments + [(seq, len(new_text))]
+                        # Rotate the segments removing the oldest ones
+                        while (Config.CONTMSG_MAX_SIZE and len(segments) > 1 and
+                               sum(size for _, size in segments) > Config.CONTMSG_MAX_SIZE):
+                            segments = segments[1:]
+                        new_state = ContMsgStore._get_state(msg, segments, msg_hash.hexdigest())
+                        return segments[0][0], [(seq, len(new_text), new_text)], new_state
+
+        # The message has been replaced: store only the last part of it
+        text = ContMsgStore.truncate(msg)
+        seq = segments[-1][0] + 1 if segments else 0
+        return None, [(seq, len(text), text)], ContMsgStore._get_state(msg, [(seq, len(text))])
+
+    @staticmethod
+    def save(db, inf):
+        """
+        Store the changes in the messages of an Inf and its VMs.
+
+        Args:
+
+        - db(DataBase): DB connection to use.
+        - inf(InfrastructureInfo): infrastructure to store.
+
+        Return: True if the changes are stored successfully.
+        """
+        ContMsgStore.init_table(db)
+        to_replace = []
+        to_rotate = []
+        to_insert = []
+        new_states = []
+        for vm_id, obj in ContMsgStore._get_msgs(inf):
+            keep_seq, segments, new_state = ContMsgStore._get_changes(obj)
+            if new_state is None:
+                continue
+            if keep_seq is None:
+                to_replace.append((inf.id, vm_id))
+            else:
+                to_rotate.append((inf.id, vm_id, keep_seq))
+            for seq, size, text in segments:
+                to_insert.append((inf.id, vm_id, seq, size, zlib.compress(text.encode("utf-8"))))
+            new_states.append((obj, new_state))
+
+        if not new_states:
+            return True
+
+        if db.db_type == DataBase.MONGO:
+            for inf_id, vm_id in to_replace:
+                db.delete(ContMsgStore.TABLE, {"id": inf_id, "vm_id": vm_id})
+            for inf_id, vm_id, keep_seq in to_rotate:
+                db.delete(ContMsgStore.TABLE, {"id": inf_id, "vm_id": vm_id, "seq": {"$lt": keep_seq}})
+            for inf_id, vm_id, seq, size, data in to_insert:
+                db.replace(ContMsgStore.TABLE, {"id": inf_id, "vm_id": vm_id, "seq": seq},
+                           {"id": inf_id, "vm_id": vm_id, "seq": seq, "size": size,
+                            "date": time.time(), "data": data})
+            res = True
+        else:
+            res = db.executemany("delete from %s where id = %%s and vm_id = %%s" % ContMsgStore.TABLE, to_replace)
+            if res:
+                res = db.executemany("delete from %s where id = %%s and vm_id = %%s and seq < %%s" %
+                                     ContMsgStore.TABLE, to_rotate)
+            if res:
+                res = db.executemany("replace into %s (id, vm_id, seq, size, date, data) values"
+                                     " (%%s, %%s, %%s, %%s, now(), %%s)" % ContMsgStore.TABLE, to_insert)
+        if res:
+            for obj, new_state in new_states:
+                obj.__dict__['_contmsg_state'] = new_state
+        return res
+
+    @staticmethod
+    def delete_all(db):
+        """
+        Delete all the messages stored in the DB
+        """
+        if db.db_type == DataBase.MONGO:
+            db.delete(ContMsgStore.TABLE, {})
+        elif db.table_exists(ContMsgStore.TABLE):
+            db.execute("delete from %s" % ContMsgStore.TABLE)
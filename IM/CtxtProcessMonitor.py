@@ -0,0 +1,276 @@
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from IM.config import Config
+
+
+class CtxtProcessMonitor:
+    """
+    Background service that checks the contextualization processes of the VMs.
+    The processes launched in the same master node are checked with a single remote command.
+    """
+
+    logger = logging.getLogger('InfrastructureManager')
+    """Logger object."""
+
+    END_MARK = "__IM_CTXT_END__"
+    """Text printed at the end of the remote command to check that it has been completely executed."""
+
+    _masters = {}
+    """Monitored master nodes indexed by SSH host, port and user: VMs, next check time, interval and busy flag.
+    Each VM entry stores the offset of the ctxt log already read to only get the new contents."""
+
+    _cond = threading.Condition()
+    """Condition to protect the monitor data and to wake up the monitor thread."""
+
+    _thread = None
+    """Monitor thread."""
+
+    _pool = None
+    """Pool of threads used to check the master nodes."""
+
+    _stop = False
+    """Flag to stop the monitor thread."""
+
+    @staticmethod
+    def add(vm):
+        """
+        Start monitoring the contextualization process of a VM (with the PID set in vm.ctxt_pid).
+
+        Args:
+
+        - vm(VirtualMachine): VM to monitor.
+        """
+        ssh = vm.get_ssh_ansible_master()
+        if ssh:
+            key = (ssh.host, ssh.port, ssh.username)
+        else:
+            # It will fail when it is checked
+            key = (None, None, id(vm))
+
+        now = time.time()
+        entry = {"vm": vm, "initial_out": vm.cont_out, "last_log": now, "log_offset": 0}
+        with CtxtProcessMonitor._cond:
+            if key not in CtxtProcessMonitor._masters:
+                CtxtProcessMonitor._masters[key] = {"vms": {}, "next": now + Config.CHECK_CTXT_PROCESS_INTERVAL,
+                                                    "interval": Config.CHECK_CTXT_PROCESS_INTERVAL, "busy": False}
+            CtxtProcessMonitor._masters[key]["vms"][id(vm)] = entry
+            CtxtProcessMonitor._cond.notify_all()
+
+            if CtxtProcessMonitor._thread is None or not CtxtProcessMonitor._thread.is_alive():
+                CtxtProcessMonitor._stop = False
+                CtxtProcessMonitor._thread = threading.Thread(target=CtxtProcessMonitor._monitor_loop,
+                                                              name="CtxtProcessMonitor")
+                CtxtProcessMonitor._thread.daemon = True
+                CtxtProcessMonitor._thread.start()
+
+    @staticmethod
+    def stop():
+        """
+        Stop the monitor thread.
+        """
+        with CtxtProcessMonitor._cond:
+            thread = CtxtProcessMonitor._thread
+            CtxtProcessMonitor._stop = True
+            CtxtProcessMonitor._masters = {}
+            CtxtProcessMonitor._cond.notify_all()
+        if thread and thread is not threading.current_thread():
+            thread.join(Config.CHECK_CTXT_PROCESS_INTERVAL)
+        CtxtProcessMonitor._thread = None
+
+    @staticmethod
+    def get_stats():
+        """
+        Get the number of master nodes and VMs monitored.
+        """
+        with CtxtProcessMonitor._cond:
+            masters = list(CtxtProcessMonitor._masters.values())
+        return {"masters": len(masters), "vms": sum(len(master["vms"]) for master in masters)}
+
+    @staticmethod
+    def _get_pool():
+        if CtxtProcessMonitor._pool is None:
+            CtxtProcessMonitor._pool = ThreadPoolExecutor(max_workers=Config.CTXT_PROCESS_MONITOR_THREADS,
+                                                          thread_name_prefix="CtxtProcessMonitor")
+        return CtxtProcessMonitor._pool
+
+    @staticmethod
+    def _monitor_loop():
+        """
+        Check the master nodes when their next check time arrives
+        """
+        while True:
+            with CtxtProcessMonitor._cond:
+                while not CtxtProcessMonitor._stop:
+                    now = time.time()
+                    due = [key for key, master in CtxtProcessMonitor._masters.items()
+                           if not master["busy"] and master["next"] <= now]
+                    if due:
+                        break
+                    wait_time = None
+                    pending = [master["next"] for master in CtxtProcessMonitor._masters.values()
+                               if not master["busy"]]
+                    if pending:
+                        wait_time = min(pending) - now
+                    CtxtProcessMonitor._cond.wait(wait_time)
+                if CtxtProcessMonitor._stop:
+                    break
+                for key in due:
+                    CtxtProcessMonitor._masters[key]["busy"] = True
+
+            for key in due:
+                CtxtProcessMonitor._get_pool().submit(CtxtProcessMonitor._check_master, key)
+
+    @staticmethod
+    def _get_running_pids(ssh, pids):
+        """
+        Get the list of processes running in a node from a list of PIDs
+        """
+        CtxtProcessMonitor.logger.info("Getting status of ctxt processes with pids: %s" % ", ".join(pids))
+        command = "for pid in %s; do ps $pid > /dev/null && echo $pid; done; " % " ".join(pids)
+        command += "echo %s" % CtxtProcessMonitor.END_MARK
+        stdout, stderr, _ = ssh.execute(command)
+        lines = stdout.split()
+        if not lines or lines[-1] != CtxtProcessMonitor.END_MARK:
+            raise Exception("Error getting the list of running processes: %s %s" % (stdout, stderr))
+        return lines[:-1]
+
+    @staticmethod
+    def _check_master(key):
+        """
+        Check the contextualization processes of the VMs configured from a master node
+        """
+        try:
+            interval = CtxtProcessMonitor._check_vms(key)
+        except Exception:
+            CtxtProcessMonitor.logger.exception("Error checking the ctxt processes.")
+            interval = Config.CHECK_CTXT_PROCESS_INTERVAL
+
+        with CtxtProcessMonitor._cond:
+            master = CtxtProcessMonitor._masters.get(key)
+            if master:
+                if master["vms"]:
+                    master["busy"] = False
+                    master["interval"] = interval
+                    master["next"] = time.time() + interval
+                else:
+                    del CtxtProcessMonitor._masters[key]
+                CtxtProcessMonitor._cond.notify_all()
+
+    @staticmethod
+    def _check_vms(key):
+        """
+        Check the contextualization processes of the VMs configured from a master node.
+
+        Return: the time to wait for the next check.
+        """
+        # Avoid a circular import
+        from IM.VirtualMachine import VirtualMachine
+
+        with CtxtProcessMonitor._cond:
+            master = CtxtProcessMonitor._masters.get(key)
+            if not master:
+                return Config.CHECK_CTXT_PROCESS_INTERVAL
+            entries = list(master["vms"].values())
+            interval = master["interval"]
+
+        finished = []
+        checking = []
+        for entry in entries:
+            vm = entry["vm"]
+            if vm.destroy:
+                vm.log_debug("VM %s deleted. Stop checking the ctxt process." % vm.im_id)
+                vm.ctxt_pid = None
+                finished.append(entry)
+            elif not vm.ctxt_pid:
+                # The process has been killed
+                finished.append(entry)
+            elif vm.ctxt_pid != VirtualMachine.WAIT_TO_PID:
+                checking.append(entry)
+
+        if checking:
+            ssh = checking[0]["vm"].get_ssh_ansible_master(auto_close=False)
+            try:
+                running = None
+                try:
+                    # Avoid injecting invalid values in the remote command
+                    pids = [str(entry["vm"].ctxt_pid) for entry in checking if str(entry["vm"].ctxt_pid).isdigit()]
+                    if pids:
+                        running = CtxtProcessMonitor._get_running_pids(ssh, pids)
+                    else:
+                        running = []
+                except Exception as ex:
+                    CtxtProcessMonitor.logger.warning("Error getting status of ctxt processes in %s: %s" %
+                                                      (key[0], ex))
+
+                now = time.time()
+                for entry in checking:
+                    vm = entry["vm"]
+                    ctxt_pid = vm.ctxt_pid
+                    if running is None:
+                        vm.ssh_connect_errors += 1
+                        if vm.ssh_connect_errors > Config.MAX_SSH_ERRORS:
+                            vm.log_error("Too much errors getting status of ctxt process with pid: %s. "
+                                         "Forget it." % ctxt_pid)
+                            vm.ssh_connect_errors = 0
+                            vm.configured = False
+                            vm.ctxt_pid = None
+                            vm.cont_out = entry["initial_out"] + ("Too much errors getting the status of ctxt "
+                                                                  "process. Check some network connection problems"
+                                                                  " or if user credentials has been changed.")
+                            finished.append(entry)
+                    elif str(ctxt_pid) not in running:
+                        vm.ssh_connect_errors = 0
+                        vm.log_info("The process %s has finished, get the outputs" % ctxt_pid)
+                        vm.get_ctxt_process_outputs(ssh, entry["initial_out"], entry["log_offset"])
+                        finished.append(entry)
+                    else:
+                        vm.ssh_connect_errors = 0
+                        if (Config.UPDATE_CTXT_LOG_INTERVAL > 0 and
+                                now - entry["last_log"] > Config.UPDATE_CTXT_LOG_INTERVAL):
+                            entry["last_log"] = now
+                            vm.log_info("Get the log of the ctxt process with pid: %s" % ctxt_pid)
+                            entry["log_offset"] = vm.update_ctxt_log(ssh, entry["initial_out"],
+                                                                     entry["log_offset"])
+            finally:
+                if ssh:
+                    ssh.close()
+
+            if running is None:
+                # Back off while the master node is not reachable
+                interval = min(interval * 2, max(Config.CHECK_CTXT_PROCESS_MAX_INTERVAL,
+                                                 Config.CHECK_CTXT_PROCESS_INTERVAL))
+            else:
+                interval = Config.CHECK_CTXT_PROCESS_INTERVAL
+
+        with CtxtProcessMonitor._cond:
+            master = CtxtProcessMonitor._masters.get(key)
+            if master:
+                for entry in finished:
+                    vm_id = id(entry["vm"])
+                    # The VM may have been added again while it was being checked
+                    if master["vms"].get(vm_id) is entry:
+                        del master["vms"][vm_id]
+
+        # Wake up the ConfManagers waiting the processes to finish
+        for entry in finished:
+            entry["vm"].notify_ctxt_event()
+        return interval
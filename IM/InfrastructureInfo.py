@@ -17,6 +17,7 @@
 import logging
 import threading
 import time
+import hashlib
 from uuid import uuid1
 import json
 
@@ -27,6 +28,8 @@ from radl.radl_parse import parse_radl
 from radl.radl_json import radlToSimple
 from IM.openid.JWT import JWT
 from IM.config import Config
+from IM.StateNotifier import StateNotifier
+from IM.ContMsgStore import ContMsgStore
 try:
     from Queue import PriorityQueue
 except ImportError:
@@ -74,6 +77,19 @@ class InfrastructureInfo:
     FAKE_SYSTEM = "F0000__FAKE_SYSTEM__"
     OPENID_USER_PREFIX = "__OPENID__"
 
+    NOT_SERIALIZED_ATTRS = ['cm', 'ctxt_tasks', 'conf_threads', 'adding', 'deleting', 'last_access',
+                            'cloud_connector']
+    """Attributes that are not stored in the DB, so changing them does not modify the Inf."""
+
+    _version = 0
+    """Counter of the modifications of the data of this Inf (not stored in the DB)."""
+
+    _saved_state = None
+    """Tuple (DB URL, version, digest, size, owner keys) of the last data of this Inf stored in the DB."""
+
+    _etag_id = None
+    """Random ID of this Inf object, to distinguish the versions of the data of different loads from the DB."""
+
     def __init__(self):
         self._lock = threading.Lock()
         """Threading Lock to avoid concurrency problems."""
@@ -120,12 +136,97 @@ class InfrastructureInfo:
         self.creation_date = int(time.time())
         """ Creation time of this Inf. """
 
-    def serialize(self):
+    def __setattr__(self, name, value):
+        if (not name.startswith("_") and name not in self.NOT_SERIALIZED_ATTRS and
+                self.__dict__.get(name, self) is not value):
+            self.__dict__[name] = value
+            self._version += 1
+        else:
+            self.__dict__[name] = value
+        lazy_data = self.__dict__.get('_lazy_data')
+        if lazy_data:
+            lazy_data.pop(name, None)
+
+    def __getattr__(self, name):
+        # It is only called if the attribute is not found: parse it if it has not been accessed yet
+        lazy_data = self.__dict__.get('_lazy_data')
+        if lazy_data and name in lazy_data:
+            if name == 'cont_out':
+                # It is stored in the ContMsgStore
+                value = ContMsgStore.load(self, self.__dict__['id'], ContMsgStore.INF_MSG)
+            else:
+                value = self._parse_lazy_data(name, lazy_data[name])
+            value = self.__dict__.setdefault(name, value)
+            lazy_data.pop(name, None)
+            return value
+        raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
+
+    @staticmethod
+    def _parse_lazy_data(name, data):
+        """
+        Parse the data of a lazy attribute loaded from the DB
+        """
+        if name == 'radl':
+            return parse_radl(data)
+        elif name == 'extra_info':
+            extra_info = dict(data)
+            try:
+                extra_info['TOSCA'] = Tosca.deserialize(extra_info['TOSCA'])
+            except Exception:
+                del extra_info['TOSCA']
+                InfrastructureInfo.logger.exception("Error deserializing TOSCA document")
+            return extra_info
+        return data
+
+    def changed(self):
+        """
+        Mark the data of this Inf as modified.
+        It must be called after modifying its data in place (radl, extra_info, snapshots, ...).
+        """
+        self._version += 1
+
+    def get_version(self):
+        """
+        Get the number of modifications of the data of this Inf (or its VMs)
+        since it was created or loaded from the DB
+        """
+        return self._version
+
+    def get_etag(self, *args):
+        """
+        Get a strong entity tag of the current version of the data of this Inf
+        (including the specified args, that select the representation of the data).
+        """
+        etag_id = self.__dict__.setdefault('_etag_id', str(uuid1()))
+        data = "|".join([self.id, etag_id, str(self.get_version())] + [str(arg) for arg in args])
+        return '"%s"' % hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+    def serialize(self, with_cont_msg=True):
+        """
+        Serialize the data of this Inf (and its VMs) in a JSON string.
+        If with_cont_msg is False the contextualization messages are not included (see ContMsgStore).
+        """
         with self._lock:
+            # Copy it before the __dict__ as the lazy attributes are removed after setting them
+            lazy_data = dict(self.__dict__.get('_lazy_data') or {})
             odict = self.__dict__.copy()
         # Quit the ConfManager object and the lock to the data to be stored
         del odict['cm']
         del odict['_lock']
+        if '_lazy_data' in odict:
+            del odict['_lazy_data']
+        if '_version' in odict:
+            del odict['_version']
+        if '_saved_state' in odict:
+            del odict['_saved_state']
+        if '_etag_id' in odict:
+            del odict['_etag_id']
+        if '_contmsg_state' in odict:
+            del odict['_contmsg_state']
+        if with_cont_msg:
+            odict['cont_out'] = self.cont_out
+        else:
+            odict.pop('cont_out', None)
         del odict['ctxt_tasks']
         del odict['conf_threads']
         del odict['adding']
@@ -136,13 +237,18 @@ class InfrastructureInfo:
             odict['vm_master'] = odict['vm_master'].im_id
         vm_list = []
         for vm in odict['vm_list']:
-            vm_list.append(vm.serialize())
+            vm_list.append(vm.serialize(with_cont_msg))
         odict['vm_list'] = vm_list
         if odict['auth']:
             odict['auth'] = odict['auth'].serialize()
-        if odict['radl']:
+        if 'radl' not in odict:
+            # The attributes not parsed yet are stored as they were loaded
+            odict['radl'] = lazy_data['radl']
+        elif odict['radl']:
             odict['radl'] = str(odict['radl'])
-        if odict['extra_info'] and "TOSCA" in odict['extra_info']:
+        if 'extra_info' not in odict:
+            odict['extra_info'] = lazy_data['extra_info']
+        elif odict['extra_info'] and "TOSCA" in odict['extra_info']:
             odict['extra_info'] = {'TOSCA': odict['extra_info']['TOSCA'].serialize()}
         return json.dumps(odict)
 
@@ -157,17 +263,21 @@ class InfrastructureInfo:
         dic['vm_list'] = []
         if dic['auth']:
             dic['auth'] = Authentication.deserialize(dic['auth'])
+        # The RADL and TOSCA data will be parsed on first access
+        lazy_data = {}
         if dic['radl']:
-            dic['radl'] = parse_radl(dic['radl'])
+            lazy_data['radl'] = dic.pop('radl')
         else:
             dic['radl'] = RADL()
         if 'extra_info' in dic and dic['extra_info'] and "TOSCA" in dic['extra_info']:
-            try:
-                dic['extra_info']['TOSCA'] = Tosca.deserialize(dic['extra_info']['TOSCA'])
-            except Exception:
-                del dic['extra_info']['TOSCA']
-                InfrastructureInfo.logger.exception("Error deserializing TOSCA document")
+            lazy_data['extra_info'] = dic.pop('extra_info')
+        if 'cont_out' not in dic:
+            # It will be loaded from the ContMsgStore on first access
+            lazy_data['cont_out'] = None
         newinf.__dict__.update(dic)
+        for name in lazy_data:
+            del newinf.__dict__[name]
+        newinf._lazy_data = lazy_data
         newinf.cloud_connector = None
         # Set the ConfManager object and the lock to the data loaded
         newinf.cm = None
@@ -176,11 +286,14 @@ class InfrastructureInfo:
         for vm_data in vm_list:
             vm = VirtualMachine.deserialize(vm_data)
             vm.inf = newinf
+            if 'cont_out' in vm._lazy_data:
+                vm._lazy_data['cont_out'] = newinf.id
             if vm.im_id == vm_master_id:
                 newinf.vm_master = vm
             newinf.vm_list.append(vm)
         newinf.adding = False
         newinf.deleting = False
+        newinf._version = 0
         return newinf
 
     @staticmethod
@@ -228,6 +341,7 @@ class InfrastructureInfo:
         self.stop()
         self.deleted = True
         self.touch()
+        StateNotifier.notify(self.id, remove=True)
 
     def stop(self):
         """
@@ -285,6 +399,7 @@ class InfrastructureInfo:
             if vm.creation_im_id is None:
                 vm.creation_im_id = vm.im_id
             self.vm_list.append(vm)
+            self._version += 1
         IM.InfrastructureList.InfrastructureList.save_data(self.id)
 
     def add_cont_msg(self, msg):
@@ -296,6 +411,7 @@ class InfrastructureInfo:
         except Exception:
             str_msg = msg
         self.cont_out += str(datetime.now()) + ": " + str_msg + "\n"
+        StateNotifier.notify(self.id)
 
     def remove_creating_vms(self):
         """
@@ -387,6 +503,8 @@ class InfrastructureInfo:
                     else:
                         self.private_networks[private_net] = d.cloud_id
 
+            self._version += 1
+
         # Check the RADL
         try:
             self.radl.check()
@@ -506,11 +624,14 @@ class InfrastructureInfo:
 
     def set_configured(self, conf):
         with self._lock:
+            prev_conf = self.configured
             if conf:
                 if self.configured is None:
                     self.configured = conf
             else:
                 self.configured = conf
+        if self.configured != prev_conf:
+            StateNotifier.notify(self.id)
 
     def is_configured(self):
         if self.vm_in_ctxt_tasks(self) or self.conf_threads:
@@ -540,6 +661,15 @@ class InfrastructureInfo:
             for elem in to_add:
                 self.ctxt_tasks.put(elem)
 
+    def notify_ctxt_event(self):
+        """
+        Wake up the ConfManager of this Inf (if it is running) to check again the state of the
+        contextualization: a ctxt process has finished, a VM has changed its state or IPs, ...
+        """
+        cm = self.cm
+        if cm and cm.is_alive():
+            cm.notify_event()
+
     def get_ctxt_process_names(self):
         return [t.name for t in self.conf_threads if t.is_alive()]
 
@@ -583,9 +713,9 @@ class InfrastructureInfo:
 
         self.configured = None
         all_configure_disabled = True
+        # Assure to update the VM status before running the ctxt process
+        VirtualMachine.update_vms_status(self.get_vm_list(), auth)
         for vm in self.get_vm_list():
-            # Assure to update the VM status before running the ctxt process
-            vm.update_status(auth)
             vm.cont_out = ""
             vm.cloud_connector = None
             vm.configured = None
@@ -677,6 +807,8 @@ class InfrastructureInfo:
         else:
             # update the ConfManager reference to the inf object
             self.cm.inf = self
+            # and wake it up to process the new tasks
+            self.cm.notify_event()
             # update the ConfManager auth
             self.cm.auth = auth
             self.cm.init_time = time.time()
@@ -751,6 +883,63 @@ class InfrastructureInfo:
         else:
             return False
 
+    @staticmethod
+    def get_owner_key(im_auth, stored=True):
+        """
+        Get the key used to index the infrastructures of an IM auth item in the DB.
+        OpenID users are identified by the issuer and subject and the rest by the username
+        (the password is not included in the index, it is checked with is_authorized).
+
+        Args:
+
+        - im_auth(dict): IM auth item.
+        - stored(bool): Flag to specify that the item is the one stored in an infrastructure,
+                        otherwise the OpenID subject is obtained from the token.
+        """
+        if 'token' in im_auth:
+            if stored and im_auth.get('password'):
+                owner = im_auth['password']
+            else:
+                decoded_token = JWT().get_info(im_auth['token'])
+                issuer = str(decoded_token['iss'])
+                if not issuer.endswith('/'):
+                    issuer += '/'
+                owner = issuer + str(decoded_token['sub'])
+            owner = "token:" + owner
+        elif 'username' in im_auth and 'password' in im_auth:
+            owner = "user:%s" % im_auth['username']
+        else:
+            return None
+        return hashlib.sha256(owner.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def get_auth_owner_keys(auth):
+        """
+        Get the list of owner keys of the IM auth items of an Authentication object
+        """
+        res = []
+        for im_auth in auth.getAuthInfo("InfrastructureManager"):
+            try:
+                key = InfrastructureInfo.get_owner_key(im_auth, stored=False)
+            except Exception:
+                InfrastructureInfo.logger.exception("Error getting the owner key of an IM auth item.")
+                key = None
+            if key and key not in res:
+                res.append(key)
+        return res
+
+    def get_owner_keys(self):
+        """
+        Get the list of owner keys of this infrastructure
+        """
+        res = []
+        if self.auth is not None:
+            for im_auth in self.auth.getAuthInfo("InfrastructureManager"):
+                key = InfrastructureInfo.get_owner_key(im_auth)
+                if key and key not in res:
+                    res.append(key)
+        return res
+
     def touch(self):
         """
         Set last access of the Inf
@@ -813,3 +1002,4 @@ class InfrastructureInfo:
                     self.auth = Authentication(im_auth)
                 else:
                     self.auth.auth_list.extend(im_auth)
+                    self.changed()
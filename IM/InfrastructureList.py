@@ -17,11 +17,15 @@
 
 import sys
 import time
+import hashlib
 import logging
 import threading
+from collections import OrderedDict
 
-from IM.db import DataBase
+from IM.db import DataBase, DataBasePool
 from IM.config import Config
+from IM.ContMsgStore import ContMsgStore
+from IM.StateNotifier import StateNotifier
 import IM.InfrastructureInfo
 
 
@@ -30,14 +34,48 @@ class InfrastructureList():
     Class to manage the list of infrastructures and the serialization of the data
     """
 
-    infrastructure_list = {}
-    """Map from string to :py:class:`InfrastructureInfo`."""
+    infrastructure_list = OrderedDict()
+    """Map from string to :py:class:`InfrastructureInfo`, sorted from the least to the most recently used."""
 
     logger = logging.getLogger('InfrastructureManager')
     """Logger object."""
 
     _lock = threading.Lock()
-    """Threading Lock to avoid concurrency problems."""
+    """Threading Lock to modify the map of infrastructures (the readers only get copies of it)."""
+
+    SAVE_LOCK_STRIPES = 64
+    """Number of locks used to store the infrastructures in the DB."""
+
+    _save_locks = [threading.Lock() for _ in range(SAVE_LOCK_STRIPES)]
+    """Threading Locks to avoid concurrent saves of the same Inf. Each Inf ID is mapped to one of them."""
+
+    _owners_index = {}
+    """Map from DB URL to a flag that specifies if the DB has the index of infrastructure owners."""
+
+    _pending_saves = {}
+    """Map from inf ID to :py:class:`InfrastructureInfo` pending to be saved (write-behind mode)."""
+
+    _pending_cond = threading.Condition()
+    """Condition to notify the flusher thread about pending saves."""
+
+    _flusher = None
+    """Thread that saves the pending infrastructures (write-behind mode)."""
+
+    _flusher_stop = False
+    """Flag to stop the flusher thread."""
+
+    _save_stats = {"queue_depth": 0, "flushes": 0, "saved_infs": 0,
+                   "last_flush_time": 0.0, "max_flush_time": 0.0, "total_flush_time": 0.0}
+    """Metrics of the write-behind saves."""
+
+    _loading = {}
+    """Map from inf ID to the Event set when the Inf being loaded from the DB is available."""
+
+    _loading_lock = threading.Lock()
+    """Threading Lock to access the _loading map."""
+
+    _cache_stats = {"hits": 0, "misses": 0, "loads": 0, "evictions": 0}
+    """Metrics of the cache of infrastructures."""
 
     @staticmethod
     def add_infrastructure(inf):
@@ -48,6 +86,7 @@ class InfrastructureList():
                 raise Exception("Trying to add an existing infrastructure ID.")
             else:
                 InfrastructureList.infrastructure_list[inf.id] = inf
+                InfrastructureList._evict()
 
     @staticmethod
     def remove_inf(del_inf):
@@ -60,34 +99,105 @@ class InfrastructureList():
     @staticmethod
     def get_inf_ids(auth=None):
         """ Get the IDs of the Infrastructures """
-        if auth:
-            # In this case only loads the auth data to improve performance
-            inf_ids = []
-            for inf_id in InfrastructureList._get_inf_ids_from_db():
-                res = InfrastructureList._get_data_from_db(Config.DATA_DB, inf_id, auth)
-                if res:
-                    inf = res[inf_id]
-                    if inf and inf.is_authorized(auth):
-                        inf_ids.append(inf.id)
-            return inf_ids
+        # Store the pending infrastructures to get the updated list from the DB
+        InfrastructureList.flush_pending_saves()
+        if auth and InfrastructureList._has_owners_index(Config.DATA_DB):
+            owners = IM.InfrastructureInfo.InfrastructureInfo.get_auth_owner_keys(auth)
+            if InfrastructureList._is_admin(auth, owners):
+                # The admin user can access all the infrastructures
+                return InfrastructureList._get_inf_ids_from_db()
+            if not owners:
+                return []
+            # The index returns the Infs owned by any of the keys, but all the IM auth items
+            # of the user must match the owner, so check the authorization of the candidates
+            return InfrastructureList._filter_authorized(InfrastructureList._get_inf_ids_from_db(owners), auth)
+        elif auth:
+            return InfrastructureList._filter_authorized(InfrastructureList._get_inf_ids_from_db(), auth)
         else:
             return InfrastructureList._get_inf_ids_from_db()
 
+    @staticmethod
+    def _is_admin(auth, owners):
+        """ Check if the auth data has the credentials of the ADMIN_USER """
+        if not Config.ADMIN_USER:
+            return False
+        admin_auth = dict(Config.ADMIN_USER)
+        admin_auth["type"] = "InfrastructureManager"
+        if IM.InfrastructureInfo.InfrastructureInfo.get_owner_key(admin_auth) not in owners:
+            return False
+        if 'token' in admin_auth:
+            # The key of the OpenID users is obtained from the token subject
+            return True
+        # The owner keys of the users only include the username
+        return any(im_auth.get('username') == admin_auth.get('username') and
+                   im_auth.get('password') == admin_auth.get('password') and 'token' not in im_auth
+                   for im_auth in auth.getAuthInfo("InfrastructureManager"))
+
+    @staticmethod
+    def _filter_authorized(inf_ids, auth):
+        """ Get the IDs of the Infrastructures of the list that the auth data is authorized to access """
+        res = []
+        for inf_id in inf_ids:
+            inf = InfrastructureList.infrastructure_list.get(inf_id)
+            if not inf:
+                # In this case only loads the auth data to improve performance
+                inf = InfrastructureList._get_data_from_db(Config.DATA_DB, inf_id, auth).get(inf_id)
+            if inf and inf.is_authorized(auth):
+                res.append(inf_id)
+        return res
+
     @staticmethod
     def get_infrastructure(inf_id):
         """ Get the infrastructure object """
-        if inf_id in InfrastructureList.infrastructure_list:
-            inf = InfrastructureList.infrastructure_list[inf_id]
+        inf = InfrastructureList.infrastructure_list.get(inf_id)
+        if inf:
             if not inf.has_expired():
+                with InfrastructureList._lock:
+                    InfrastructureList._cache_stats["hits"] += 1
+                    if inf_id in InfrastructureList.infrastructure_list:
+                        InfrastructureList.infrastructure_list.move_to_end(inf_id)
                 inf.touch()
                 return inf
+            elif inf_id in InfrastructureList._pending_saves:
+                # Do not lose the changes not stored yet
+                InfrastructureList.flush_pending_saves()
+        with InfrastructureList._lock:
+            InfrastructureList._cache_stats["misses"] += 1
+
+        # Only one thread loads the Inf from the DB, the rest wait for it
+        with InfrastructureList._loading_lock:
+            loaded = InfrastructureList._loading.get(inf_id)
+            if loaded is None:
+                InfrastructureList._loading[inf_id] = threading.Event()
+        if loaded is not None:
+            loaded.wait()
+            inf = InfrastructureList.infrastructure_list.get(inf_id)
+            if inf:
+                with InfrastructureList._lock:
+                    if inf_id in InfrastructureList.infrastructure_list:
+                        InfrastructureList.infrastructure_list.move_to_end(inf_id)
+                inf.touch()
+            return inf
+
+        try:
+            return InfrastructureList._load_infrastructure(inf_id)
+        finally:
+            with InfrastructureList._loading_lock:
+                InfrastructureList._loading.pop(inf_id).set()
 
+    @staticmethod
+    def _load_infrastructure(inf_id):
+        """ Load the infrastructure from the DB and add it to the cache """
         if inf_id in InfrastructureList.get_inf_ids():
             # Load the data from DB:
             res = InfrastructureList._get_data_from_db(Config.DATA_DB, inf_id)
             if res:
                 inf = res[inf_id]
-                InfrastructureList.infrastructure_list[inf_id] = inf
+                with InfrastructureList._lock:
+                    InfrastructureList._cache_stats["loads"] += 1
+                    InfrastructureList.infrastructure_list[inf_id] = inf
+                    InfrastructureList.infrastructure_list.move_to_end(inf_id)
+                    InfrastructureList._evict()
                 return inf
             else:
                 return None
@@ -95,26 +205,143 @@ class InfrastructureList():
             InfrastructureList.logger.warning("%s not in list of Inf IDs." % inf_id)
             return None
 
+    @staticmethod
+    def _get_data_size(inf):
+        """ Get the estimated size of the data of an Inf (the size of the last data stored in the DB) """
+        if inf._saved_state:
+            return inf._saved_state[3]
+        return 0
+
+    @staticmethod
+    def _can_evict(inf):
+        """ Check if an Inf can be removed from the cache without losing information """
+        if inf.id in InfrastructureList._pending_saves:
+            return False
+        if not inf._saved_state or inf._saved_state[1] != inf.get_version():
+            # It has changes not stored in the DB
+            return False
+        if inf.adding or inf.deleting:
+            return False
+        # Do not evict Infs being contextualized
+        if (inf.cm and inf.cm.is_alive()) or inf.get_ctxt_process_names() or not inf.ctxt_tasks.empty():
+            return False
+        return True
+
+    @staticmethod
+    def _evict():
+        """
+        Remove from the cache the expired Infs and the least recently used ones
+        if it exceeds INF_CACHE_MAX_SIZE or INF_CACHE_MAX_BYTES.
+        It must be called with the _lock acquired.
+        """
+        max_size = Config.INF_CACHE_MAX_SIZE
+        max_bytes = Config.INF_CACHE_MAX_BYTES
+        if not max_size and not max_bytes and not Config.INF_CACHE_TIME:
+            return
+
+        # The map is sorted from the least to the most recently used Inf
+        infs = list(InfrastructureList.infrastructure_list.values())
+        size = len(infs)
+        total_bytes = 0
+        if max_bytes:
+            total_bytes = sum(InfrastructureList._get_data_size(inf) for inf in infs)
+
+        # Never evict the most recently used one
+        for inf in infs[:-1]:
+            over_limit = (max_size and size > max_size) or (max_bytes and total_bytes > max_bytes)
+            if not over_limit and not (Config.INF_CACHE_TIME and inf.has_expired()):
+                # The rest of Infs have been used more recently
+                break
+            if InfrastructureList._can_evict(inf):
+                del InfrastructureList.infrastructure_list[inf.id]
+                size -= 1
+                total_bytes -= InfrastructureList._get_data_size(inf)
+                InfrastructureList._cache_stats["evictions"] += 1
+                StateNotifier.discard(inf.id)
+                InfrastructureList.logger.debug("Inf ID %s removed from the cache." % inf.id)
+
+    @staticmethod
+    def get_cache_stats():
+        """
+        Get the metrics of the cache of infrastructures:
+        size, bytes, hits, misses, loads and evictions
+        """
+        with InfrastructureList._lock:
+            res = dict(InfrastructureList._cache_stats)
+            infs = list(InfrastructureList.infrastructure_list.values())
+        res["size"] = len(infs)
+        res["bytes"] = sum(InfrastructureList._get_data_size(inf) for inf in infs)
+        return res
+
     @staticmethod
     def stop():
         """ Stop securely the IM service """
-        # Acquire the lock to avoid writing data to the DATA_FILE
+        # Store the pending data
+        InfrastructureList._stop_flusher()
+        # Stop all the Ctxt threads of the Infrastructures
         with InfrastructureList._lock:
-            # Stop all the Ctxt threads of the Infrastructures
-            for inf in InfrastructureList.infrastructure_list.values():
-                inf.stop()
+            infs = list(InfrastructureList.infrastructure_list.values())
+        for inf in infs:
+            inf.stop()
+        # Acquire the locks to avoid writing data to the DB
+        save_locks = InfrastructureList._get_save_locks()
+        InfrastructureList._acquire_locks(save_locks)
+        try:
+            # Close the DB connections
+            DataBasePool.close_pools()
+        finally:
+            InfrastructureList._release_locks(save_locks)
 
     @staticmethod
     def load_data():
         """ Load Data from DB """
-        with InfrastructureList._lock:
-            try:
-                inf_list = InfrastructureList._get_data_from_db(Config.DATA_DB)
-                InfrastructureList.infrastructure_list = inf_list
-            except Exception as ex:
-                InfrastructureList.logger.exception("ERROR loading data. Correct or delete it!!")
-                sys.stderr.write("ERROR loading data: " + str(ex) + ".\nCorrect or delete it!! ")
-                sys.exit(-1)
+        try:
+            inf_list = InfrastructureList._get_data_from_db(Config.DATA_DB)
+            with InfrastructureList._lock:
+                InfrastructureList.infrastructure_list = OrderedDict(
+                    sorted(inf_list.items(), key=lambda item: item[1].last_access))
+                InfrastructureList._evict()
+        except Exception as ex:
+            InfrastructureList.logger.exception("ERROR loading data. Correct or delete it!!")
+            sys.stderr.write("ERROR loading data: " + str(ex) + ".\nCorrect or delete it!! ")
+            sys.exit(-1)
+
+    @staticmethod
+    def _get_save_locks(inf_ids=None):
+        """
+        Get the locks used to save the specified infrastructures (all of them if inf_ids is None),
+        sorted to always acquire them in the same order.
+        """
+        if inf_ids is None:
+            return list(InfrastructureList._save_locks)
+        stripes = set(hash(inf_id) % len(InfrastructureList._save_locks) for inf_id in inf_ids)
+        return [InfrastructureList._save_locks[stripe] for stripe in sorted(stripes)]
+
+    @staticmethod
+    def _acquire_locks(locks):
+        for lock in locks:
+            lock.acquire()
+
+    @staticmethod
+    def _release_locks(locks):
+        for lock in reversed(locks):
+            lock.release()
+
+    @staticmethod
+    def _save_infs(infs):
+        """
+        Save a set of infrastructures in the DB, only blocking other saves of the same infrastructures.
+
+        Args:
+
+        - infs(dict): Map from inf ID to :py:class:`InfrastructureInfo` to save.
+        """
+        save_locks = InfrastructureList._get_save_locks(infs.keys())
+        InfrastructureList._acquire_locks(save_locks)
+        try:
+            return InfrastructureList._save_data_to_db(Config.DATA_DB, infs)
+        finally:
+            InfrastructureList._release_locks(save_locks)
 
     @staticmethod
     def save_data(inf_id=None):
@@ -125,31 +352,171 @@ class InfrastructureList():
 
         - inf_id(str): ID of the infrastructure to save. If None all will be saved.
         """
-        with InfrastructureList._lock:
-            try:
-                res = InfrastructureList._save_data_to_db(Config.DATA_DB,
-                                                          InfrastructureList.infrastructure_list,
-                                                          inf_id)
-                if not res:
-                    InfrastructureList.logger.error("ERROR saving data.\nChanges not stored!!")
-                    sys.stderr.write("ERROR saving data.\nChanges not stored!!")
-            except Exception as ex:
-                InfrastructureList.logger.exception("ERROR saving data. Changes not stored!!")
-                sys.stderr.write("ERROR saving data: " + str(ex) + ".\nChanges not stored!!")
+        if Config.DB_SAVE_DELAY > 0:
+            InfrastructureList._add_pending_save(inf_id)
+            return
+
+        try:
+            if inf_id:
+                infs = {inf_id: InfrastructureList.infrastructure_list[inf_id]}
+            else:
+                with InfrastructureList._lock:
+                    infs = dict(InfrastructureList.infrastructure_list)
+            res = InfrastructureList._save_infs(infs)
+            if not res:
+                InfrastructureList.logger.error("ERROR saving data.\nChanges not stored!!")
+                sys.stderr.write("ERROR saving data.\nChanges not stored!!")
+        except Exception as ex:
+            InfrastructureList.logger.exception("ERROR saving data. Changes not stored!!")
+            sys.stderr.write("ERROR saving data: " + str(ex) + ".\nChanges not stored!!")
+
+    @staticmethod
+    def _add_pending_save(inf_id=None):
+        """
+        Add an infrastructure to the list of pending saves (write-behind mode)
+        """
+        if inf_id:
+            if inf_id not in InfrastructureList.infrastructure_list:
+                InfrastructureList.logger.error("ERROR saving data: Inf ID %s not found. Changes not stored!!" % inf_id)
+                return
+            infs = {inf_id: InfrastructureList.infrastructure_list[inf_id]}
+        else:
+            with InfrastructureList._lock:
+                infs = dict(InfrastructureList.infrastructure_list)
+
+        with InfrastructureList._pending_cond:
+            was_empty = not InfrastructureList._pending_saves
+            InfrastructureList._pending_saves.update(infs)
+            InfrastructureList._save_stats["queue_depth"] = len(InfrastructureList._pending_saves)
+            if InfrastructureList._flusher is None or not InfrastructureList._flusher.is_alive():
+                InfrastructureList._flusher_stop = False
+                InfrastructureList._flusher = threading.Thread(target=InfrastructureList._flusher_loop,
+                                                               name="InfrastructureList-flusher")
+                InfrastructureList._flusher.daemon = True
+                InfrastructureList._flusher.start()
+            if was_empty or len(InfrastructureList._pending_saves) >= Config.DB_SAVE_MAX_PENDING:
+                InfrastructureList._pending_cond.notify_all()
+
+    @staticmethod
+    def _flusher_loop():
+        """
+        Save the pending infrastructures at most DB_SAVE_DELAY secs after they are added
+        """
+        while True:
+            with InfrastructureList._pending_cond:
+                while not InfrastructureList._pending_saves and not InfrastructureList._flusher_stop:
+                    InfrastructureList._pending_cond.wait()
+                if (not InfrastructureList._flusher_stop and
+                        len(InfrastructureList._pending_saves) < Config.DB_SAVE_MAX_PENDING):
+                    # Wait to group the saves of the following requests
+                    InfrastructureList._pending_cond.wait(Config.DB_SAVE_DELAY)
+                stop = InfrastructureList._flusher_stop
+            InfrastructureList.flush_pending_saves()
+            if stop:
+                break
+
+    @staticmethod
+    def _stop_flusher():
+        """
+        Stop the flusher thread and save the pending infrastructures
+        """
+        with InfrastructureList._pending_cond:
+            flusher = InfrastructureList._flusher
+            InfrastructureList._flusher_stop = True
+            InfrastructureList._pending_cond.notify_all()
+        if flusher and flusher is not threading.current_thread():
+            flusher.join(Config.DB_POOL_TIMEOUT)
+        InfrastructureList._flusher = None
+        InfrastructureList.flush_pending_saves()
+
+    @staticmethod
+    def _is_saved(inf, db_url):
+        """
+        Check if the current version of an Inf is stored in the DB
+        """
+        saved_state = inf._saved_state
+        return saved_state is not None and saved_state[0] == db_url and saved_state[1] == inf.get_version()
+
+    @staticmethod
+    def flush_pending_saves():
+        """
+        Save the pending infrastructures in the DB (write-behind mode)
+        """
+        with InfrastructureList._pending_cond:
+            infs = InfrastructureList._pending_saves
+            InfrastructureList._pending_saves = {}
+            InfrastructureList._save_stats["queue_depth"] = 0
+        if not infs:
+            return
+
+        init = time.time()
+        failed = {}
+        try:
+            res = InfrastructureList._save_infs(infs)
+            if not res:
+                InfrastructureList.logger.error("ERROR saving data.\nChanges not stored!!")
+                failed = dict((inf_id, inf) for inf_id, inf in infs.items()
+                              if not InfrastructureList._is_saved(inf, Config.DATA_DB))
+        except Exception:
+            InfrastructureList.logger.exception("ERROR saving data. Changes not stored!!")
+            failed = infs
+        elapsed = time.time() - init
+
+        with InfrastructureList._pending_cond:
+            if failed:
+                # Queue them again to retry in the next flush (without replacing newer entries)
+                for inf_id, inf in failed.items():
+                    InfrastructureList._pending_saves.setdefault(inf_id, inf)
+                InfrastructureList._save_stats["queue_depth"] = len(InfrastructureList._pending_saves)
+            stats = InfrastructureList._save_stats
+            stats["flushes"] += 1
+            stats["saved_infs"] += len(infs)
+            stats["last_flush_time"] = elapsed
+            stats["max_flush_time"] = max(stats["max_flush_time"], elapsed)
+            stats["total_flush_time"] += elapsed
+        InfrastructureList.logger.debug("%d Infs saved in %.3f secs (write-behind)." % (len(infs), elapsed))
+
+    @staticmethod
+    def get_save_stats():
+        """
+        Get the metrics of the write-behind saves:
+        queue_depth, flushes, saved_infs, last_flush_time, max_flush_time and total_flush_time
+        """
+        with InfrastructureList._pending_cond:
+            return dict(InfrastructureList._save_stats)
 
     @staticmethod
     def init_table():
         """ Creates de database """
-        db = DataBase(Config.DATA_DB)
+        db = DataBase(Config.DATA_DB, pooled=True)
         if db.connect():
-            if not db.table_exists("inf_list"):
-                InfrastructureList.logger.debug("Creating the IM database!.")
-                if db.db_type == DataBase.MYSQL:
-                    db.execute("CREATE TABLE inf_list(rowid INTEGER NOT NULL AUTO_INCREMENT UNIQUE,"
-                               " id VARCHAR(255) PRIMARY KEY, deleted INTEGER, date TIMESTAMP, data LONGBLOB)")
-                elif db.db_type == DataBase.SQLITE:
-                    db.execute("CREATE TABLE inf_list(id VARCHAR(255) PRIMARY KEY, deleted INTEGER,"
-                               " date TIMESTAMP, data LONGBLOB)")
+            try:
+                if not db.table_exists("inf_list"):
+                    InfrastructureList.logger.debug("Creating the IM database!.")
+                    if db.db_type == DataBase.MYSQL:
+                        db.execute("CREATE TABLE inf_list(rowid INTEGER NOT NULL AUTO_INCREMENT UNIQUE,"
+                                   " id VARCHAR(255) PRIMARY KEY, deleted INTEGER, date TIMESTAMP, data LONGBLOB)")
+                        db.execute("CREATE TABLE inf_owners(id VARCHAR(255), owner VARCHAR(64),"
+                                   " PRIMARY KEY (id, owner), INDEX owner_idx (owner))")
+                    elif db.db_type == DataBase.SQLITE:
+                        db.execute("CREATE TABLE inf_list(id VARCHAR(255) PRIMARY KEY, deleted INTEGER,"
+                                   " date TIMESTAMP, data LONGBLOB)")
+                        db.execute("CREATE TABLE inf_owners(id VARCHAR(255), owner VARCHAR(64),"
+                                   " PRIMARY KEY (id, owner))")
+                        db.execute("CREATE INDEX owner_idx ON inf_owners(owner)")
+                    elif db.db_type == DataBase.MONGO:
+                        db.create_index("inf_list", "owners")
+                if db.db_url not in InfrastructureList._owners_index:
+                    if db.db_type == DataBase.MONGO:
+                        has_index = db.index_exists("inf_list", "owners")
+                    else:
+                        has_index = db.table_exists("inf_owners")
+                    if not has_index:
+                        InfrastructureList.logger.warning("The IM DB has not the index of infrastructure owners. "
+                                                          "Listing infrastructures will be slow. Use the "
+                                                          "scripts/db_1_14_0_to_1_15_0.py script to create it.")
+                    InfrastructureList._owners_index[db.db_url] = has_index
+            finally:
                 db.close()
             return True
         else:
@@ -157,6 +524,13 @@ class InfrastructureList():
 
         return False
 
+    @staticmethod
+    def _has_owners_index(db_url):
+        """ Check if the DB has the index of infrastructure owners """
+        if db_url not in InfrastructureList._owners_index:
+            InfrastructureList.init_table()
+        return InfrastructureList._owners_index.get(db_url, False)
+
     @staticmethod
     def _get_data_from_db(db_url, inf_id=None, auth=None):
         """
@@ -165,19 +539,22 @@ class InfrastructureList():
         If auth is specified only auth data will be loaded.
         """
         if InfrastructureList.init_table():
-            db = DataBase(db_url)
+            db = DataBase(db_url, pooled=True)
             if db.connect():
-                inf_list = {}
-                if inf_id:
-                    if db.db_type == DataBase.MONGO:
-                        res = db.find("inf_list", {"id": inf_id}, {"data": True})
-                    else:
-                        res = db.select("select data from inf_list where id = %s", (inf_id,))
-                else:
-                    if db.db_type == DataBase.MONGO:
-                        res = db.find("inf_list", {"deleted": 0}, {"data": True}, [('_id', -1)])
+                try:
+                    inf_list = {}
+                    if inf_id:
+                        if db.db_type == DataBase.MONGO:
+                            res = db.find("inf_list", {"id": inf_id}, {"data": True})
+                        else:
+                            res = db.select("select data from inf_list where id = %s", (inf_id,))
                     else:
-                        res = db.select("select data from inf_list where deleted = 0 order by rowid desc")
+                        if db.db_type == DataBase.MONGO:
+                            res = db.find("inf_list", {"deleted": 0}, {"data": True}, [('_id', -1)])
+                        else:
+                            res = db.select("select data from inf_list where deleted = 0 order by rowid desc")
+                finally:
+                    db.close()
                 if len(res) > 0:
                     for elem in res:
                         if db.db_type == DataBase.MONGO:
@@ -189,6 +566,8 @@ class InfrastructureList():
                                 inf = IM.InfrastructureInfo.InfrastructureInfo.deserialize_auth(data)
                             else:
                                 inf = IM.InfrastructureInfo.InfrastructureInfo.deserialize(data)
+                                # The data is the same stored in the DB, it is not needed to save it again
+                                inf._saved_state = (db_url, inf.get_version(), None, len(data), None)
                             inf_list[inf.id] = inf
                         except Exception:
                             InfrastructureList.logger.exception(
@@ -199,7 +578,6 @@ class InfrastructureList():
                         msg = " for inf ID: %s" % inf_id
                     InfrastructureList.logger.warn("No data in database%s!." % msg)
 
-                db.close()
                 return inf_list
             else:
                 InfrastructureList.logger.error("ERROR connecting with the database!.")
@@ -210,44 +588,109 @@ class InfrastructureList():
 
     @staticmethod
     def _save_data_to_db(db_url, inf_list, inf_id=None):
-        db = DataBase(db_url)
+        db = DataBase(db_url, pooled=True)
         if db.connect():
-            infs_to_save = inf_list
-            if inf_id:
-                infs_to_save = {inf_id: inf_list[inf_id]}
+            try:
+                infs_to_save = inf_list
+                if inf_id:
+                    infs_to_save = {inf_id: inf_list[inf_id]}
 
-            for inf in infs_to_save.values():
-                data = inf.serialize()
-                if db.db_type == DataBase.MONGO:
-                    res = db.replace("inf_list", {"id": inf.id}, {"id": inf.id, "deleted": int(inf.deleted),
-                                                                  "data": data, "date": time.time()})
-                else:
-                    res = db.execute("replace into inf_list (id, deleted, data, date) values (%s, %s, %s, now())",
-                                     (inf.id, int(inf.deleted), data))
+                res = True
+                contmsg_res = True
+                to_save = []
+                for inf in infs_to_save.values():
+                    version = inf.get_version()
+                    saved_state = inf._saved_state
+                    if InfrastructureList._is_saved(inf, db_url):
+                        # The Inf has not been modified since the last time it was saved
+                        continue
+                    if Config.CONTMSG_STORE:
+                        # Only the new parts of the messages are stored in a separate table
+                        try:
+                            stored = ContMsgStore.save(db, inf)
+                        except Exception:
+                            InfrastructureList.logger.exception("Inf ID: %s: Error storing the contextualization"
+                                                                " messages." % inf.id)
+                            stored = False
+                        if not stored:
+                            # Do not mark the Inf as saved to store it again in the next save
+                            contmsg_res = False
+                            continue
+                    data = inf.serialize(not Config.CONTMSG_STORE)
+                    digest = hashlib.sha1(data.encode()).hexdigest()
+                    if saved_state and saved_state[0] == db_url and saved_state[2] == digest:
+                        # The Inf has been modified but the data is the same stored in the DB
+                        inf._saved_state = (db_url, version, digest, len(data), saved_state[4])
+                        continue
+                    saved_owners = saved_state[4] if saved_state and saved_state[0] == db_url else None
+                    to_save.append((inf, version, digest, data, inf.get_owner_keys(), saved_owners))
 
-            db.close()
-            return res
+                if db.db_type == DataBase.MONGO:
+                    for inf, version, digest, data, owners, _ in to_save:
+                        res = db.replace("inf_list", {"id": inf.id}, {"id": inf.id, "deleted": int(inf.deleted),
+                                                                      "data": data, "date": time.time(),
+                                                                      "owners": owners})
+                        if res:
+                            inf._saved_state = (db_url, version, digest, len(data), owners)
+                elif to_save:
+                    # Store all the Infs and their owners in one transaction
+                    sentences = [("replace into inf_list (id, deleted, data, date) values (%s, %s, %s, now())",
+                                  [(inf.id, int(inf.deleted), data) for inf, _, _, data, _, _ in to_save])]
+                    if InfrastructureList._owners_index.get(db_url):
+                        new_owners = [(inf.id, owners) for inf, _, _, _, owners, saved_owners in to_save
+                                      if saved_owners != owners]
+                        sentences.append(("delete from inf_owners where id = %s",
+                                          [(inf_id,) for inf_id, _ in new_owners]))
+                        sentences.append(("replace into inf_owners (id, owner) values (%s, %s)",
+                                          [(inf_id, owner) for inf_id, owners in new_owners for owner in owners]))
+                    res = db.executemany_transaction(sentences)
+                    if res:
+                        for inf, version, digest, data, owners, _ in to_save:
+                            if not InfrastructureList._owners_index.get(db_url):
+                                owners = None
+                            inf._saved_state = (db_url, version, digest, len(data), owners)
+            finally:
+                db.close()
+            return res and contmsg_res
         else:
             InfrastructureList.logger.error("ERROR connecting with the database!.")
             return None
 
     @staticmethod
-    def _get_inf_ids_from_db():
+    def _get_inf_ids_from_db(owners=None):
+        """
+        Get the IDs of the non deleted infrastructures.
+        If owners is specified only the ones owned by any of the owner keys are returned.
+        """
         try:
-            db = DataBase(Config.DATA_DB)
+            db = DataBase(Config.DATA_DB, pooled=True)
             if db.connect():
                 inf_list = []
-                if db.db_type == DataBase.MONGO:
-                    res = db.find("inf_list", {"deleted": 0}, {"id": True}, [('id', -1)])
-                else:
-                    res = db.select("select id from inf_list where deleted = 0 order by rowid desc")
+                added = set()
+                try:
+                    if db.db_type == DataBase.MONGO:
+                        filt = {"deleted": 0}
+                        if owners:
+                            filt["owners"] = {"$in": owners}
+                        res = db.find("inf_list", filt, {"id": True}, [('id', -1)])
+                    elif owners:
+                        res = db.select("select l.id from inf_list l, inf_owners o where l.id = o.id and"
+                                        " l.deleted = 0 and o.owner in (%s) order by l.rowid desc" %
+                                        ", ".join(["%s"] * len(owners)), owners)
+                    else:
+                        res = db.select("select id from inf_list where deleted = 0 order by rowid desc")
+                finally:
+                    db.close()
                 for elem in res:
                     if db.db_type == DataBase.MONGO:
-                        inf_list.append(elem['id'])
+                        inf_id = elem['id']
                     else:
-                        inf_list.append(elem[0])
+                        inf_id = elem[0]
+                    # An infrastructure may appear more than once if it has several owners
+                    if inf_id not in added:
+                        added.add(inf_id)
+                        inf_list.append(inf_id)
 
-                db.close()
                 return inf_list
             else:
                 InfrastructureList.logger.error("ERROR connecting with the database!.")
@@ -259,12 +702,20 @@ class InfrastructureList():
     @staticmethod
     def _reinit():
         """Restart the class attributes to initial values."""
-        InfrastructureList.infrastructure_list = {}
+        InfrastructureList.infrastructure_list = OrderedDict()
         InfrastructureList._lock = threading.Lock()
-        db = DataBase(Config.DATA_DB)
+        InfrastructureList._save_locks = [threading.Lock() for _ in range(InfrastructureList.SAVE_LOCK_STRIPES)]
+        InfrastructureList._pending_saves = {}
+        InfrastructureList._cache_stats = {"hits": 0, "misses": 0, "loads": 0, "evictions": 0}
+        db = DataBase(Config.DATA_DB, pooled=True)
         if db.connect():
-            if db.db_type == DataBase.MONGO:
-                db.delete("inf_list", {})
-            else:
-                db.execute("delete from inf_list")
-            db.close()
+            try:
+                if db.db_type == DataBase.MONGO:
+                    db.delete("inf_list", {})
+                else:
+                    db.execute("delete from inf_list")
+                    if db.table_exists("inf_owners"):
+                        db.execute("delete from inf_owners")
+                ContMsgStore.delete_all(db)
+            finally:
+                db.close()
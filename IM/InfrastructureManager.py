@@ -22,6 +22,11 @@ import string
 import random
 import logging
 import threading
+import hashlib
+import time
+import copy
+
+from collections import OrderedDict
 
 import IM.InfrastructureInfo
 import IM.InfrastructureList
@@ -34,6 +39,8 @@ from IM.auth import Authentication
 from IM.recipe import Recipe
 from IM.config import Config
 from IM.VirtualMachine import VirtualMachine
+from IM.VMStatePoller import VMStatePoller
+from IM.CtxtProcessMonitor import CtxtProcessMonitor
 
 from radl import radl_parse
 from radl.radl import Feature, RADL, system
@@ -80,9 +87,11 @@ class DeletedInfrastructureException(Exception):
 class InvaliddUserException(Exception):
     """ Invalid InfrastructureManager credentials """
 
-    def __init__(self, msg="Invalid InfrastructureManager credentials"):
+    def __init__(self, msg="Invalid InfrastructureManager credentials", permanent=False):
         Exception.__init__(self, msg)
         self.message = msg
+        # The credentials will always be rejected (e.g. an expired token)
+        self.permanent = permanent
 
 
 class DisabledFunctionException(Exception):
@@ -101,10 +110,29 @@ class InfrastructureManager:
     logger = logging.getLogger('InfrastructureManager')
     """Logger object."""
 
+    _oidc_cache = OrderedDict()
+    """Map from the hash of an OIDC token to the validation result: (expiration time, username, password, error)."""
+
+    _auth_cache = OrderedDict()
+    """Map from the digest of the raw auth data to the validated credentials: (expiration time, auth list)."""
+
+    _vault_cache = OrderedDict()
+    """Map from the hash of the Vault settings and token to the credentials obtained: (expiration time, creds)."""
+
+    _appdb_cache = OrderedDict()
+    """Map from the AppDB queries used to generate the credentials to the results: (expiration time, result)."""
+
+    _cache_lock = threading.Lock()
+    """Threading Lock to access the OIDC token and credentials caches."""
+
     @staticmethod
     def _reinit():
         """Restart the class attributes to initial values."""
         IM.InfrastructureList.InfrastructureList._reinit()
+        InfrastructureManager._oidc_cache = OrderedDict()
+        InfrastructureManager._auth_cache = OrderedDict()
+        InfrastructureManager._vault_cache = OrderedDict()
+        InfrastructureManager._appdb_cache = OrderedDict()
 
     @staticmethod
     def _compute_deploy_groups(radl):
@@ -228,13 +256,18 @@ class InfrastructureManager:
     def get_infrastructure(inf_id, auth):
         """Return infrastructure info with some id if valid authorization provided."""
 
-        if inf_id not in IM.InfrastructureList.InfrastructureList.get_inf_ids():
-            InfrastructureManager.logger.error("Error, incorrect Inf ID: %s" % inf_id)
-            raise IncorrectInfrastructureException()
-        sel_inf = IM.InfrastructureList.InfrastructureList.get_infrastructure(inf_id)
-        if not sel_inf:
-            InfrastructureManager.logger.error("Error loading Inf ID: %s" % inf_id)
-            raise IncorrectInfrastructureException("Error loading Inf ID data.")
+        sel_inf = getattr(auth, "authorized_inf", None)
+        if sel_inf is not None and sel_inf.id == inf_id:
+            # It has been already loaded in this request (it is only reused once)
+            auth.authorized_inf = None
+        else:
+            if inf_id not in IM.InfrastructureList.InfrastructureList.get_inf_ids():
+                InfrastructureManager.logger.error("Error, incorrect Inf ID: %s" % inf_id)
+                raise IncorrectInfrastructureException()
+            sel_inf = IM.InfrastructureList.InfrastructureList.get_infrastructure(inf_id)
+            if not sel_inf:
+                InfrastructureManager.logger.error("Error loading Inf ID: %s" % inf_id)
+                raise IncorrectInfrastructureException("Error loading Inf ID data.")
         if not sel_inf.is_authorized(auth):
             InfrastructureManager.logger.error("Access Error to Inf ID: %s" % inf_id)
             raise UnauthorizedUserException()
@@ -335,6 +368,9 @@ class InfrastructureManager:
                             del curr_apps[curr_apps_names[app_name]]
                         curr_apps[orig_app_name] = app
 
+        # The RADL has been modified in place
+        sel_inf.changed()
+
         # Stick all virtual machines to be reconfigured
         InfrastructureManager.logger.info("Contextualize the Inf ID: " + sel_inf.id)
         # reset ansible_configured to force the re-installation of galaxy roles
@@ -686,6 +722,7 @@ class InfrastructureManager:
                     # The VM uses the VMI password, set to change it
                     random_password = ''.join(random.choice(string.ascii_letters + string.digits) for _ in range(8))
                     vm.info.systems[0].setCredentialValues(password=random_password, new=True)
+                    vm.changed()
 
         error_msg = ""
         # Add the new virtual machines to the infrastructure
@@ -818,14 +855,18 @@ class InfrastructureManager:
             "Get information about the vm: '" + str(vm_id) + "' from Inf ID: " + str(inf_id))
 
         vm = InfrastructureManager.get_vm_from_inf(inf_id, vm_id, auth)
+        VMStatePoller.register(inf_id, auth)
 
-        success = vm.update_status(auth)
-        if not success:
-            InfrastructureManager.logger.debug(
-                "Inf ID: " + str(inf_id) + ": " +
-                "Information not updated. Using last information retrieved")
+        if VMStatePoller.is_updated(vm.inf):
+            InfrastructureManager.logger.debug("Inf ID: " + str(inf_id) + ": Using information updated by the poller")
         else:
-            IM.InfrastructureList.InfrastructureList.save_data(inf_id)
+            success = vm.update_status(auth)
+            if not success:
+                InfrastructureManager.logger.debug(
+                    "Inf ID: " + str(inf_id) + ": " +
+                    "Information not updated. Using last information retrieved")
+            else:
+                IM.InfrastructureList.InfrastructureList.save_data(inf_id)
 
         if json_res:
             return dump_radl_json(vm.get_vm_info())
@@ -993,12 +1034,15 @@ class InfrastructureManager:
         InfrastructureManager.logger.info("Getting state of the Inf ID: " + str(inf_id))
 
         sel_inf = InfrastructureManager.get_infrastructure(inf_id, auth)
+        VMStatePoller.register(inf_id, auth)
 
         vm_list = sel_inf.get_vm_list()
+        cached = VMStatePoller.is_updated(sel_inf)
+        if not cached:
+            # First try to update the status of the VMs
+            VirtualMachine.update_vms_status(vm_list, auth, Config.VM_INFO_UPDATE_TIMEOUT or None)
         vm_states = {}
         for vm in vm_list:
-            # First try to update the status of the VM
-            vm.update_status(auth)
             vm_states[str(vm.im_id)] = vm.state
 
         state = None
@@ -1040,7 +1084,8 @@ class InfrastructureManager:
         if sel_inf.deleting:
             state = VirtualMachine.DELETING
 
-        IM.InfrastructureList.InfrastructureList.save_data(inf_id)
+        if not cached:
+            IM.InfrastructureList.InfrastructureList.save_data(inf_id)
         InfrastructureManager.logger.info("Inf ID: " + str(inf_id) + " is in state: " + state)
         return {'state': state, 'vm_states': vm_states}
 
@@ -1335,6 +1380,105 @@ class InfrastructureManager:
 
     @staticmethod
     def check_oidc_token(im_auth):
+        """
+        Check the OIDC token of the IM auth and set the username and password obtained from it.
+        If OIDC_CACHE_TIME is set, the result is cached to avoid contacting the issuer in each request.
+        """
+        if not Config.OIDC_CACHE_TIME:
+            return InfrastructureManager._check_oidc_token(im_auth)
+
+        token = im_auth["token"]
+        # The result also depends on the OIDC settings
+        key = hashlib.sha256(("%s|%s|%s|%s" % (token, Config.OIDC_ISSUERS, Config.OIDC_AUDIENCE,
+                                               Config.OIDC_SCOPES)).encode()).hexdigest()
+        now = time.time()
+        cached = InfrastructureManager._get_cache(InfrastructureManager._oidc_cache, key)
+        if cached:
+            _, username, password, error = cached
+            if error:
+                raise InvaliddUserException(error)
+            im_auth['username'] = username
+            im_auth['password'] = password
+            return
+
+        try:
+            InfrastructureManager._check_oidc_token(im_auth)
+        except InvaliddUserException as ex:
+            # Also cache the tokens that will always be rejected, but not the ones rejected by the issuer
+            if Config.OIDC_CACHE_NEGATIVE_TIME and ex.permanent:
+                InfrastructureManager._add_cache(InfrastructureManager._oidc_cache, key,
+                                                 (now + Config.OIDC_CACHE_NEGATIVE_TIME, None, None, ex.message),
+                                                 Config.OIDC_CACHE_MAX_SIZE)
+            raise
+
+        # Never use the cached data after the token expiration
+        expires = InfrastructureManager._get_cache_expiration(Config.OIDC_CACHE_TIME, [token])
+        InfrastructureManager._add_cache(InfrastructureManager._oidc_cache, key,
+                                         (expires, im_auth['username'], im_auth['password'], None),
+                                         Config.OIDC_CACHE_MAX_SIZE)
+
+    @staticmethod
+    def _get_cache(cache, key):
+        """
+        Get an element of a cache (the first item of the values is the expiration time)
+        if it has not expired, removing it otherwise
+        """
+        with InfrastructureManager._cache_lock:
+            cached = cache.get(key)
+            if cached and cached[0] > time.time():
+                cache.move_to_end(key)
+                return cached
+            elif cached:
+                del cache[key]
+        return None
+
+    @staticmethod
+    def _add_cache(cache, key, value, max_size):
+        """
+        Add an element to a cache, removing the least recently used ones if needed
+        """
+        with InfrastructureManager._cache_lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > max(max_size, 1):
+                cache.popitem(last=False)
+
+    @staticmethod
+    def _get_cache_expiration(cache_time, tokens):
+        """
+        Get the expiration time of a cached element obtained using some OIDC tokens
+        (it must never be used after the expiration of the tokens)
+        """
+        expires = time.time() + cache_time
+        for token in tokens:
+            try:
+                expires = min(expires, int(JWT().get_info(token)['exp']))
+            except Exception:
+                pass
+        return expires
+
+    @staticmethod
+    def get_cached_auth(key):
+        """
+        Get the validated credentials cached with the digest of the raw auth data.
+
+        Args:
+
+        - key(str): digest of the raw auth data.
+
+        Return(Authentication): a copy of the validated credentials or None if not cached.
+        """
+        if not Config.AUTH_CACHE_TIME or not key:
+            return None
+        cached = InfrastructureManager._get_cache(InfrastructureManager._auth_cache, key)
+        if not cached:
+            return None
+        auth = Authentication(copy.deepcopy(cached[1]))
+        auth.checked = True
+        return auth
+
+    @staticmethod
+    def _check_oidc_token(im_auth):
         token = im_auth["token"]
         success = False
         try:
@@ -1347,7 +1491,8 @@ class InfrastructureManager:
         # First check if the issuer is in valid
         if decoded_token['iss'] not in Config.OIDC_ISSUERS:
             InfrastructureManager.logger.error("Incorrect OIDC issuer: %s" % decoded_token['iss'])
-            raise InvaliddUserException("Invalid InfrastructureManager credentials. Issuer not accepted.")
+            raise InvaliddUserException("Invalid InfrastructureManager credentials. Issuer not accepted.",
+                                        permanent=True)
 
         # Now check the audience
         if Config.OIDC_AUDIENCE:
@@ -1361,10 +1506,21 @@ class InfrastructureManager:
                     InfrastructureManager.logger.debug("Audience %s successfully checked." % Config.OIDC_AUDIENCE)
                 else:
                     InfrastructureManager.logger.error("Audience %s not found in access token." % Config.OIDC_AUDIENCE)
-                    raise InvaliddUserException("Invalid InfrastructureManager credentials. Audience not accepted.")
+                    raise InvaliddUserException("Invalid InfrastructureManager credentials. Audience not accepted.",
+                                                permanent=True)
             else:
                 InfrastructureManager.logger.error("Audience %s not found in access token." % Config.OIDC_AUDIENCE)
-                raise InvaliddUserException("Invalid InfrastructureManager credentials. Audience not accepted.")
+                raise InvaliddUserException("Invalid InfrastructureManager credentials. Audience not accepted.",
+                                            permanent=True)
+
+        verified = False
+        if Config.OIDC_VERIFY_TOKEN:
+            # Verify the token signature with the keys of the issuer
+            OpenIDClient.ISSUER_CONFIG_CACHE_TIME = Config.OIDC_CONFIG_CACHE_TIME
+            verified, res = OpenIDClient.verify_token(token, Config.VERIFI_SSL)
+            if not verified:
+                InfrastructureManager.logger.error("Error verifying OIDC auth token: %s" % res)
+                raise InvaliddUserException("Invalid InfrastructureManager credentials. Invalid token signature.")
 
         if Config.OIDC_SCOPES and Config.OIDC_CLIENT_ID and Config.OIDC_CLIENT_SECRET:
             OpenIDClient.INSTROSPECT_PATH = Config.OIDC_INSTROSPECT_PATH
@@ -1390,12 +1546,18 @@ class InfrastructureManager:
         expired, msg = OpenIDClient.is_access_token_expired(token)
         if expired:
             InfrastructureManager.logger.error("OIDC auth %s." % msg)
-            raise InvaliddUserException("Invalid InfrastructureManager credentials. OIDC auth %s." % msg)
+            raise InvaliddUserException("Invalid InfrastructureManager credentials. OIDC auth %s." % msg,
+                                        permanent=True)
 
         try:
             # Now try to get user info
             OpenIDClient.USER_INFO_PATH = Config.OIDC_USER_INFO_PATH
-            success, userinfo = OpenIDClient.get_user_info_request(token, Config.VERIFI_SSL)
+            OpenIDClient.ISSUER_CONFIG_CACHE_TIME = Config.OIDC_CONFIG_CACHE_TIME
+            if verified and decoded_token.get("preferred_username"):
+                # The token is valid and it already has the user info needed
+                success, userinfo = True, decoded_token
+            else:
+                success, userinfo = OpenIDClient.get_user_info_request(token, Config.VERIFI_SSL)
             if success:
                 # convert to username to use it in the rest of the IM
                 im_auth['username'] = IM.InfrastructureInfo.InfrastructureInfo.OPENID_USER_PREFIX
@@ -1438,8 +1600,22 @@ class InfrastructureManager:
                     vault_mount_point = vault_auth[0]["mount_point"]
                 if "role" in vault_auth[0]:
                     vault_role = vault_auth[0]["role"]
-                vault = VaultCredentials(vault_host, vault_mount_point, vault_path, vault_role, Config.VERIFI_SSL)
-                creds = vault.get_creds(vault_auth[0]["token"])
+                token = vault_auth[0]["token"]
+                key = hashlib.sha256(("%s|%s|%s|%s|%s" % (vault_host, vault_mount_point, vault_path,
+                                                          vault_role, token)).encode()).hexdigest()
+                cached = None
+                if Config.VAULT_CACHE_TIME:
+                    cached = InfrastructureManager._get_cache(InfrastructureManager._vault_cache, key)
+                if cached:
+                    creds = copy.deepcopy(cached[1])
+                else:
+                    vault = VaultCredentials(vault_host, vault_mount_point, vault_path, vault_role, Config.VERIFI_SSL)
+                    creds = vault.get_creds(token)
+                    # Do not cache the errors (no credentials returned)
+                    if Config.VAULT_CACHE_TIME and creds:
+                        expires = InfrastructureManager._get_cache_expiration(Config.VAULT_CACHE_TIME, [token])
+                        InfrastructureManager._add_cache(InfrastructureManager._vault_cache, key,
+                                                         (expires, copy.deepcopy(creds)), Config.AUTH_CACHE_MAX_SIZE)
                 creds.extend(auth.auth_list)
                 creds.remove(vault_auth[0])
                 return Authentication(creds)
@@ -1457,12 +1633,24 @@ class InfrastructureManager:
             vo = appdbis_auth[0]["vo"]
             # To avoid connecting with AppDBIS again
             del appdbis_auth[0]["vo"]
-            if "host" in appdbis_auth[0]:
-                appdbis = AppDBIS(appdbis_auth[0]["host"])
+            host = appdbis_auth[0].get("host")
+            key = "sites|%s|%s" % (host, vo)
+            cached = None
+            if Config.APPDB_CACHE_TIME:
+                cached = InfrastructureManager._get_cache(InfrastructureManager._appdb_cache, key)
+            if cached:
+                code, sites = 200, cached[1]
             else:
-                appdbis = AppDBIS()
-            InfrastructureManager.logger.debug("Getting auth data from AppDBIS")
-            code, sites = appdbis.get_sites_supporting_vo(vo)
+                if host:
+                    appdbis = AppDBIS(host)
+                else:
+                    appdbis = AppDBIS()
+                InfrastructureManager.logger.debug("Getting auth data from AppDBIS")
+                code, sites = appdbis.get_sites_supporting_vo(vo)
+                if code == 200 and Config.APPDB_CACHE_TIME:
+                    InfrastructureManager._add_cache(InfrastructureManager._appdb_cache, key,
+                                                     (time.time() + Config.APPDB_CACHE_TIME, sites),
+                                                     Config.AUTH_CACHE_MAX_SIZE)
             if code == 200:
                 for site_name, site_url, project_id in sites:
                     auth_site = {"id": site_name, "host": site_url, "type": "OpenStack",
@@ -1483,13 +1671,11 @@ class InfrastructureManager:
                     ost_auth = {'id': auth_item['id'], 'type': 'OpenStack', 'username': 'egi.eu', 'tenant': 'openid',
                                 'password': auth_item['token'], 'auth_version': '3.x_oidc_access_token',
                                 'vo': auth_item['vo']}
-                    site_id = AppDB.get_site_id(auth_item["host"], stype="openstack")
-                    site_url = AppDB.get_site_url(site_id)
+                    site_url, projects = InfrastructureManager._get_appdb_site(auth_item["host"])
                     if not site_url:
                         InfrastructureManager.logger.error("Site name '%s' not found at AppDB." % auth_item['host'])
                         continue
                     ost_auth['host'] = site_url
-                    projects = AppDB.get_project_ids(site_id)
                     # If the VO does not appear in the project IDs
                     if auth_item['vo'] in projects:
                         ost_auth['domain'] = projects[auth_item['vo']]
@@ -1507,8 +1693,45 @@ class InfrastructureManager:
         auth.auth_list = res
         return auth
 
+    @staticmethod
+    def _get_appdb_site(site_name):
+        """
+        Get the URL and the project IDs of an OpenStack site from AppDB.
+        The results are cached APPDB_CACHE_TIME secs.
+        """
+        key = "site|%s" % site_name
+        cached = None
+        if Config.APPDB_CACHE_TIME:
+            cached = InfrastructureManager._get_cache(InfrastructureManager._appdb_cache, key)
+        if cached:
+            return cached[1]
+
+        projects = {}
+        site_id = AppDB.get_site_id(site_name, stype="openstack")
+        site_url = AppDB.get_site_url(site_id)
+        if site_url:
+            projects = AppDB.get_project_ids(site_id)
+            if Config.APPDB_CACHE_TIME:
+                InfrastructureManager._add_cache(InfrastructureManager._appdb_cache, key,
+                                                 (time.time() + Config.APPDB_CACHE_TIME, (site_url, projects)),
+                                                 Config.AUTH_CACHE_MAX_SIZE)
+        return site_url, projects
+
     @staticmethod
     def check_auth_data(auth):
+        if auth.checked:
+            # The credentials have been already validated (i.e. in a batch request)
+            return auth
+
+        cache_key = None
+        if Config.AUTH_CACHE_TIME:
+            cache_key = auth.cache_key
+            if not cache_key:
+                cache_key = hashlib.sha256(json.dumps(auth.auth_list, sort_keys=True).encode()).hexdigest()
+            cached_auth = InfrastructureManager.get_cached_auth(cache_key)
+            if cached_auth:
+                return cached_auth
+
         # First check if it is configured to check the users from a list
         im_auth = auth.getAuthInfo("InfrastructureManager")
 
@@ -1549,6 +1772,13 @@ class InfrastructureManager:
         auth = InfrastructureManager.get_auth_from_vault(auth)
         auth = InfrastructureManager.gen_auth_from_appdb(auth)
         auth = InfrastructureManager.translate_egi_to_ost(auth)
+        auth.checked = True
+
+        if cache_key:
+            tokens = [im_auth_item["token"] for im_auth_item in im_auth if "token" in im_auth_item]
+            expires = InfrastructureManager._get_cache_expiration(Config.AUTH_CACHE_TIME, tokens)
+            InfrastructureManager._add_cache(InfrastructureManager._auth_cache, cache_key,
+                                             (expires, copy.deepcopy(auth.auth_list)), Config.AUTH_CACHE_MAX_SIZE)
         return auth
 
     @staticmethod
@@ -1744,7 +1974,10 @@ class InfrastructureManager:
 
     @staticmethod
     def stop():
+        VMStatePoller.stop()
         IM.InfrastructureList.InfrastructureList.stop()
+        CtxtProcessMonitor.stop()
+        VirtualMachine.close_ssh_pool()
 
     @staticmethod
     def _get_cloud_conn(cloud_id, auth):
@@ -16,14 +16,23 @@
 
 import logging
 import threading
+import time
 import json
 import base64
+import hashlib
+import types
+import zlib
 import bottle
+from concurrent.futures import ThreadPoolExecutor
 
 from IM.InfrastructureInfo import IncorrectVMException, DeletedVMException, IncorrectStateException
 from IM.InfrastructureManager import (InfrastructureManager, DeletedInfrastructureException,
                                       IncorrectInfrastructureException, UnauthorizedUserException,
                                       InvaliddUserException, DisabledFunctionException)
+from IM.InfrastructureList import InfrastructureList
+from IM.VMStatePoller import VMStatePoller
+from IM.VirtualMachine import VirtualMachine
+from IM.StateNotifier import StateNotifier
 from IM.auth import Authentication
 from IM.config import Config
 from IM import get_ex_error
@@ -53,61 +62,112 @@ HTML_ERROR_TEMPLATE = """<!DOCTYPE HTML PUBLIC "-//IETF//DTD HTML 2.0//EN">
 
 REST_URL = None
 
+# Infrastructure operations supported in the batch requests
+BATCH_OPERATIONS = ["info", "state", "radl", "contmsg", "outputs", "authorization"]
+
 app = bottle.Bottle()
 bottle_server = None
+batch_pool = None
+batch_pool_lock = threading.Lock()
 
 # Declaration of new class that inherits from ServerAdapter
 # It's almost equal to the supported cherrypy class CherryPyServer
 
 
-class MySSLCherryPy(bottle.ServerAdapter):
+class MyCherryPy(bottle.ServerAdapter):
+
+    SCALE_INTERVAL = 1
+    """Interval (in secs) to check if the thread pool must grow or shrink."""
 
-    def run(self, handler):
+    def create_server(self, handler):
+        max_threads = max(Config.REST_MAX_THREADS, Config.REST_MIN_THREADS)
         try:
             # First try to use the new version
-            from cheroot.ssl.pyopenssl import pyOpenSSLAdapter
             from cheroot import wsgi
-            server = wsgi.Server((self.host, self.port), handler, request_queue_size=32)
-        except Exception:
-            from cherrypy.wsgiserver.ssl_pyopenssl import pyOpenSSLAdapter
+            kwargs = {}
+            if Config.REST_PROCESSES > 1:
+                # Share the port with the rest of IM processes
+                kwargs["reuse_port"] = True
+            server = wsgi.Server((self.host, self.port), handler, numthreads=Config.REST_MIN_THREADS,
+                                 max=max_threads, request_queue_size=Config.REST_REQUEST_QUEUE_SIZE,
+                                 timeout=Config.REST_TIMEOUT, accepted_queue_size=Config.REST_ACCEPTED_QUEUE_SIZE,
+                                 accepted_queue_timeout=Config.REST_ACCEPTED_QUEUE_TIMEOUT, **kwargs)
+            server.keep_alive_conn_limit = Config.REST_KEEP_ALIVE_CONN_LIMIT
+        except ImportError:
             from cherrypy import wsgiserver
-            server = wsgiserver.CherryPyWSGIServer((self.host, self.port), handler, request_queue_size=32)
+            server = wsgiserver.CherryPyWSGIServer((self.host, self.port), handler,
+                                                   numthreads=Config.REST_MIN_THREADS, max=max_threads,
+                                                   request_queue_size=Config.REST_REQUEST_QUEUE_SIZE,
+                                                   timeout=Config.REST_TIMEOUT)
+        return server
+
+    def scale_threads(self, server):
+        """
+        Grow the thread pool of the server (up to REST_MAX_THREADS) while there are
+        connections waiting for a free thread and shrink it when the threads are idle.
+        """
+        while not self.stopped:
+            time.sleep(self.SCALE_INTERVAL)
+            try:
+                if not server.ready:
+                    continue
+                pool = server.requests
+                if pool.qsize:
+                    pool.grow(pool.qsize)
+                elif pool.idle > Config.REST_MIN_THREADS:
+                    pool.shrink(1)
+            except Exception:
+                logger.exception("Error scaling the REST server thread pool.")
 
+    def run(self, handler):
+        server = self.create_server(handler)
         self.srv = server
-
-        # If cert variable is has a valid path, SSL will be used
-        # You can set it to None to disable SSL
-        server.ssl_adapter = pyOpenSSLAdapter(Config.REST_SSL_CERTFILE,
-                                              Config.REST_SSL_KEYFILE,
-                                              Config.REST_SSL_CA_CERTS)
+        self.stopped = False
+        if Config.REST_MAX_THREADS > Config.REST_MIN_THREADS:
+            scaler = threading.Thread(target=self.scale_threads, args=(server,), name="RESTThreadScaler")
+            scaler.daemon = True
+            scaler.start()
         try:
             server.start()
         finally:
+            self.stopped = True
             server.stop()
 
     def shutdown(self):
+        self.stopped = True
         self.srv.stop()
 
 
-class MyCherryPy(bottle.ServerAdapter):
+class MySSLCherryPy(MyCherryPy):
 
-    def run(self, handler):
+    def create_server(self, handler):
         try:
             # First try to use the new version
-            from cheroot import wsgi
-            server = wsgi.Server((self.host, self.port), handler, request_queue_size=32)
-        except Exception:
-            from cherrypy import wsgiserver
-            server = wsgiserver.CherryPyWSGIServer((self.host, self.port), handler, request_queue_size=32)
+            from cheroot.ssl.pyopenssl import pyOpenSSLAdapter
+        except ImportError:
+            from cherrypy.wsgiserver.ssl_pyopenssl import pyOpenSSLAdapter
 
-        self.srv = server
-        try:
-            server.start()
-        finally:
-            server.stop()
+        class SessionCacheSSLAdapter(pyOpenSSLAdapter):
 
-    def shutdown(self):
-        self.srv.stop()
+            def get_context(self):
+                from OpenSSL import SSL
+                context = pyOpenSSLAdapter.get_context(self)
+                # Enable the clients to resume the TLS sessions avoiding full handshakes
+                if Config.REST_SSL_SESSION_TIMEOUT:
+                    context.set_session_id(b"IM-REST")
+                    context.set_session_cache_mode(SSL.SESS_CACHE_SERVER)
+                    context.set_timeout(Config.REST_SSL_SESSION_TIMEOUT)
+                else:
+                    context.set_session_cache_mode(SSL.SESS_CACHE_OFF)
+                return context
+
+        server = MyCherryPy.create_server(self, handler)
+        # If cert variable is has a valid path, SSL will be used
+        # You can set it to None to disable SSL
+        server.ssl_adapter = SessionCacheSSLAdapter(Config.REST_SSL_CERTFILE,
+                                                    Config.REST_SSL_KEYFILE,
+                                                    Config.REST_SSL_CA_CERTS)
+        return server
 
 
 def run_in_thread(host, port):
@@ -202,6 +262,23 @@ def get_auth_header():
 
     auth_header = bottle.request.headers['AUTHORIZATION']
 
+    cache_key = None
+    if Config.AUTH_CACHE_TIME:
+        # Avoid parsing and validating again the same credentials
+        cache_key = hashlib.sha256(("REST|%s" % auth_header).encode()).hexdigest()
+        auth = InfrastructureManager.get_cached_auth(cache_key)
+        if auth:
+            return auth
+
+    auth = parse_auth_header(auth_header)
+    auth.cache_key = cache_key
+    return auth
+
+
+def parse_auth_header(auth_header):
+    """
+    Get the Authentication object from the value of the AUTHORIZATION header
+    """
     user_pass = None
     token = None
     if auth_header.startswith("Basic "):
@@ -317,6 +394,229 @@ def format_output(res, default_type="text/plain", field_name=None, list_field_na
     return info
 
 
+def get_etag(sel_inf):
+    """
+    Get the ETag of the response of the current request with the data of an infrastructure
+    """
+    return sel_inf.get_etag(bottle.request.path, bottle.request.query_string,
+                            bottle.request.headers.get('Accept'), get_content_encoding(),
+                            bottle.request.headers.get('Range'))
+
+
+def etag_matches(etag):
+    """
+    Set the ETag and Cache-Control headers of the response and check if
+    the ETag matches the If-None-Match header of the request.
+    """
+    bottle.response.set_header('ETag', etag)
+    # The responses depend on the user credentials and must be always revalidated
+    bottle.response.set_header('Cache-Control', 'private, no-cache')
+    if_none_match = bottle.request.headers.get('If-None-Match')
+    if if_none_match:
+        etags = [elem.strip() for elem in if_none_match.split(",")]
+        return etag in etags or "*" in etags
+    return False
+
+
+def check_not_modified(infid, auth, update_vms=False):
+    """
+    Check, before getting the requested data, if the data of the infrastructure has not been
+    modified since the version identified by the If-None-Match header of the request.
+    If update_vms is set, the state of the VMs must have been updated by the VMStatePoller.
+    Returns a tuple with the result of the check and the auth data to use getting the requested data:
+    the validated credentials, that reuse the infrastructure loaded here, if they have been checked.
+    """
+    if not bottle.request.headers.get('If-None-Match'):
+        return False, auth
+    auth = InfrastructureManager.check_auth_data(auth)
+    sel_inf = InfrastructureManager.get_infrastructure(infid, auth)
+    if update_vms:
+        VMStatePoller.register(infid, auth)
+        if not VMStatePoller.is_updated(sel_inf):
+            auth.authorized_inf = sel_inf
+            return False, auth
+    if etag_matches(get_etag(sel_inf)):
+        return True, auth
+    auth.authorized_inf = sel_inf
+    return False, auth
+
+
+def set_etag(infid):
+    """
+    Set the ETag of the response after getting the requested data of the infrastructure.
+    Returns True if it matches the If-None-Match header of the request.
+    """
+    # The infrastructure has been already loaded and authorized
+    sel_inf = InfrastructureList.infrastructure_list.get(infid)
+    if not sel_inf:
+        return False
+    return etag_matches(get_etag(sel_inf))
+
+
+def wait_state_change(infid, auth, wait, since=None):
+    """
+    Wait (up to wait secs) until the state of the infrastructure changes from the
+    version since (or from the current one if it is not set).
+    If the VMStatePoller is not enabled, the state of the VMs is updated every
+    VM_INFO_UPDATE_FREQUENCY secs while waiting to detect their changes.
+    """
+    auth = InfrastructureManager.check_auth_data(auth)
+    sel_inf = InfrastructureManager.get_infrastructure(infid, auth)
+    # Enable the poller (if configured) to detect the changes in the state of the VMs
+    VMStatePoller.register(infid, auth)
+    if since is None:
+        since = StateNotifier.get_version(infid)
+    end = time.time() + min(wait, Config.REST_LONG_POLL_MAX_WAIT)
+    while True:
+        if not Config.VM_STATE_POLLER:
+            VirtualMachine.update_vms_status(sel_inf.get_vm_list(), auth, Config.VM_INFO_UPDATE_TIMEOUT or None)
+        now = time.time()
+        timeout = end - now
+        if timeout <= 0:
+            break
+        if not Config.VM_STATE_POLLER:
+            timeout = min(timeout, Config.VM_INFO_UPDATE_FREQUENCY)
+        if StateNotifier.wait(infid, since, timeout) != since:
+            break
+        if time.time() - now < timeout:
+            # The limit of waiting clients has been reached
+            break
+
+
+def not_modified():
+    """
+    Return a 304 Not Modified response
+    """
+    bottle.response.status = 304
+    return ""
+
+
+def format_cont_msg(cont_msg):
+    """
+    Format the contextualization log returning only the part requested
+    (to enable the clients to get only the new data on each poll):
+    the bytes requested in the Range header (only in text/plain responses)
+    or the data from the character set in the offset parameter.
+    """
+    data = cont_msg.encode("utf-8")
+    range_header = bottle.request.headers.get('Range')
+
+    if "offset" in bottle.request.params.keys() and not range_header:
+        try:
+            offset = int(bottle.request.params.get("offset"))
+            if offset < 0:
+                raise ValueError()
+        except ValueError:
+            return return_error(400, "Incorrect value in offset parameter")
+        cont_msg = cont_msg[offset:]
+
+    info = format_output(cont_msg, field_name="contmsg")
+    if bottle.response.content_type != "text/plain" or info != cont_msg:
+        return info
+
+    bottle.response.set_header('Accept-Ranges', 'bytes')
+    if range_header:
+        ranges = list(bottle.parse_range_header(range_header, len(data)))
+        if not ranges:
+            res = return_error(416, "Requested range not satisfiable")
+            bottle.response.set_header('Content-Range', 'bytes */%d' % len(data))
+            return res
+        start, end = ranges[0]
+        bottle.response.status = 206
+        bottle.response.set_header('Content-Range', 'bytes %d-%d/%d' % (start, end - 1, len(data)))
+        return data[start:end]
+
+    return info
+
+
+def get_content_encoding():
+    """
+    Get the content coding (gzip or deflate) accepted by the client
+    in the Accept-Encoding header or None if none of them is accepted.
+    """
+    accepted = {}
+    accept_encoding = bottle.request.headers.get('Accept-Encoding')
+    if accept_encoding:
+        for item in accept_encoding.split(","):
+            parts = item.split(";")
+            quality = 1.0
+            for param in parts[1:]:
+                param = param.strip()
+                if param.startswith("q="):
+                    try:
+                        quality = float(param[2:])
+                    except ValueError:
+                        quality = 0.0
+            accepted[parts[0].strip().lower()] = quality
+
+    for encoding in ["gzip", "deflate"]:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def stream_output(body, encoding=None):
+    """
+    Generator that returns the body of the response in chunks of
+    REST_STREAM_CHUNK_SIZE bytes, compressing them if encoding is set.
+    The body can be a str, bytes or a generator of them.
+    """
+    compressor = None
+    if encoding == "gzip":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    elif encoding == "deflate":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS)
+
+    if isinstance(body, (str, bytes)):
+        chunk_size = Config.REST_STREAM_CHUNK_SIZE or len(body) or 1
+        chunks = (body[i:i + chunk_size] for i in range(0, len(body), chunk_size))
+    else:
+        chunks = body
+
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        if compressor:
+            chunk = compressor.compress(chunk)
+        if chunk:
+            yield chunk
+
+    if compressor:
+        yield compressor.flush()
+
+
+def encode_output(callback):
+    """
+    Bottle plugin to compress the big responses if the client accepts it
+    and to send them in chunks.
+    """
+    def wrapper(*args, **kwargs):
+        body = callback(*args, **kwargs)
+        if isinstance(body, str):
+            body = body.encode(bottle.response.charset or "utf-8")
+        elif not isinstance(body, (bytes, types.GeneratorType)):
+            return body
+
+        encoding = None
+        if (Config.REST_COMPRESS_MIN_SIZE and bottle.response.status_code == 200 and
+                'Content-Encoding' not in bottle.response.headers and
+                (isinstance(body, types.GeneratorType) or len(body) >= Config.REST_COMPRESS_MIN_SIZE)):
+            bottle.response.add_header('Vary', 'Accept-Encoding')
+            encoding = get_content_encoding()
+
+        if encoding:
+            bottle.response.set_header('Content-Encoding', encoding)
+        elif isinstance(body, bytes) and (not Config.REST_STREAM_CHUNK_SIZE or
+                                          len(body) <= Config.REST_STREAM_CHUNK_SIZE):
+            return body
+        return stream_output(body, encoding)
+
+    return wrapper
+
+
+app.install(encode_output)
+
+
 @app.hook('after_request')
 def enable_cors():
     """
@@ -382,7 +682,12 @@ def RESTGetInfrastructureInfo(infid=None):
         return return_error(401, "No authentication data provided")
 
     try:
+        unchanged, auth = check_not_modified(infid, auth)
+        if unchanged:
+            return not_modified()
         vm_ids = InfrastructureManager.GetInfrastructureInfo(infid, auth)
+        if set_etag(infid):
+            return not_modified()
         res = []
 
         for vm_id in vm_ids:
@@ -408,6 +713,25 @@ def RESTGetInfrastructureProperty(infid=None, prop=None):
         return return_error(401, "No authentication data provided")
 
     try:
+        if prop == "state":
+            if "wait" in bottle.request.params.keys():
+                try:
+                    wait = float(bottle.request.params.get("wait"))
+                    since = None
+                    if "since" in bottle.request.params.keys():
+                        since = int(bottle.request.params.get("since"))
+                except ValueError:
+                    return return_error(400, "Incorrect value in wait or since parameters")
+                wait_state_change(infid, auth, wait, since)
+            if Config.REST_LONG_POLL_MAX_WAIT:
+                # Get the version before the state to avoid losing any change
+                bottle.response.set_header('X-IM-State-Version', str(StateNotifier.get_version(infid)))
+
+        if prop in ["contmsg", "radl", "state"]:
+            unchanged, auth = check_not_modified(infid, auth, prop == "state")
+            if unchanged:
+                return not_modified()
+
         if prop == "contmsg":
             headeronly = False
             if "headeronly" in bottle.request.params.keys():
@@ -420,8 +744,13 @@ def RESTGetInfrastructureProperty(infid=None, prop=None):
                     return return_error(400, "Incorrect value in headeronly parameter")
 
             res = InfrastructureManager.GetInfrastructureContMsg(infid, auth, headeronly)
+            if set_etag(infid):
+                return not_modified()
+            return format_cont_msg(res)
         elif prop == "radl":
             res = InfrastructureManager.GetInfrastructureRADL(infid, auth)
+            if set_etag(infid):
+                return not_modified()
         elif prop == "tosca":
             accept = get_media_type('Accept')
             if accept and "application/json" not in accept and "*/*" not in accept and "application/*" not in accept:
@@ -440,6 +769,8 @@ def RESTGetInfrastructureProperty(infid=None, prop=None):
                 return return_error(415, "Unsupported Accept Media Types: %s" % accept)
             bottle.response.content_type = "application/json"
             res = InfrastructureManager.GetInfrastructureState(infid, auth)
+            if set_etag(infid):
+                return not_modified()
             return format_output(res, default_type="application/json", field_name="state")
         elif prop == "outputs":
             accept = get_media_type('Accept')
@@ -553,6 +884,7 @@ def RESTCreateInfrastructure():
         if tosca_data:
             sel_inf = InfrastructureManager.get_infrastructure(inf_id, auth)
             sel_inf.extra_info['TOSCA'] = tosca_data
+            sel_inf.changed()
 
         bottle.response.headers['InfID'] = inf_id
         bottle.response.content_type = "text/uri-list"
@@ -606,7 +938,12 @@ def RESTGetVMInfo(infid=None, vmid=None):
         return return_error(401, "No authentication data provided")
 
     try:
+        unchanged, auth = check_not_modified(infid, auth, True)
+        if unchanged:
+            return not_modified()
         radl = InfrastructureManager.GetVMInfo(infid, vmid, auth)
+        if set_etag(infid):
+            return not_modified()
         return format_output(radl, field_name="radl")
     except DeletedInfrastructureException as ex:
         return return_error(404, "Error Getting VM. info: %s" % get_ex_error(ex))
@@ -632,7 +969,13 @@ def RESTGetVMProperty(infid=None, vmid=None, prop=None):
 
     try:
         if prop == 'contmsg':
+            unchanged, auth = check_not_modified(infid, auth)
+            if unchanged:
+                return not_modified()
             info = InfrastructureManager.GetVMContMsg(infid, vmid, auth)
+            if set_etag(infid):
+                return not_modified()
+            return format_cont_msg(info)
         elif prop == 'command':
             auth = InfrastructureManager.check_auth_data(auth)
             sel_inf = InfrastructureManager.get_infrastructure(infid, auth)
@@ -781,6 +1124,7 @@ def RESTAddResource(infid=None):
         if tosca_data:
             sel_inf = InfrastructureManager.get_infrastructure(infid, auth)
             sel_inf.extra_info['TOSCA'] = tosca_data
+            sel_inf.changed()
 
         res = []
         for vm_id in vm_ids:
@@ -1200,6 +1544,122 @@ def RESTChangeInfrastructureAuth(infid=None):
         return return_error(400, "Error modifying infrastructure owner: %s" % get_ex_error(ex))
 
 
+def get_batch_pool():
+    """
+    Get the pool of threads shared to run the operations of the batch requests
+    """
+    global batch_pool
+    with batch_pool_lock:
+        if batch_pool is None:
+            batch_pool = ThreadPoolExecutor(max_workers=Config.REST_BATCH_THREADS, thread_name_prefix="RESTBatch")
+        return batch_pool
+
+
+def run_batch_operation(infid, operation, auth):
+    """
+    Run one operation of a batch request
+    """
+    if operation == "info":
+        return InfrastructureManager.GetInfrastructureInfo(infid, auth)
+    elif operation == "state":
+        return InfrastructureManager.GetInfrastructureState(infid, auth)
+    elif operation == "radl":
+        return InfrastructureManager.GetInfrastructureRADL(infid, auth)
+    elif operation == "contmsg":
+        return InfrastructureManager.GetInfrastructureContMsg(infid, auth)
+    elif operation == "authorization":
+        return InfrastructureManager.GetInfrastructureOwners(infid, auth)
+    elif operation == "outputs":
+        sel_inf = InfrastructureManager.get_infrastructure(infid, auth)
+        if "TOSCA" not in sel_inf.extra_info:
+            raise Exception("'outputs' infrastructure property is not valid in this infrastructure")
+        return sel_inf.extra_info["TOSCA"].get_outputs(sel_inf)
+
+
+def run_batch_operations(infid, operations, auth):
+    """
+    Run sequentially the operations of a batch request over the same infrastructure
+    (so it is only loaded once). Returns a list of tuples (code, result or error message).
+    """
+    res = []
+    for operation in operations:
+        try:
+            res.append((200, run_batch_operation(infid, operation, auth)))
+        except (DeletedInfrastructureException, IncorrectInfrastructureException) as ex:
+            res.append((404, get_ex_error(ex)))
+        except UnauthorizedUserException as ex:
+            res.append((403, get_ex_error(ex)))
+        except Exception as ex:
+            logger.exception("Error in batch operation %s of Inf ID: %s" % (operation, infid))
+            res.append((400, get_ex_error(ex)))
+    return res
+
+
+@app.route('/batch', method='POST')
+def RESTBatch():
+    try:
+        auth = get_auth_header()
+    except Exception:
+        return return_error(401, "No authentication data provided")
+
+    try:
+        accept = get_media_type('Accept')
+        if accept and "application/json" not in accept and "*/*" not in accept and "application/*" not in accept:
+            return return_error(415, "Unsupported Accept Media Types: %s" % accept)
+
+        try:
+            operations = json.loads(bottle.request.body.read().decode("utf-8"))
+            if not isinstance(operations, list) or not all(isinstance(op, dict) for op in operations):
+                raise ValueError()
+        except ValueError:
+            return return_error(400, "Incorrect batch data. It must be a JSON list of objects "
+                                "with the infid and operation fields.")
+        if Config.REST_BATCH_MAX_OPERATIONS and len(operations) > Config.REST_BATCH_MAX_OPERATIONS:
+            return return_error(400, "Too many operations in the batch request (max. %d)." %
+                                Config.REST_BATCH_MAX_OPERATIONS)
+
+        # Validate the credentials only once for all the operations
+        auth = InfrastructureManager.check_auth_data(auth)
+
+        inf_operations = {}
+        for op in operations:
+            if op.get("infid") and op.get("operation") in BATCH_OPERATIONS:
+                inf_operations.setdefault(str(op["infid"]), []).append(op["operation"])
+
+        # The operations over different infrastructures run concurrently
+        futures = {}
+        for infid, inf_ops in inf_operations.items():
+            futures[infid] = get_batch_pool().submit(run_batch_operations, infid, inf_ops, auth)
+        inf_results = dict((infid, future.result()) for infid, future in futures.items())
+
+        results = []
+        for op in operations:
+            res = {"infid": op.get("infid"), "operation": op.get("operation")}
+            if not op.get("infid") or op.get("operation") not in BATCH_OPERATIONS:
+                res["code"] = 400
+                res["message"] = "Incorrect infid or operation. Valid operations: %s" % ", ".join(BATCH_OPERATIONS)
+            else:
+                code, value = inf_results[str(op["infid"])].pop(0)
+                res["code"] = code
+                if code != 200:
+                    res["message"] = value
+                elif op["operation"] == "info":
+                    res["result"] = [get_full_url('/infrastructures/%s/vms/%s' % (op["infid"], vm_id))
+                                     for vm_id in value]
+                else:
+                    res["result"] = value
+            results.append(res)
+
+        bottle.response.status = 207
+        bottle.response.content_type = "application/json"
+        return json.dumps({"results": results})
+    except InvaliddUserException as ex:
+        return return_error(401, "Error in batch request: %s" % get_ex_error(ex))
+    except Exception as ex:
+        logger.exception("Error in batch request")
+        return return_error(400, "Error in batch request: %s" % get_ex_error(ex))
+
+
 @app.error(403)
 def error_mesage_403(error):
     return return_error(403, error.body)
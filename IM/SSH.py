@@ -22,11 +22,14 @@ try:
 except Exception:
     print("WARN: SCP library not correctly installed. Some sftp functions will not work!.")
 import os
+import time
+import hashlib
+import shlex
 try:
     from StringIO import StringIO
 except ImportError:
     from io import StringIO
-from threading import Thread
+from threading import Thread, Lock, Condition
 from stat import S_ISDIR
 
 from cryptography.hazmat.backends import default_backend
@@ -55,6 +58,7 @@ class ThreadSSH(Thread):
         self.command_return = None
         self.client = None
         self.proxy = None
+        self.channel = None
 
     def __del__(self):
         self.close()
@@ -63,6 +67,14 @@ class ThreadSSH(Thread):
         """
         Close the SSH client connection
         """
+        if self.channel:
+            self.channel.close()
+            self.channel = None
+        if self.client and self.client is self.ssh.client:
+            # Release it in the SSH object to return it to the pool (if shared)
+            self.ssh.close()
+            self.client = None
+            self.proxy = None
         if self.client:
             self.client.close()
             self.client = None
@@ -75,6 +87,7 @@ class ThreadSSH(Thread):
             self.client, self.proxy = self.ssh.connect()
 
             channel = self.client.get_transport().open_session()
+            self.channel = channel
             if self.ssh.tty:
                 channel.get_pty()
             channel.exec_command(self.command + "\n")
@@ -95,16 +108,181 @@ class ThreadSSH(Thread):
             self.command_return = (res_stdout, res_stderr, exit_status)
 
 
+class SSHSessionPool:
+    """
+    Pool of SSH connections shared by all the SSH objects with the same host, port, user,
+    credentials and proxy. Each operation opens its own channel in the shared transport.
+
+    Arguments:
+        - max_channels(int): Max number of users of a connection before opening a new one.
+        - max_sessions_per_host(int): Max number of connections opened to the same host.
+        - idle_time(int): Time (in secs) to close the connections not used.
+        - keepalive(int): Interval (in secs) of the keepalive packets sent in the connections.
+    """
+
+    def __init__(self, max_channels=8, max_sessions_per_host=2, idle_time=300, keepalive=30):
+        self.max_channels = max_channels
+        self.max_sessions_per_host = max_sessions_per_host
+        self.idle_time = idle_time
+        self.keepalive = keepalive
+        # Connections indexed by key: list of dicts with the client, the proxy,
+        # the number of users and the last use time (the client is None while connecting)
+        self._sessions = {}
+        # Map from the id of the pooled clients to the key and the session data
+        self._clients = {}
+        self._lock = Lock()
+        # Condition to wait for the connections in progress
+        self._connected = Condition(self._lock)
+
+    @staticmethod
+    def get_key(ssh):
+        """
+        Get the key of the connections of an SSH object
+        """
+        creds = hashlib.sha256(("%s|%s" % (ssh.password, ssh.private_key)).encode()).hexdigest()
+        proxy = None
+        if ssh.proxy_host:
+            proxy = SSHSessionPool.get_key(ssh.proxy_host)
+        return (ssh.host, ssh.port, ssh.username, creds, proxy)
+
+    def acquire(self, ssh, time_out=None):
+        """
+        Get a connection for an SSH object, opening a new one if there are no connections
+        available with the same key. The connections in progress are also shared, so the
+        callers wait for them to be established instead of opening new ones.
+
+        Returns: a tuple with the paramiko SSHClient and the proxy client.
+        """
+        key = self.get_key(ssh)
+        with self._lock:
+            to_close = self._evict()
+            sessions = self._sessions.setdefault(key, [])
+            session = None
+            if sessions:
+                session = min(sessions, key=lambda s: s["users"])
+                host_sessions = sum(len(s) for k, s in self._sessions.items() if k[0] == ssh.host)
+                # If the host limit is reached the connections are shared over the channel limit
+                if session["users"] >= self.max_channels and host_sessions < self.max_sessions_per_host:
+                    session = None
+            if session:
+                session["users"] += 1
+                session["last_use"] = time.time()
+                while session["client"] is None and "error" not in session:
+                    self._connected.wait()
+            else:
+                new_session = {"client": None, "proxy": None, "users": 1, "last_use": time.time()}
+                sessions.append(new_session)
+        self._close_sessions(to_close)
+        if session:
+            if "error" in session:
+                raise session["error"]
+            return session["client"], session["proxy"]
+
+        try:
+            client, proxy = ssh._connect(time_out)
+            client.get_transport().set_keepalive(self.keepalive)
+            if proxy:
+                proxy.get_transport().set_keepalive(self.keepalive)
+        except Exception as ex:
+            with self._lock:
+                sessions = [s for s in self._sessions.get(key, []) if s is not new_session]
+                if sessions:
+                    self._sessions[key] = sessions
+                else:
+                    self._sessions.pop(key, None)
+                # The callers waiting for this connection get the same error
+                new_session["error"] = ex
+                self._connected.notify_all()
+            raise
+
+        with self._lock:
+            new_session["client"] = client
+            new_session["proxy"] = proxy
+            self._clients[id(client)] = (key, new_session)
+            self._connected.notify_all()
+        return client, proxy
+
+    def release(self, client):
+        """
+        Return a connection to the pool
+
+        Returns: True if the connection belongs to the pool or False otherwise.
+        """
+        with self._lock:
+            key, session = self._clients.get(id(client), (None, None))
+            if not session or session["client"] is not client:
+                return False
+            session["users"] -= 1
+            session["last_use"] = time.time()
+            to_close = []
+            if session["users"] <= 0 and not any(s is session for s in self._sessions.get(key, [])):
+                # It has been removed from the pool while it was in use
+                self._clients.pop(id(client), None)
+                to_close.append(session)
+            to_close.extend(self._evict())
+        self._close_sessions(to_close)
+        return True
+
+    def close(self):
+        """
+        Close all the connections of the pool
+        """
+        with self._lock:
+            to_close = [session for sessions in self._sessions.values() for session in sessions if session["client"]]
+            self._sessions = {}
+            self._clients = {}
+        self._close_sessions(to_close)
+
+    def _evict(self):
+        """
+        Remove from the pool the connections that are broken or idle.
+        It must be called with the lock acquired.
+
+        Returns: the list of sessions to close.
+        """
+        now = time.time()
+        to_close = []
+        for key in list(self._sessions.keys()):
+            keep = []
+            for session in self._sessions[key]:
+                client = session["client"]
+                alive = client is None or (client.get_transport() and client.get_transport().is_active())
+                idle = session["users"] <= 0 and now - session["last_use"] > self.idle_time
+                if alive and not idle:
+                    keep.append(session)
+                elif session["users"] <= 0:
+                    self._clients.pop(id(client), None)
+                    to_close.append(session)
+                # The broken connections in use are closed when they are released
+            if keep:
+                self._sessions[key] = keep
+            else:
+                del self._sessions[key]
+        return to_close
+
+    @staticmethod
+    def _close_sessions(sessions):
+        for session in sessions:
+            try:
+                session["client"].close()
+                if session["proxy"]:
+                    session["proxy"].close()
+            except Exception:
+                pass
+
+
 class SSH:
     """ Class to encapsulate SSH operations using paramiko """
 
-    def __init__(self, host, user, passwd=None, private_key=None, port=22, proxy_host=None, auto_close=True):
+    def __init__(self, host, user, passwd=None, private_key=None, port=22, proxy_host=None, auto_close=True,
+                 pool=None):
         # Atributo para la version "thread"
         self.thread = None
 
         self.client = None
         self.proxy = None
         self.auto_close = auto_close
+        self.pool = pool
 
         self.proxy_host = proxy_host
         self.tty = False
@@ -133,14 +311,31 @@ class SSH:
 
     def close(self):
         """
-        Close the SSH client connection
+        Close the SSH client connection (or return it to the pool if it is shared)
         """
-        if self.client:
-            self.client.close()
-            self.client = None
-        if self.proxy:
-            self.proxy.close()
-            self.proxy = None
+        client, proxy = self.client, self.proxy
+        self.client = None
+        self.proxy = None
+        if client and self.pool and self.pool.release(client):
+            return
+        if client:
+            client.close()
+        if proxy:
+            proxy.close()
+
+    def _end_operation(self, sftp=None, force=False):
+        """
+        Close the sftp client used in an operation and, if auto_close (or force) is set, the connection.
+        It must be called also if the operation fails to return the connection to the pool.
+        """
+        try:
+            if sftp:
+                sftp.close()
+        except Exception:
+            pass
+        finally:
+            if self.auto_close or force:
+                self.close()
 
     def __str__(self):
         res = "SSH: host: " + self.host + ", port: " + \
@@ -163,7 +358,27 @@ class SSH:
         """
         if self.client and self.client.get_transport() and self.client.get_transport().is_authenticated():
             return self.client, self.proxy
+        if self.client:
+            self.close()
+
+        if self.pool:
+            client, proxy = self.pool.acquire(self, time_out)
+        else:
+            client, proxy = self._connect(time_out)
 
+        self.client = client
+        self.proxy = proxy
+
+        return client, proxy
+
+    def _connect(self, time_out=None):
+        """ Opens a new connection with the SSH server
+
+            Arguments:
+            - time_out: Timeout to connect.
+
+            Returns: a tuple with the paramiko SSHClient connected with the server and the proxy client.
+        """
         client = paramiko.SSHClient()
         client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
 
@@ -200,9 +415,6 @@ class SSH:
                            password=self.password, timeout=time_out, sock=proxy_channel,
                            pkey=self.private_key_obj)
 
-        self.client = client
-        self.proxy = proxy
-
         return client, proxy
 
     def test_connectivity(self, time_out=None):
@@ -217,10 +429,8 @@ class SSH:
                 Exception
         """
         try:
-            client, proxy = self.connect(time_out)
-            client.close()
-            if proxy:
-                proxy.close()
+            self.connect(time_out)
+            self.close()
             return True
         except paramiko.AuthenticationException:
             raise AuthenticationException("Authentication Error!!")
@@ -242,28 +452,45 @@ class SSH:
             Returns: A tuple (stdout, stderr, exit_code) with the output of the command and the exit code
         """
         client, proxy = self.connect(time_out=timeout)
-        channel = client.get_transport().open_session()
+        try:
+            channel = client.get_transport().open_session()
 
-        if self.tty:
-            channel.get_pty()
+            if self.tty:
+                channel.get_pty()
 
-        channel.exec_command(command + "\n")
-        stdout = channel.makefile()
-        stderr = channel.makefile_stderr()
-        exit_status = channel.recv_exit_status()
+            channel.exec_command(command + "\n")
+            stdout = channel.makefile()
+            stderr = channel.makefile_stderr()
+            exit_status = channel.recv_exit_status()
 
-        res_stdout = ""
-        for line in stdout:
-            res_stdout += line
-        res_stderr = ""
-        for line in stderr:
-            res_stderr += line
+            res_stdout = ""
+            for line in stdout:
+                res_stdout += line
+            res_stderr = ""
+            for line in stderr:
+                res_stderr += line
 
-        if self.auto_close:
             channel.close()
-            client.close()
-            if proxy:
-                proxy.close()
+        finally:
+            self._end_operation()
+        return (res_stdout, res_stderr, exit_status)
+
+    def _execute_raw(self, command):
+        """ Executes a command in the remote server without a tty
+
+            Returns: A tuple (stdout, stderr, exit_code) with the raw bytes of the output of the command,
+            the error output and the exit code
+        """
+        client, proxy = self.connect()
+        try:
+            channel = client.get_transport().open_session()
+            channel.exec_command(command + "\n")
+            res_stdout = channel.makefile("rb").read()
+            res_stderr = channel.makefile_stderr("rb").read().decode("utf-8", errors="replace")
+            exit_status = channel.recv_exit_status()
+            channel.close()
+        finally:
+            self._end_operation()
         return (res_stdout, res_stderr, exit_status)
 
     def sftp_get(self, src, dest):
@@ -274,22 +501,57 @@ class SSH:
             - dest: Local destination path to copy.
         """
         client, proxy = self.connect()
-        transport = client.get_transport()
+        sftp = None
+        try:
+            transport = client.get_transport()
+            try:
+                sftp = paramiko.SFTPClient.from_transport(transport)
+                if not transport.active:
+                    sftp = scp.SCPClient(transport)
+            except Exception:
+                # in case of failure try to use scp
+                sftp = scp.SCPClient(transport)
+
+            sftp.get(src, dest)
+        finally:
+            self._end_operation(sftp)
+
+    def sftp_read(self, path, offset=0):
+        """ Reads the contents of a remote file from an offset
+
+            Arguments:
+            - path: Name of the file in the remote server to read.
+            - offset: Number of bytes to skip from the beginning of the file.
 
+            Returns: a bytes object with the contents of the file from the offset.
+        """
+        sftp = None
         try:
+            client, proxy = self.connect()
+            transport = client.get_transport()
             sftp = paramiko.SFTPClient.from_transport(transport)
-            if not transport.active:
-                sftp = scp.SCPClient(transport)
+            sftp_avail = transport.active
         except Exception:
-            # in case of failure try to use scp
-            sftp = scp.SCPClient(transport)
+            sftp_avail = False
 
-        sftp.get(src, dest)
-        if self.auto_close:
-            sftp.close()
-            if proxy:
-                proxy.close()
-            transport.close()
+        if sftp_avail:
+            try:
+                with sftp.open(path, "rb") as f:
+                    if offset:
+                        f.seek(offset)
+                    res = f.read()
+            finally:
+                self._end_operation(sftp)
+        else:
+            if sftp:
+                sftp.close()
+            # use tail over ssh to read the file
+            stdout, stderr, status = self._execute_raw("tail -c +%d %s" % (offset + 1, shlex.quote(path)))
+            if status != 0:
+                raise IOError("Error reading file %s: %s" % (path, stderr))
+            res = stdout
+
+        return res
 
     def sftp_get_files(self, src, dest):
         """ Gets a list of files from the remote server
@@ -299,22 +561,21 @@ class SSH:
             - dest: A list with the local destination paths to copy.
         """
         client, proxy = self.connect()
-        transport = client.get_transport()
+        sftp = None
         try:
-            sftp = paramiko.SFTPClient.from_transport(transport)
-            if not transport.active:
+            transport = client.get_transport()
+            try:
+                sftp = paramiko.SFTPClient.from_transport(transport)
+                if not transport.active:
+                    sftp = scp.SCPClient(transport)
+            except Exception:
+                # in case of failure try to use scp
                 sftp = scp.SCPClient(transport)
-        except Exception:
-            # in case of failure try to use scp
-            sftp = scp.SCPClient(transport)
 
-        for file0, file1 in zip(src, dest):
-            sftp.get(file0, file1)
-        if self.auto_close:
-            sftp.close()
-            if proxy:
-                proxy.close()
-            transport.close()
+            for file0, file1 in zip(src, dest):
+                sftp.get(file0, file1)
+        finally:
+            self._end_operation(sftp)
 
     def sftp_put_files(self, files):
         """ Puts a list of files to the remote server
@@ -324,22 +585,21 @@ class SSH:
                      element the destination paths in the remote server.
         """
         client, proxy = self.connect()
-        transport = client.get_transport()
+        sftp = None
         try:
-            sftp = paramiko.SFTPClient.from_transport(transport)
-            if not transport.active:
+            transport = client.get_transport()
+            try:
+                sftp = paramiko.SFTPClient.from_transport(transport)
+                if not transport.active:
+                    sftp = scp.SCPClient(transport)
+            except Exception:
+                # in case of failure try to use scp
                 sftp = scp.SCPClient(transport)
-        except Exception:
-            # in case of failure try to use scp
-            sftp = scp.SCPClient(transport)
 
-        for src, dest in files:
-            sftp.put(src, dest)
-        if self.auto_close:
-            sftp.close()
-            if proxy:
-                proxy.close()
-            transport.close()
+            for src, dest in files:
+                sftp.put(src, dest)
+        finally:
+            self._end_operation(sftp)
 
     def sftp_put(self, src, dest):
         """ Puts a file to the remote server
@@ -349,20 +609,19 @@ class SSH:
             - dest: Destination path in the remote server.
         """
         client, proxy = self.connect()
-        transport = client.get_transport()
+        sftp = None
         try:
-            sftp = paramiko.SFTPClient.from_transport(transport)
-            if not transport.active:
+            transport = client.get_transport()
+            try:
+                sftp = paramiko.SFTPClient.from_transport(transport)
+                if not transport.active:
+                    sftp = scp.SCPClient(transport)
+            except Exception:
+                # in case of failure try to use scp
                 sftp = scp.SCPClient(transport)
-        except Exception:
-            # in case of failure try to use scp
-            sftp = scp.SCPClient(transport)
-        sftp.put(src, dest)
-        if self.auto_close:
-            sftp.close()
-            if proxy:
-                proxy.close()
-            transport.close()
+            sftp.put(src, dest)
+        finally:
+            self._end_operation(sftp)
 
     def sftp_get_dir(self, src, dest):
         """ Gets recursively a directory from the remote server
@@ -372,23 +631,21 @@ class SSH:
             - dest: Local destination path.
         """
         client, proxy = self.connect()
-        transport = client.get_transport()
-        sftp = paramiko.SFTPClient.from_transport(transport)
-
-        files = self.sftp_walk(src, None, sftp)
+        sftp = None
+        try:
+            transport = client.get_transport()
+            sftp = paramiko.SFTPClient.from_transport(transport)
 
-        for filename in files:
-            dirname = os.path.dirname(filename)
-            if not os.path.exists(dirname):
-                os.mkdir(dirname)
-            full_dest = filename.replace(src, dest)
-            sftp.get(filename, full_dest)
+            files = self.sftp_walk(src, None, sftp)
 
-        if self.auto_close:
-            sftp.close()
-            if proxy:
-                proxy.close()
-            transport.close()
+            for filename in files:
+                dirname = os.path.dirname(filename)
+                if not os.path.exists(dirname):
+                    os.mkdir(dirname)
+                full_dest = filename.replace(src, dest)
+                sftp.get(filename, full_dest)
+        finally:
+            self._end_operation(sftp)
 
     def sftp_walk(self, src, files=None, sftp=None):
         """ Gets recursively the list of items in a directory from the remote server
@@ -396,12 +653,14 @@ class SSH:
             Arguments:
             - src: Source directory in the remote server to copy.
         """
-        close = False
         if not sftp:
             client, proxy = self.connect()
-            transport = client.get_transport()
-            sftp = paramiko.SFTPClient.from_transport(transport)
-            close = True
+            try:
+                transport = client.get_transport()
+                sftp = paramiko.SFTPClient.from_transport(transport)
+                return self.sftp_walk(src, files, sftp)
+            finally:
+                self._end_operation(sftp, force=True)
 
         folders = []
         if not files:
@@ -417,12 +676,6 @@ class SSH:
         for folder in folders:
             self.sftp_walk(folder, files, sftp)
 
-        if close:
-            sftp.close()
-            transport.close()
-            if proxy:
-                proxy.close()
-
         return files
 
     def sftp_put_dir(self, src, dest):
@@ -436,37 +689,36 @@ class SSH:
             if src.endswith("/"):
                 src = src[:-1]
             client, proxy = self.connect()
-            transport = client.get_transport()
+            sftp = None
             try:
-                sftp = paramiko.SFTPClient.from_transport(transport)
-                sftp_avail = transport.active
-            except Exception:
-                # in case of failure try to use scp
-                sftp = scp.SCPClient(transport)
-                sftp_avail = False
-
-            for dirname, dirnames, filenames in os.walk(src):
-                for subdirname in dirnames:
-                    src_path = os.path.join(dirname, subdirname)
-                    dest_path = os.path.join(dest, src_path[len(src) + 1:])
-                    if sftp_avail:
-                        try:
-                            # if it exists we do not try to create it
-                            sftp.stat(dest_path)
-                        except Exception:
-                            sftp.mkdir(dest_path)
-                    else:
-                        self.execute("mkdir -p %s" % dest_path)
-                for filename in filenames:
-                    src_file = os.path.join(dirname, filename)
-                    dest_file = os.path.join(dest, dirname[len(src) + 1:],
-                                             filename)
-                    sftp.put(src_file, dest_file)
-
-            sftp.close()
-            if proxy:
-                proxy.close()
-            transport.close()
+                transport = client.get_transport()
+                try:
+                    sftp = paramiko.SFTPClient.from_transport(transport)
+                    sftp_avail = transport.active
+                except Exception:
+                    # in case of failure try to use scp
+                    sftp = scp.SCPClient(transport)
+                    sftp_avail = False
+
+                for dirname, dirnames, filenames in os.walk(src):
+                    for subdirname in dirnames:
+                        src_path = os.path.join(dirname, subdirname)
+                        dest_path = os.path.join(dest, src_path[len(src) + 1:])
+                        if sftp_avail:
+                            try:
+                                # if it exists we do not try to create it
+                                sftp.stat(dest_path)
+                            except Exception:
+                                sftp.mkdir(dest_path)
+                        else:
+                            self.execute("mkdir -p %s" % dest_path)
+                    for filename in filenames:
+                        src_file = os.path.join(dirname, filename)
+                        dest_file = os.path.join(dest, dirname[len(src) + 1:],
+                                                 filename)
+                        sftp.put(src_file, dest_file)
+            finally:
+                self._end_operation(sftp, force=True)
 
     def sftp_put_content(self, content, dest):
         """ Puts the contents of a string in a remote file
@@ -476,15 +728,15 @@ class SSH:
             - dest: Destination path in the remote server.
         """
         client, proxy = self.connect()
-        transport = client.get_transport()
-        sftp = paramiko.SFTPClient.from_transport(transport)
-        dest_file = sftp.file(dest, "w")
-        dest_file.write(content)
-        dest_file.close()
-        sftp.close()
-        if proxy:
-            proxy.close()
-        transport.close()
+        sftp = None
+        try:
+            transport = client.get_transport()
+            sftp = paramiko.SFTPClient.from_transport(transport)
+            dest_file = sftp.file(dest, "w")
+            dest_file.write(content)
+            dest_file.close()
+        finally:
+            self._end_operation(sftp, force=True)
 
     def sftp_mkdir(self, directory, mode=0o777):
         """ Creates a remote directory
@@ -510,12 +762,8 @@ class SSH:
             except Exception:
                 sftp.mkdir(directory, mode)
                 res = True
-
-            if self.auto_close:
-                sftp.close()
-                if proxy:
-                    proxy.close()
-                transport.close()
+            finally:
+                self._end_operation(sftp)
         else:
             # use mkdir over ssh to create the directory
             _, _, status = self.execute("mkdir -p %s" % directory)
@@ -533,14 +781,13 @@ class SSH:
                      (see paramiko.SFTPClient.listdir)
         """
         client, proxy = self.connect()
-        transport = client.get_transport()
-        sftp = paramiko.SFTPClient.from_transport(transport)
-        res = sftp.listdir(directory)
-        if self.auto_close:
-            sftp.close()
-            if proxy:
-                proxy.close()
-            transport.close()
+        sftp = None
+        try:
+            transport = client.get_transport()
+            sftp = paramiko.SFTPClient.from_transport(transport)
+            res = sftp.listdir(directory)
+        finally:
+            self._end_operation(sftp)
         return res
 
     def sftp_list_attr(self, directory):
@@ -554,14 +801,13 @@ class SSH:
                      (see paramiko.SFTPClient.listdir_attr)
         """
         client, proxy = self.connect()
-        transport = client.get_transport()
-        sftp = paramiko.SFTPClient.from_transport(transport)
-        res = sftp.listdir_attr(directory)
-        if self.auto_close:
-            sftp.close()
-            transport.close()
-            if proxy:
-                proxy.close()
+        sftp = None
+        try:
+            transport = client.get_transport()
+            sftp = paramiko.SFTPClient.from_transport(transport)
+            res = sftp.listdir_attr(directory)
+        finally:
+            self._end_operation(sftp)
         return res
 
     def getcwd(self):
@@ -578,12 +824,10 @@ class SSH:
             sftp_avail = False
 
         if sftp_avail:
-            cwd = sftp.getcwd()
-            if self.auto_close:
-                sftp.close()
-                if proxy:
-                    proxy.close()
-                transport.close()
+            try:
+                cwd = sftp.getcwd()
+            finally:
+                self._end_operation(sftp)
         else:
             # use rm over ssh to delete the file
             cwd, _, _ = self.execute("pwd")
@@ -643,12 +887,10 @@ class SSH:
             sftp_avail = False
 
         if sftp_avail:
-            res = sftp.remove(path)
-            if self.auto_close:
-                sftp.close()
-                if proxy:
-                    proxy.close()
-                transport.close()
+            try:
+                res = sftp.remove(path)
+            finally:
+                self._end_operation(sftp)
         else:
             # use rm over ssh to delete the file
             _, _, status = self.execute("rm -f %s" % path)
@@ -675,13 +917,11 @@ class SSH:
             sftp_avail = False
 
         if sftp_avail:
-            sftp.chmod(path, mode)
-            res = True
-            if self.auto_close:
-                sftp.close()
-                if proxy:
-                    proxy.close()
-                transport.close()
+            try:
+                sftp.chmod(path, mode)
+                res = True
+            finally:
+                self._end_operation(sftp)
         else:
             # use chmod over ssh to change permissions
             _, _, status = self.execute("chmod %s %s" % (oct(mode), path))
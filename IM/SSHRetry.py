@@ -36,6 +36,11 @@ class SSHRetry(SSH):
     def sftp_get(self, src, dest):
         return SSH.sftp_get(self, src, dest)
 
+    @retry(Exception, (AuthenticationException, paramiko.AuthenticationException),
+           tries=TRIES, delay=DELAY, backoff=BACKOFF)
+    def sftp_read(self, path, offset=0):
+        return SSH.sftp_read(self, path, offset)
+
     @retry(Exception, (AuthenticationException, paramiko.AuthenticationException),
            tries=TRIES, delay=DELAY, backoff=BACKOFF)
     def sftp_get_files(self, src, dest):
@@ -60,62 +60,94 @@ class IMBaseRequest(AsyncRequest):
     CHANGE_INFRASTRUCTURE_AUTH = "ChangeInfrastructureAuth"
     GET_INFRASTRUCTURE_OWNERS = "GetInfrastructureOwners"
 
+    READ_LANE = "read"
+    CREATE_LANE = "create"
+
+    PRIORITIES = {
+        GET_VERSION: Request.PRIORITY_HIGH,
+        GET_INFRASTRUCTURE_STATE: Request.PRIORITY_HIGH,
+        GET_INFRASTRUCTURE_INFO: Request.PRIORITY_HIGH,
+        GET_INFRASTRUCTURE_LIST: Request.PRIORITY_HIGH,
+        GET_INFRASTRUCTURE_RADL: Request.PRIORITY_HIGH,
+        GET_INFRASTRUCTURE_CONT_MSG: Request.PRIORITY_HIGH,
+        GET_INFRASTRUCTURE_OWNERS: Request.PRIORITY_HIGH,
+        GET_VM_INFO: Request.PRIORITY_HIGH,
+        GET_VM_PROPERTY: Request.PRIORITY_HIGH,
+        GET_VM_CONT_MSG: Request.PRIORITY_HIGH,
+        CREATE_INFRASTRUCTURE: Request.PRIORITY_LOW,
+        ADD_RESOURCE: Request.PRIORITY_LOW,
+        IMPORT_INFRASTRUCTURE: Request.PRIORITY_LOW,
+        RECONFIGURE: Request.PRIORITY_LOW,
+        CREATE_DISK_SNAPSHOT: Request.PRIORITY_LOW,
+    }
+    """Default priority of the requests of each function. The rest of functions use PRIORITY_NORMAL."""
+
+    @staticmethod
+    def get_priority(function):
+        """
+        Get the priority of the requests of a function, as set in REQUEST_PRIORITIES or the default one
+        """
+        if function in Config.REQUEST_PRIORITIES:
+            return int(Config.REQUEST_PRIORITIES[function])
+        return IMBaseRequest.PRIORITIES.get(function, Request.PRIORITY_NORMAL)
+
     @staticmethod
     def create_request(function, arguments=()):
+        priority = IMBaseRequest.get_priority(function)
         if function == IMBaseRequest.ADD_RESOURCE:
-            return Request_AddResource(arguments)
+            return Request_AddResource(arguments, priority)
         elif function == IMBaseRequest.ALTER_VM:
-            return Request_AlterVM(arguments)
+            return Request_AlterVM(arguments, priority)
         elif function == IMBaseRequest.CREATE_INFRASTRUCTURE:
-            return Request_CreateInfrastructure(arguments)
+            return Request_CreateInfrastructure(arguments, priority)
         elif function == IMBaseRequest.DESTROY_INFRASTRUCTURE:
-            return Request_DestroyInfrastructure(arguments)
+            return Request_DestroyInfrastructure(arguments, priority)
         elif function == IMBaseRequest.EXPORT_INFRASTRUCTURE:
-            return Request_ExportInfrastructure(arguments)
+            return Request_ExportInfrastructure(arguments, priority)
         elif function == IMBaseRequest.GET_INFRASTRUCTURE_CONT_MSG:
-            return Request_GetInfrastructureContMsg(arguments)
+            return Request_GetInfrastructureContMsg(arguments, priority)
         elif function == IMBaseRequest.GET_INFRASTRUCTURE_INFO:
-            return Request_GetInfrastructureInfo(arguments)
+            return Request_GetInfrastructureInfo(arguments, priority)
         elif function == IMBaseRequest.GET_INFRASTRUCTURE_LIST:
-            return Request_GetInfrastructureList(arguments)
+            return Request_GetInfrastructureList(arguments, priority)
         elif function == IMBaseRequest.GET_INFRASTRUCTURE_RADL:
-            return Request_GetInfrastructureRADL(arguments)
+            return Request_GetInfrastructureRADL(arguments, priority)
         elif function == IMBaseRequest.GET_VM_CONT_MSG:
-            return Request_GetVMContMsg(arguments)
+            return Request_GetVMContMsg(arguments, priority)
         elif function == IMBaseRequest.GET_VM_INFO:
-            return Request_GetVMInfo(arguments)
+            return Request_GetVMInfo(arguments, priority)
         elif function == IMBaseRequest.GET_VM_PROPERTY:
-            return Request_GetVMProperty(arguments)
+            return Request_GetVMProperty(arguments, priority)
         elif function == IMBaseRequest.IMPORT_INFRASTRUCTURE:
-            return Request_ImportInfrastructure(arguments)
+            return Request_ImportInfrastructure(arguments, priority)
         elif function == IMBaseRequest.RECONFIGURE:
-            return Request_Reconfigure(arguments)
+            return Request_Reconfigure(arguments, priority)
         elif function == IMBaseRequest.REMOVE_RESOURCE:
-            return Request_RemoveResource(arguments)
+            return Request_RemoveResource(arguments, priority)
         elif function == IMBaseRequest.START_INFRASTRUCTURE:
-            return Request_StartInfrastructure(arguments)
+            return Request_StartInfrastructure(arguments, priority)
         elif function == IMBaseRequest.STOP_INFRASTRUCTURE:
-            return Request_StopInfrastructure(arguments)
+            return Request_StopInfrastructure(arguments, priority)
         elif function == IMBaseRequest.START_VM:
-            return Request_StartVM(arguments)
+            return Request_StartVM(arguments, priority)
         elif function == IMBaseRequest.STOP_VM:
-            return Request_StopVM(arguments)
+            return Request_StopVM(arguments, priority)
         elif function == IMBaseRequest.REBOOT_VM:
-            return Request_RebootVM(arguments)
+            return Request_RebootVM(arguments, priority)
         elif function == IMBaseRequest.GET_INFRASTRUCTURE_STATE:
-            return Request_GetInfrastructureState(arguments)
+            return Request_GetInfrastructureState(arguments, priority)
         elif function == IMBaseRequest.GET_VERSION:
-            return Request_GetVersion(arguments)
+            return Request_GetVersion(arguments, priority)
         elif function == IMBaseRequest.CREATE_DISK_SNAPSHOT:
-            return Request_CreateDiskSnapshot(arguments)
+            return Request_CreateDiskSnapshot(arguments, priority)
         elif function == IMBaseRequest.GET_CLOUD_IMAGE_LIST:
-            return Request_GetCloudImageList(arguments)
+            return Request_GetCloudImageList(arguments, priority)
         elif function == IMBaseRequest.GET_CLOUD_QUOTAS:
-            return Request_GetCloudQuotas(arguments)
+            return Request_GetCloudQuotas(arguments, priority)
         elif function == IMBaseRequest.CHANGE_INFRASTRUCTURE_AUTH:
-            return Request_ChangeInfrastructureAuth(arguments)
+            return Request_ChangeInfrastructureAuth(arguments, priority)
         elif function == IMBaseRequest.GET_INFRASTRUCTURE_OWNERS:
-            return Request_GetInfrastructureOwners(arguments)
+            return Request_GetInfrastructureOwners(arguments, priority)
         else:
             raise NotImplementedError("Function not Implemented")
 
@@ -145,6 +177,8 @@ class Request_AddResource(IMBaseRequest):
     Request class for the AddResource function
     """
 
+    LANE = IMBaseRequest.CREATE_LANE
+
     def _call_function(self):
         self._error_mesage = "Error Adding resources."
         (inf_id, radl_data, auth_data, context) = self.arguments
@@ -171,6 +205,8 @@ class Request_GetInfrastructureInfo(IMBaseRequest):
     Request class for the GetInfrastructureInfo function
     """
 
+    LANE = IMBaseRequest.READ_LANE
+
     def _call_function(self):
         self._error_mesage = "Error Getting Inf. Info."
         (inf_id, auth_data) = self.arguments
@@ -182,6 +218,8 @@ class Request_GetVMInfo(IMBaseRequest):
     Request class for the GetVMInfo function
     """
 
+    LANE = IMBaseRequest.READ_LANE
+
     def _call_function(self):
         self._error_mesage = "Error Getting VM Info."
         (inf_id, vm_id, auth_data) = self.arguments
@@ -195,6 +233,8 @@ class Request_GetVMProperty(IMBaseRequest):
     Request class for the GetVMProperty function
     """
 
+    LANE = IMBaseRequest.READ_LANE
+
     def _call_function(self):
         self._error_mesage = "Error Getting VM Property."
         (inf_id, vm_id, property_name, auth_data) = self.arguments
@@ -253,6 +293,8 @@ class Request_CreateInfrastructure(IMBaseRequest):
     Request class for the CreateInfrastructure function
     """
 
+    LANE = IMBaseRequest.CREATE_LANE
+
     def _call_function(self):
         self._error_mesage = "Error Creating Inf."
         (radl_data, auth_data, async_call) = self.arguments
@@ -265,6 +307,8 @@ class Request_GetInfrastructureList(IMBaseRequest):
     Request class for the GetInfrastructureList function
     """
 
+    LANE = IMBaseRequest.READ_LANE
+
     def _call_function(self):
         self._error_mesage = "Error Getting Inf. List."
         (auth_data, flt) = self.arguments
@@ -288,6 +332,8 @@ class Request_ImportInfrastructure(IMBaseRequest):
     Request class for the ImportInfrastructure function
     """
 
+    LANE = IMBaseRequest.CREATE_LANE
+
     def _call_function(self):
         self._error_mesage = "Error Importing Inf."
         (str_inf, auth_data) = self.arguments
@@ -299,6 +345,8 @@ class Request_ExportInfrastructure(IMBaseRequest):
     Request class for the ExportInfrastructure function
     """
 
+    LANE = IMBaseRequest.READ_LANE
+
     def _call_function(self):
         self._error_mesage = "Error Exporting Inf."
         (inf_id, delete, auth_data) = self.arguments
@@ -311,6 +359,8 @@ class Request_GetInfrastructureRADL(IMBaseRequest):
     Request class for the GetInfrastructureRADL function
     """
 
+    LANE = IMBaseRequest.READ_LANE
+
     def _call_function(self):
         self._error_mesage = "Error getting RADL of the Inf."
         (inf_id, auth_data) = self.arguments
@@ -322,6 +372,8 @@ class Request_GetVMContMsg(IMBaseRequest):
     Request class for the GetVMContMsg function
     """
 
+    LANE = IMBaseRequest.READ_LANE
+
     def _call_function(self):
         self._error_mesage = "Error Getting VM cont msg."
         (inf_id, vm_id, auth_data) = self.arguments
@@ -333,6 +385,8 @@ class Request_GetInfrastructureContMsg(IMBaseRequest):
     Request class for the GetInfrastructureContMsg function
     """
 
+    LANE = IMBaseRequest.READ_LANE
+
     def _call_function(self):
         self._error_mesage = "Error gettinf the Inf. cont msg"
         (inf_id, auth_data, headeronly) = self.arguments
@@ -385,6 +439,8 @@ class Request_GetInfrastructureState(IMBaseRequest):
     Request class for the GetInfrastructureState function
     """
 
+    LANE = IMBaseRequest.READ_LANE
+
     def _call_function(self):
         self._error_mesage = "Error getting the Inf. state"
         (inf_id, auth_data) = self.arguments
@@ -396,6 +452,8 @@ class Request_GetVersion(IMBaseRequest):
     Request class for the GetVersion function
     """
 
+    LANE = IMBaseRequest.READ_LANE
+
     def _call_function(self):
         self._error_mesage = "Error getting IM service version"
         return version
@@ -418,6 +476,8 @@ class Request_GetCloudImageList(IMBaseRequest):
     Request class for the GetCloudImageList function
     """
 
+    LANE = IMBaseRequest.READ_LANE
+
     def _call_function(self):
         self._error_mesage = "Error getting cloud image list"
         (cloud_id, auth_data, filters) = self.arguments
@@ -430,6 +490,8 @@ class Request_GetCloudQuotas(IMBaseRequest):
     Request class for the GetCloudQuotas function
     """
 
+    LANE = IMBaseRequest.READ_LANE
+
     def _call_function(self):
         self._error_mesage = "Error getting cloud quotas"
         (cloud_id, auth_data) = self.arguments
@@ -455,6 +517,8 @@ class Request_GetInfrastructureOwners(IMBaseRequest):
     Request class for the GetInfrastructureOwners function
     """
 
+    LANE = IMBaseRequest.READ_LANE
+
     def _call_function(self):
         self._error_mesage = "Error getting the Inf. owners"
         (inf_id, auth_data) = self.arguments
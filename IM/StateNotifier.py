@@ -0,0 +1,131 @@
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+import time
+
+from IM.config import Config
+
+
+class StateNotifier:
+    """
+    Keeps a version of the state of each infrastructure, increased on each state change,
+    to enable the clients to wait for the changes instead of polling the state.
+    """
+
+    _lock = threading.Lock()
+    """Lock to protect the notifier data."""
+
+    _start = int(time.time() * 1000)
+    """Version of the infrastructures not modified since the start of this process."""
+
+    _counter = _start
+    """Last version assigned."""
+
+    _versions = {}
+    """Version of the state of the infrastructures indexed by Inf ID."""
+
+    _waiters = {}
+    """
+    Condition, number of waiting clients and flag to discard the version when the last client
+    stops waiting, of the infrastructures indexed by Inf ID.
+    """
+
+    @staticmethod
+    def notify(inf_id, remove=False):
+        """
+        Notify a change in the state of an infrastructure: the state of a VM, the
+        configuration flag or the contextualization log.
+
+        Args:
+
+        - inf_id(str): infrastructure id.
+        - remove(bool): the infrastructure has been deleted, do not store its version.
+        """
+        with StateNotifier._lock:
+            StateNotifier._counter += 1
+            if remove:
+                StateNotifier._versions.pop(inf_id, None)
+            else:
+                StateNotifier._versions[inf_id] = StateNotifier._counter
+            waiter = StateNotifier._waiters.get(inf_id)
+            if waiter:
+                waiter[2] = False
+                waiter[0].notify_all()
+
+    @staticmethod
+    def discard(inf_id):
+        """
+        Discard the version of an infrastructure removed from the memory cache without changes,
+        as the unknown infrastructures get the initial version. If there are clients waiting
+        for its changes, it is discarded when the last one stops waiting.
+
+        Args:
+
+        - inf_id(str): infrastructure id.
+        """
+        with StateNotifier._lock:
+            waiter = StateNotifier._waiters.get(inf_id)
+            if waiter:
+                waiter[2] = True
+            else:
+                StateNotifier._versions.pop(inf_id, None)
+
+    @staticmethod
+    def get_version(inf_id):
+        """
+        Get the current version of the state of an infrastructure.
+        """
+        with StateNotifier._lock:
+            return StateNotifier._versions.get(inf_id, StateNotifier._start)
+
+    @staticmethod
+    def wait(inf_id, since, timeout):
+        """
+        Wait until the version of the state of an infrastructure is different from since.
+
+        Args:
+
+        - inf_id(str): infrastructure id.
+        - since(int): version of the state known by the client.
+        - timeout(float): max time to wait (in secs).
+
+        Return: the current version of the state of the infrastructure.
+        """
+        end = time.time() + timeout
+        with StateNotifier._lock:
+            waiter = StateNotifier._waiters.get(inf_id)
+            num_waiters = sum(elem[1] for elem in StateNotifier._waiters.values())
+            if Config.REST_LONG_POLL_MAX_CLIENTS and num_waiters >= Config.REST_LONG_POLL_MAX_CLIENTS:
+                # Do not block all the server threads
+                return StateNotifier._versions.get(inf_id, StateNotifier._start)
+            if not waiter:
+                waiter = [threading.Condition(StateNotifier._lock), 0, False]
+                StateNotifier._waiters[inf_id] = waiter
+            waiter[1] += 1
+            try:
+                while StateNotifier._versions.get(inf_id, StateNotifier._start) == since:
+                    remaining = end - time.time()
+                    if remaining <= 0:
+                        break
+                    waiter[0].wait(remaining)
+                return StateNotifier._versions.get(inf_id, StateNotifier._start)
+            finally:
+                waiter[1] -= 1
+                if not waiter[1]:
+                    del StateNotifier._waiters[inf_id]
+                    if waiter[2]:
+                        StateNotifier._versions.pop(inf_id, None)
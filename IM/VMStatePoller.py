@@ -0,0 +1,232 @@
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import random
+import threading
+import time
+import weakref
+
+from IM.config import Config
+from IM.VirtualMachine import VirtualMachine
+
+
+class VMStatePoller:
+    """
+    Background service that refreshes the state of the VMs of the active infrastructures,
+    so that the state requests can be answered with the information stored in memory.
+    """
+
+    logger = logging.getLogger('InfrastructureManager')
+    """Logger object."""
+
+    FAST_STATES = [VirtualMachine.PENDING, VirtualMachine.RUNNING, VirtualMachine.UNKNOWN]
+    """States of the VMs that require to poll the infrastructure with the fast interval."""
+
+    _infs = {}
+    """Active infrastructures indexed by Inf ID: auth data, last access, next poll and last poll results."""
+
+    _cond = threading.Condition()
+    """Condition to protect the poller data and to wake up the poller thread."""
+
+    _thread = None
+    """Poller thread."""
+
+    _stop = False
+    """Flag to stop the poller thread."""
+
+    @staticmethod
+    def register(inf_id, auth):
+        """
+        Mark an infrastructure as active so that the poller refreshes the state of its VMs
+        (only if VM_STATE_POLLER is enabled).
+
+        Args:
+
+        - inf_id(str): infrastructure id.
+        - auth(Authentication): parsed authentication tokens used to access the cloud providers.
+        """
+        if not Config.VM_STATE_POLLER:
+            return
+
+        now = time.time()
+        with VMStatePoller._cond:
+            if inf_id in VMStatePoller._infs:
+                entry = VMStatePoller._infs[inf_id]
+            else:
+                entry = {"next": now, "polled": None}
+                VMStatePoller._infs[inf_id] = entry
+                VMStatePoller._cond.notify_all()
+            # Always use the last credentials provided by the user
+            entry["auth"] = auth
+            entry["last_access"] = now
+
+            if VMStatePoller._thread is None or not VMStatePoller._thread.is_alive():
+                VMStatePoller._stop = False
+                VMStatePoller._thread = threading.Thread(target=VMStatePoller._poller_loop,
+                                                         name="VMStatePoller")
+                VMStatePoller._thread.daemon = True
+                VMStatePoller._thread.start()
+
+    @staticmethod
+    def unregister(inf_id):
+        """
+        Stop polling an infrastructure and forget its auth data.
+        """
+        with VMStatePoller._cond:
+            VMStatePoller._infs.pop(inf_id, None)
+
+    @staticmethod
+    def is_updated(inf):
+        """
+        Check if the state of the VMs of an infrastructure has been refreshed by the poller
+        and it has not been modified since then.
+
+        Args:
+
+        - inf(InfrastructureInfo): infrastructure to check.
+
+        Return: True if the VM states stored in memory can be returned without contacting the cloud providers.
+        """
+        if not Config.VM_STATE_POLLER:
+            return False
+
+        with VMStatePoller._cond:
+            entry = VMStatePoller._infs.get(inf.id)
+            if not entry or not entry["polled"]:
+                return False
+            inf_ref, version, _ = entry["polled"]
+            # Allow the poller some delay to refresh the data
+            max_time = entry["next"] + Config.VM_STATE_POLLER_FAST_INTERVAL
+
+        return inf_ref() is inf and inf.get_version() == version and time.time() <= max_time
+
+    @staticmethod
+    def stop():
+        """
+        Stop the poller thread.
+        """
+        with VMStatePoller._cond:
+            thread = VMStatePoller._thread
+            VMStatePoller._stop = True
+            VMStatePoller._infs = {}
+            VMStatePoller._cond.notify_all()
+        if thread and thread is not threading.current_thread():
+            thread.join(Config.VM_INFO_UPDATE_TIMEOUT or None)
+        VMStatePoller._thread = None
+
+    @staticmethod
+    def get_stats():
+        """
+        Get the number of active infrastructures and the number of them with updated state.
+        """
+        with VMStatePoller._cond:
+            infs = list(VMStatePoller._infs.values())
+        return {"active": len(infs), "polled": len([entry for entry in infs if entry["polled"]])}
+
+    @staticmethod
+    def _get_interval(inf):
+        """
+        Get the time to wait before polling again the infrastructure: fast while the VMs are
+        being created or configured and slow once they are configured or stopped.
+        """
+        fast = inf.configured is None or inf.is_ctxt_process_running()
+        if not fast:
+            for vm in inf.get_vm_list():
+                if vm.state in VMStatePoller.FAST_STATES:
+                    fast = True
+                    break
+
+        if fast:
+            interval = Config.VM_STATE_POLLER_FAST_INTERVAL
+        else:
+            interval = Config.VM_STATE_POLLER_SLOW_INTERVAL
+        # Add some jitter to avoid polling all the infrastructures at the same time
+        jitter = interval * Config.VM_STATE_POLLER_JITTER / 100.0
+        return interval + random.uniform(-jitter, jitter)
+
+    @staticmethod
+    def _poller_loop():
+        """
+        Poll the active infrastructures when their next poll time arrives
+        """
+        while True:
+            with VMStatePoller._cond:
+                while not VMStatePoller._stop:
+                    now = time.time()
+                    due = [inf_id for inf_id, entry in VMStatePoller._infs.items() if entry["next"] <= now]
+                    if due:
+                        break
+                    wait_time = None
+                    if VMStatePoller._infs:
+                        wait_time = min(entry["next"] for entry in VMStatePoller._infs.values()) - now
+                    VMStatePoller._cond.wait(wait_time)
+                if VMStatePoller._stop:
+                    break
+
+            for inf_id in due:
+                if VMStatePoller._stop:
+                    break
+                try:
+                    VMStatePoller._poll(inf_id)
+                except Exception:
+                    VMStatePoller.logger.exception("Inf ID: %s: Error polling the state of the VMs." % inf_id)
+                    with VMStatePoller._cond:
+                        entry = VMStatePoller._infs.get(inf_id)
+                        if entry:
+                            entry["polled"] = None
+                            entry["next"] = time.time() + Config.VM_STATE_POLLER_SLOW_INTERVAL
+
+    @staticmethod
+    def _poll(inf_id):
+        """
+        Refresh the state of the VMs of an infrastructure
+        """
+        # Avoid a circular import
+        from IM.InfrastructureList import InfrastructureList
+
+        with VMStatePoller._cond:
+            entry = VMStatePoller._infs.get(inf_id)
+            if not entry:
+                return
+            if time.time() - entry["last_access"] > Config.VM_STATE_POLLER_IDLE_TIME:
+                VMStatePoller.logger.debug("Inf ID: %s: Not accessed recently. Stop polling it." % inf_id)
+                del VMStatePoller._infs[inf_id]
+                return
+            auth = entry["auth"]
+
+        inf = None
+        # Do not load again the Infs removed from the cache, they are registered again when accessed
+        if inf_id in InfrastructureList.infrastructure_list:
+            inf = InfrastructureList.get_infrastructure(inf_id)
+        if not inf or inf.deleted or inf.deleting:
+            VMStatePoller.unregister(inf_id)
+            return
+
+        polled = None
+        not_updated = VirtualMachine.update_vms_status(inf.get_vm_list(), auth,
+                                                       Config.VM_INFO_UPDATE_TIMEOUT or None)
+        InfrastructureList.save_data(inf_id)
+        if not not_updated:
+            polled = (weakref.ref(inf), inf.get_version(), time.time())
+        else:
+            VMStatePoller.logger.debug("Inf ID: %s: %d VMs not updated." % (inf_id, len(not_updated)))
+
+        interval = VMStatePoller._get_interval(inf)
+        with VMStatePoller._cond:
+            if VMStatePoller._infs.get(inf_id) is entry:
+                entry["polled"] = polled
+                entry["next"] = time.time() + interval
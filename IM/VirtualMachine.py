@@ -21,17 +21,21 @@ import string
 import json
 import tempfile
 import logging
-import sys
 import os.path
+from concurrent.futures import ThreadPoolExecutor, wait
 from netaddr import IPNetwork, IPAddress
 
 from radl.radl import network, RADL
 from radl.radl_parse import parse_radl
 from IM.LoggerMixin import LoggerMixin
-from IM.SSH import SSH
+from IM.SSH import SSH, SSHSessionPool
 from IM.SSHRetry import SSHRetry
 from IM.config import Config
+from IM.StateNotifier import StateNotifier
+from IM.CtxtProcessMonitor import CtxtProcessMonitor
+from IM.ContMsgStore import ContMsgStore
 from IM import get_user_pass_host_port
+from IM.connectors.CloudConnector import CloudConnector
 import IM.CloudInfo
 
 
@@ -54,8 +58,38 @@ class VirtualMachine(LoggerMixin):
 
     SSH_REVERSE_BASE_PORT = 20000
 
+    NON_PRINTABLE_CHARS = bytearray(c for c in range(256) if chr(c) not in string.printable)
+    """Bytes removed from the contextualization logs."""
+
     logger = logging.getLogger('InfrastructureManager')
 
+    NOT_SERIALIZED_ATTRS = ['inf', 'cloud_connector', 'get_ssh', 'get_ctxt_log']
+    """Attributes that are not stored in the DB, so changing them does not modify the VM."""
+
+    _version = 0
+    """Counter of the modifications of the data of this VM (not stored in the DB)."""
+
+    _notified_state = None
+    """Last state of this VM notified to the StateNotifier (not stored in the DB)."""
+
+    _notified_ips = None
+    """Last public and private IPs of this VM notified to the ConfManager (not stored in the DB)."""
+
+    LAZY_ATTRS = ['info', 'requested_radl']
+    """Attributes loaded from the DB that are only parsed when they are accessed."""
+
+    _update_pool = None
+    """Pool of threads shared to update the info of the VMs."""
+
+    _update_semaphores = {}
+    """Map from cloud provider to the Semaphore that limits the simultaneous updates."""
+
+    _update_lock = threading.Lock()
+    """Threading Lock to create the pool and the semaphores."""
+
+    _ssh_pool = None
+    """Pool of SSH connections shared by all the VMs (if SSH_POOL is set)."""
+
     def __init__(self, inf, cloud_id, cloud, info, requested_radl, cloud_connector=None, im_id=None):
         self._lock = threading.Lock()
         """Threading Lock to avoid concurrency problems."""
@@ -101,18 +135,78 @@ class VirtualMachine(LoggerMixin):
         self.creation_date = int(time.time())
         """ Creation time of this Inf. """
 
-    def serialize(self):
+    def __setattr__(self, name, value):
+        if (not name.startswith("_") and name not in self.NOT_SERIALIZED_ATTRS and
+                self.__dict__.get(name, self) is not value):
+            self.__dict__[name] = value
+            self.changed()
+        else:
+            self.__dict__[name] = value
+        lazy_data = self.__dict__.get('_lazy_data')
+        if lazy_data:
+            lazy_data.pop(name, None)
+
+    def __getattr__(self, name):
+        # It is only called if the attribute is not found: parse it if it has not been accessed yet
+        lazy_data = self.__dict__.get('_lazy_data')
+        if lazy_data and name in lazy_data:
+            if name == 'cont_out':
+                # It is stored in the ContMsgStore (the lazy data is the Inf ID)
+                value = ContMsgStore.load(self, lazy_data[name], self.__dict__['im_id']) if lazy_data[name] else ""
+            else:
+                value = parse_radl(lazy_data[name])
+            value = self.__dict__.setdefault(name, value)
+            lazy_data.pop(name, None)
+            return value
+        raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
+
+    def changed(self):
+        """
+        Mark the data of this VM (and its infrastructure) as modified.
+        It must be called after modifying the RADL info in place.
+        """
+        self._version += 1
+        inf = self.__dict__.get('inf')
+        if inf and hasattr(inf, 'changed'):
+            inf.changed()
+
+    def get_version(self):
+        """
+        Get the number of modifications of the data of this VM
+        """
+        return self._version
+
+    def serialize(self, with_cont_msg=True):
         with self._lock:
+            # Copy it before the __dict__ as the lazy attributes are removed after setting them
+            lazy_data = dict(self.__dict__.get('_lazy_data') or {})
             odict = self.__dict__.copy()
         # Quit the lock to the data to be store by pickle
         del odict['_lock']
         del odict['cloud_connector']
         del odict['inf']
+        if '_version' in odict:
+            del odict['_version']
+        if '_notified_state' in odict:
+            del odict['_notified_state']
+        if '_notified_ips' in odict:
+            del odict['_notified_ips']
+        if '_contmsg_state' in odict:
+            del odict['_contmsg_state']
+        if '_lazy_data' in odict:
+            del odict['_lazy_data']
+        # The attributes not parsed yet are stored as they were loaded
+        for name, value in lazy_data.items():
+            odict.setdefault(name, value)
         # To avoid errors tests with Mock objects
         if 'get_ssh' in odict:
             del odict['get_ssh']
         if 'get_ctxt_log' in odict:
             del odict['get_ctxt_log']
+        if with_cont_msg:
+            odict['cont_out'] = self.cont_out
+        else:
+            odict.pop('cont_out', None)
 
         if odict['info']:
             odict['info'] = str(odict['info'])
@@ -127,20 +221,28 @@ class VirtualMachine(LoggerMixin):
         dic = json.loads(str_data)
         if dic['cloud']:
             dic['cloud'] = IM.CloudInfo.CloudInfo.deserialize(dic['cloud'])
-        if dic['info']:
-            dic['info'] = parse_radl(dic['info'])
-        if dic['requested_radl']:
-            dic['requested_radl'] = parse_radl(dic['requested_radl'])
+        # The RADL data will be parsed on first access
+        lazy_data = {}
+        for name in VirtualMachine.LAZY_ATTRS:
+            if dic.get(name):
+                lazy_data[name] = dic.pop(name)
+        if 'cont_out' not in dic:
+            # It will be loaded from the ContMsgStore on first access (when the Inf ID is set)
+            lazy_data['cont_out'] = None
 
         newvm = VirtualMachine(None, None, None, None, None, None, dic['im_id'])
         # Set creating to False as default to VMs stored with 1.5.5 or old versions
         newvm.creating = False
         newvm.creation_date = None
         newvm.__dict__.update(dic)
+        for name in lazy_data:
+            del newvm.__dict__[name]
+        newvm._lazy_data = lazy_data
         # If we load a VM that is not configured, set it to False
         # because the configuration process will be lost
         if newvm.configured is None:
             newvm.configured = False
+        newvm._version = 0
         return newvm
 
     def getCloudConnector(self):
@@ -196,6 +298,7 @@ class VirtualMachine(LoggerMixin):
         (success, alter_res) = self.getCloudConnector().alterVM(self, new_radl, auth)
         # force the update of the information
         self.last_update = 0
+        self.changed()
         return (success, alter_res)
 
     def stop(self, auth):
@@ -229,7 +332,10 @@ class VirtualMachine(LoggerMixin):
         """
         Create a snapshot of one disk of the VM
         """
-        return self.getCloudConnector().create_snapshot(self, disk_num, image_name, auto_delete, auth)
+        res = self.getCloudConnector().create_snapshot(self, disk_num, image_name, auto_delete, auth)
+        # The connector may have added the snapshot to the infrastructure
+        self.changed()
+        return res
 
     def getRequestedSystem(self):
         """
@@ -501,6 +607,7 @@ class VirtualMachine(LoggerMixin):
 
             self.info.systems[0].setValue(
                 'net_interface.' + str(num_net) + '.connection', public_net.id)
+            self.changed()
 
     def contextualize(self):
         """
@@ -525,62 +632,302 @@ class VirtualMachine(LoggerMixin):
         - boolean: True if the information has been updated, false otherwise
         """
         with self._lock:
-            # In case of a VM failed during creation, do not update
-            if self.state == VirtualMachine.FAILED and self.id is None:
-                return False
+            return self._update_status(auth, force)
 
-            if self.destroy:
-                self.state = VirtualMachine.OFF
-                return False
+    def _needs_cloud_update(self, force=False):
+        """
+        Check if the status of this VM must be requested to the cloud provider
+        """
+        if (self.state == VirtualMachine.FAILED and self.id is None) or self.destroy or self.deleting:
+            return False
+        return force or int(time.time()) - self.last_update > Config.VM_INFO_UPDATE_FREQUENCY
 
-            if self.deleting:
-                self.state = VirtualMachine.DELETING
-                return True
+    def _update_status(self, auth, force=False, update_result=None):
+        """
+        Update the status of this virtual machine. It must be called with the _lock acquired.
+        If update_result is set, it is used as the result of the updateVMInfo call.
+        """
+        # In case of a VM failed during creation, do not update
+        if self.state == VirtualMachine.FAILED and self.id is None:
+            return False
 
-            now = int(time.time())
-            state = self.state
-            updated = False
-            # To avoid to refresh the information too quickly
-            if force or now - self.last_update > Config.VM_INFO_UPDATE_FREQUENCY:
-                success = False
-                try:
-                    (success, new_vm) = self.getCloudConnector().updateVMInfo(self, auth)
-                    if success:
-                        state = new_vm.state
-                        updated = True
-                        self.last_update = now
-                    else:
-                        self.log_error("Error updating VM status: %s" % new_vm)
-                except Exception:
-                    self.log_exception("Error updating VM status.")
+        if self.destroy:
+            self._set_state(VirtualMachine.OFF)
+            return False
 
-                if not success and self.creating:
-                    self.log_info("VM is in creation process, set pending state")
-                    state = VirtualMachine.PENDING
+        if self.deleting:
+            self._set_state(VirtualMachine.DELETING)
+            return True
 
-            # If we have problems to update the VM info too much time, set to
-            # unknown unless we are still creating the VM
-            if now - self.last_update > Config.VM_INFO_UPDATE_ERROR_GRACE_PERIOD and not self.creating:
-                new_state = VirtualMachine.UNKNOWN
-                self.log_warn("Grace period to update VM info passed. Set state to 'unknown'")
-            else:
-                if state not in [VirtualMachine.RUNNING, VirtualMachine.CONFIGURED, VirtualMachine.UNCONFIGURED]:
-                    new_state = state
-                elif self.is_configured() is None:
-                    new_state = VirtualMachine.RUNNING
-                elif self.is_configured():
-                    new_state = VirtualMachine.CONFIGURED
+        now = int(time.time())
+        state = self.state
+        updated = False
+        # To avoid to refresh the information too quickly
+        if update_result is not None or force or now - self.last_update > Config.VM_INFO_UPDATE_FREQUENCY:
+            success = False
+            try:
+                if update_result is None:
+                    update_result = self.getCloudConnector().updateVMInfo(self, auth)
+                (success, new_vm) = update_result
+                if success:
+                    state = new_vm.state
+                    updated = True
+                    self.last_update = now
                 else:
-                    new_state = VirtualMachine.UNCONFIGURED
+                    self.log_error("Error updating VM status: %s" % new_vm)
+            except Exception:
+                self.log_exception("Error updating VM status.")
+
+            if not success and self.creating:
+                self.log_info("VM is in creation process, set pending state")
+                state = VirtualMachine.PENDING
 
-            self.state = new_state
-            self.info.systems[0].setValue("state", new_state)
+        # If we have problems to update the VM info too much time, set to
+        # unknown unless we are still creating the VM
+        if now - self.last_update > Config.VM_INFO_UPDATE_ERROR_GRACE_PERIOD and not self.creating:
+            new_state = VirtualMachine.UNKNOWN
+            self.log_warn("Grace period to update VM info passed. Set state to 'unknown'")
+        else:
+            if state not in [VirtualMachine.RUNNING, VirtualMachine.CONFIGURED, VirtualMachine.UNCONFIGURED]:
+                new_state = state
+            elif self.is_configured() is None:
+                new_state = VirtualMachine.RUNNING
+            elif self.is_configured():
+                new_state = VirtualMachine.CONFIGURED
+            else:
+                new_state = VirtualMachine.UNCONFIGURED
 
-            # Replace the #N# in dns_names
-            self.replace_dns_name(self.info.systems[0])
+        self._set_state(new_state)
+        self.info.systems[0].setValue("state", new_state)
+
+        # Replace the #N# in dns_names
+        self.replace_dns_name(self.info.systems[0])
+
+        if updated:
+            # The connector has modified the RADL info
+            self.changed()
+            ips = (self.getPublicIP(), self.getPrivateIP())
+            if self._notified_ips != ips:
+                self._notified_ips = ips
+                self.notify_ctxt_event()
 
         return updated
 
+    def _set_state(self, state):
+        """
+        Set the state of this VM notifying the changes to the clients waiting for them
+        (the connectors may have already modified the state attribute)
+        """
+        self.state = state
+        if self._notified_state != state:
+            self._notified_state = state
+            inf = self.__dict__.get('inf')
+            if inf:
+                StateNotifier.notify(inf.id)
+            self.notify_ctxt_event()
+
+    def notify_ctxt_event(self):
+        """
+        Wake up the ConfManager of the Inf of this VM to check again the state of the contextualization
+        """
+        inf = self.__dict__.get('inf')
+        if inf and hasattr(inf, 'notify_ctxt_event'):
+            inf.notify_ctxt_event()
+
+    @staticmethod
+    def _get_update_pool():
+        """
+        Get the pool of threads shared to update the info of the VMs
+        """
+        with VirtualMachine._update_lock:
+            if VirtualMachine._update_pool is None:
+                VirtualMachine._update_pool = ThreadPoolExecutor(max_workers=Config.MAX_SIMULTANEOUS_VM_UPDATES,
+                                                                 thread_name_prefix="VMUpdate")
+            return VirtualMachine._update_pool
+
+    @staticmethod
+    def get_ssh_pool():
+        """
+        Get the pool of SSH connections shared by all the VMs (None if SSH_POOL is not set)
+        """
+        if not Config.SSH_POOL:
+            return None
+        with VirtualMachine._update_lock:
+            if VirtualMachine._ssh_pool is None:
+                VirtualMachine._ssh_pool = SSHSessionPool(Config.SSH_POOL_MAX_CHANNELS,
+                                                          Config.SSH_POOL_MAX_SESSIONS_PER_HOST,
+                                                          Config.SSH_POOL_IDLE_TIME,
+                                                          Config.SSH_POOL_KEEPALIVE)
+            return VirtualMachine._ssh_pool
+
+    @staticmethod
+    def close_ssh_pool():
+        """
+        Close all the SSH connections of the pool
+        """
+        with VirtualMachine._update_lock:
+            pool = VirtualMachine._ssh_pool
+            VirtualMachine._ssh_pool = None
+        if pool:
+            pool.close()
+
+    def _get_update_semaphore(self):
+        """
+        Get the Semaphore that limits the simultaneous updates to the cloud provider of this VM
+        """
+        if not Config.MAX_SIMULTANEOUS_VM_UPDATES_PER_CLOUD or not self.cloud:
+            return None
+        key = (self.cloud.type, self.cloud.server, self.cloud.port)
+        with VirtualMachine._update_lock:
+            if key not in VirtualMachine._update_semaphores:
+                VirtualMachine._update_semaphores[key] = threading.BoundedSemaphore(
+                    Config.MAX_SIMULTANEOUS_VM_UPDATES_PER_CLOUD)
+            return VirtualMachine._update_semaphores[key]
+
+    def _limited_update_status(self, auth):
+        """
+        Update the status of this VM respecting the limit of simultaneous updates per cloud provider
+        """
+        semaphore = self._get_update_semaphore()
+        if semaphore:
+            with semaphore:
+                return self.update_status(auth)
+        return self.update_status(auth)
+
+    @staticmethod
+    def update_vms_status(vm_list, auth, timeout=None):
+        """
+        Update the status of a list of VMs in parallel using the shared pool of threads.
+        Args:
+        - vm_list(list of VirtualMachine): VMs to update.
+        - auth(Authentication): parsed authentication tokens.
+        - timeout(int): Max time to wait for the updates (None to wait for all of them).
+          The VMs not updated in time maintain the previous state (the update continues in background).
+        Return:
+        - list of VirtualMachine: VMs whose update has not finished in time.
+        """
+        groups, vm_list = VirtualMachine._group_vms_by_cloud(vm_list)
+
+        if Config.MAX_SIMULTANEOUS_VM_UPDATES <= 1 or len(groups) + len(vm_list) <= 1:
+            for vms in groups:
+                VirtualMachine._update_vms_group(vms, auth)
+            for vm in vm_list:
+                vm.update_status(auth)
+            return []
+
+        pool = VirtualMachine._get_update_pool()
+        futures = {}
+        for vms in groups:
+            futures[pool.submit(VirtualMachine._update_vms_group, vms, auth)] = vms
+        for vm in vm_list:
+            futures[pool.submit(vm._limited_update_status, auth)] = [vm]
+        done, not_done = wait(futures, timeout)
+
+        for future in done:
+            if future.exception():
+                VirtualMachine.logger.error("Error updating VMs status: %s" % future.exception())
+        not_updated = []
+        for future in not_done:
+            not_updated.extend(futures[future])
+        if not_updated:
+            VirtualMachine.logger.warning("Timeout updating the status of %d VMs. Using previous state." %
+                                          len(not_updated))
+        return not_updated
+
+    @staticmethod
+    def _group_vms_by_cloud(vm_list):
+        """
+        Group the VMs to update whose cloud connector can get the info of several VMs with one call.
+        Return: a tuple with the list of groups of VMs of the same cloud provider and the list of other VMs.
+        """
+        groups = {}
+        others = []
+        for vm in vm_list:
+            bulk = False
+            if len(vm_list) > 1 and vm._needs_cloud_update():
+                try:
+                    bulk = type(vm.getCloudConnector()).update_vms_info is not CloudConnector.update_vms_info
+                except Exception:
+                    bulk = False
+            if bulk:
+                key = (vm.cloud.id, vm.cloud.type, vm.cloud.server, vm.cloud.port)
+                groups.setdefault(key, []).append(vm)
+            else:
+                others.append(vm)
+
+        res = []
+        for vms in groups.values():
+            if len(vms) > 1:
+                res.append(vms)
+            else:
+                others.extend(vms)
+        return res, others
+
+    def _get_update_copy(self):
+        """
+        Get a copy of this VM to be updated by the connector without holding the _lock.
+        It must be called with the _lock acquired.
+        """
+        # Parse the RADL info (if needed) before copying the data
+        info = self.info
+        vm_copy = VirtualMachine.__new__(VirtualMachine)
+        vm_copy.__dict__.update(self.__dict__)
+        vm_copy.__dict__['_lazy_data'] = dict(self.__dict__.get('_lazy_data') or {})
+        vm_copy.__dict__['info'] = info.clone() if info else None
+        return vm_copy, dict(vm_copy.__dict__)
+
+    def _apply_update_copy(self, vm_copy, orig_data):
+        """
+        Set in this VM the data modified by the connector in the copy returned by _get_update_copy.
+        It must be called with the _lock acquired.
+        """
+        for name, value in list(vm_copy.__dict__.items()):
+            if not name.startswith("_") and orig_data.get(name, orig_data) is not value:
+                setattr(self, name, value)
+        # The connectors modify the RADL info in place
+        self.__dict__['info'] = vm_copy.info
+
+    @staticmethod
+    def _update_vms_group(vm_list, auth):
+        """
+        Update the status of a list of VMs of the same cloud provider with one call to the connector.
+        The connector updates copies of the VMs, so the locks are not held while waiting for the cloud provider.
+        """
+        to_update = []
+        others = []
+        for vm in vm_list:
+            with vm._lock:
+                if vm._needs_cloud_update():
+                    to_update.append((vm,) + vm._get_update_copy())
+                else:
+                    others.append(vm)
+
+        # Other thread may have updated the VMs in the meanwhile
+        for vm in others:
+            vm.update_status(auth)
+        if not to_update:
+            return
+
+        vm_copies = [vm_copy for _, vm_copy, _ in to_update]
+        semaphore = vm_list[0]._get_update_semaphore()
+        if semaphore:
+            semaphore.acquire()
+        try:
+            results = vm_list[0].getCloudConnector().update_vms_info(vm_copies, auth)
+        except Exception as ex:
+            vm_list[0].log_exception("Error updating VMs status.")
+            results = [(False, "Error updating VMs status: %s" % ex)] * len(vm_copies)
+        finally:
+            if semaphore:
+                semaphore.release()
+
+        for (vm, vm_copy, orig_data), (success, new_vm) in zip(to_update, results):
+            with vm._lock:
+                if success:
+                    vm._apply_update_copy(vm_copy, orig_data)
+                    new_vm = vm
+                vm._update_status(auth, update_result=(success, new_vm))
+
     def replace_dns_name(self, vm_system):
         """Replace the #N# in dns_names."""
         cont = 0
@@ -765,6 +1112,8 @@ class VirtualMachine(LoggerMixin):
                     vm_system.setValue('net_interface.%s.ip' % num_net, str(private_ip))
                 vm_system.setValue('net_interface.%s.connection' % num_net, private_net.id)
 
+        self.changed()
+
     def get_ssh(self, retry=False, auto_close=True):
         """
         Get SSH object to connect with this VM
@@ -781,10 +1130,13 @@ class VirtualMachine(LoggerMixin):
         if ip is None:
             self.log_warn("VM ID %s does not have IP. Do not return SSH Object." % self.im_id)
             return None
+        pool = VirtualMachine.get_ssh_pool()
         if retry:
-            return SSHRetry(ip, user, passwd, private_key, self.getSSHPort(), proxy_host, auto_close=auto_close)
+            return SSHRetry(ip, user, passwd, private_key, self.getSSHPort(), proxy_host, auto_close=auto_close,
+                            pool=pool)
         else:
-            return SSH(ip, user, passwd, private_key, self.getSSHPort(), proxy_host, auto_close=auto_close)
+            return SSH(ip, user, passwd, private_key, self.getSSHPort(), proxy_host, auto_close=auto_close,
+                       pool=pool)
 
     def is_ctxt_process_running(self):
         """ Return the PID of the running process or None if it is not running """
@@ -792,11 +1144,9 @@ class VirtualMachine(LoggerMixin):
 
     def launch_check_ctxt_process(self):
         """
-        Launch the check_ctxt_process as a thread
+        Start checking the ctxt process in the CtxtProcessMonitor
         """
-        t = threading.Thread(target=self.check_ctxt_process)
-        t.daemon = True
-        t.start()
+        CtxtProcessMonitor.add(self)
 
     def kill_check_ctxt_process(self):
         """
@@ -847,86 +1197,57 @@ class VirtualMachine(LoggerMixin):
             self.ctxt_pid = None
             self.configured = False
 
-    def check_ctxt_process(self):
+    def get_ctxt_remote_dir(self):
         """
-        Periodically checks if the PID of the ctxt process is running
+        Get the directory of the master node with the files of the ctxt process of this VM
         """
-        if self.ctxt_pid == self.WAIT_TO_PID:
-            self.ctxt_pid = None
-            self.configured = False
+        ip = self.getPublicIP()
+        if not ip:
+            ip = self.getPrivateIP()
+        return "%s/%s/%s_%s" % (Config.REMOTE_CONF_DIR, self.inf.id, ip, self.im_id)
 
-        ssh = None
-        initial_count_out = self.cont_out
-        wait = 0
+    def get_ctxt_process_outputs(self, ssh, initial_cont_out="", log_offset=0):
+        """
+        Get the log and the outputs of the finished ctxt process.
+        If log_offset is set, the first log_offset bytes of the log have been already
+        appended to the cont_out by update_ctxt_log, so only the rest of the log is read.
+        """
+        remote_dir = self.get_ctxt_remote_dir()
+        ctxt_log = None
+        if log_offset:
+            try:
+                new_log, _ = self.read_ctxt_log(remote_dir, ssh, log_offset)
+                ctxt_log = self.cont_out[len(initial_cont_out):] + new_log
+                ssh.sftp_remove(remote_dir + '/ctxt_agent.log')
+            except Exception:
+                self.log_exception("Error getting the end of the ctxt process log. Get the full log.")
+        if ctxt_log is None:
+            ctxt_log = self.get_ctxt_log(remote_dir, ssh, True)
+        msg = self.get_ctxt_output(remote_dir, ssh, True)
+        if ctxt_log:
+            self.cont_out = initial_cont_out + msg + ctxt_log
+        else:
+            self.cont_out = initial_cont_out + msg + "Error getting contextualization process log."
+        self.ctxt_pid = None
+
+    def update_ctxt_log(self, ssh, initial_cont_out="", log_offset=0):
+        """
+        Get the log of the running ctxt process to update the cont_out dynamically.
+        Only the bytes written after log_offset are read and appended to the cont_out.
+
+        Return: the new offset of the log.
+        """
         try:
-            while self.ctxt_pid:
-                if self.destroy:
-                    # If the VM has been destroyed set pid to None and return
-                    self.log_debug("VM %s deleted. Exit check_ctxt_process thread." % self.im_id)
-                    self.ctxt_pid = None
-                    return None
-
-                ctxt_pid = self.ctxt_pid
-                if ctxt_pid != self.WAIT_TO_PID:
-                    if not ssh:
-                        ssh = self.get_ssh_ansible_master(auto_close=False)
-
-                    try:
-                        self.log_info("Getting status of ctxt process with pid: " + str(ctxt_pid))
-                        (_, _, exit_status) = ssh.execute("ps " + str(ctxt_pid))
-                        self.ssh_connect_errors = 0
-                    except Exception as ex:
-                        self.log_warn("Error getting status of ctxt process with pid: %s. %s" % (ctxt_pid, ex))
-                        exit_status = 0
-                        self.ssh_connect_errors += 1
-                        if self.ssh_connect_errors > Config.MAX_SSH_ERRORS:
-                            self.log_error("Too much errors getting status of ctxt process with pid: " +
-                                           str(ctxt_pid) + ". Forget it.")
-                            self.ssh_connect_errors = 0
-                            self.configured = False
-                            self.ctxt_pid = None
-                            self.cont_out = initial_count_out + ("Too much errors getting the status of ctxt process."
-                                                                 " Check some network connection problems or if user "
-                                                                 "credentials has been changed.")
-                            return None
-
-                    ip = self.getPublicIP()
-                    if not ip:
-                        ip = ip = self.getPrivateIP()
-                    remote_dir = "%s/%s/%s_%s" % (Config.REMOTE_CONF_DIR, self.inf.id, ip, self.im_id)
-
-                    if exit_status != 0:
-                        # The process has finished, get the outputs
-                        self.log_info("The process %s has finished, get the outputs" % ctxt_pid)
-                        ctxt_log = self.get_ctxt_log(remote_dir, ssh, True)
-                        msg = self.get_ctxt_output(remote_dir, ssh, True)
-                        if ctxt_log:
-                            self.cont_out = initial_count_out + msg + ctxt_log
-                        else:
-                            self.cont_out = initial_count_out + msg + \
-                                "Error getting contextualization process log."
-                        self.ctxt_pid = None
-                    else:
-                        # Get the log of the process to update the cont_out
-                        # dynamically
-                        if Config.UPDATE_CTXT_LOG_INTERVAL > 0 and wait > Config.UPDATE_CTXT_LOG_INTERVAL:
-                            wait = 0
-                            self.log_info("Get the log of the ctxt process with pid: " + str(ctxt_pid))
-                            ctxt_log = self.get_ctxt_log(remote_dir, ssh)
-                            self.cont_out = initial_count_out + ctxt_log
-                        # The process is still running, wait
-                        self.log_info("The process %s is still running. wait." % ctxt_pid)
-                        time.sleep(Config.CHECK_CTXT_PROCESS_INTERVAL)
-                        wait += Config.CHECK_CTXT_PROCESS_INTERVAL
-                else:
-                    # We are waiting the PID, sleep
-                    time.sleep(Config.CHECK_CTXT_PROCESS_INTERVAL)
-        except Exception as gex:
-            self.log_warn("Error getting status of ctxt process with pid: %s. %s" % (self.ctxt_pid, gex))
-        finally:
-            if ssh:
-                ssh.close()
-        return self.ctxt_pid
+            new_log, new_offset = self.read_ctxt_log(self.get_ctxt_remote_dir(), ssh, log_offset)
+        except Exception as ex:
+            self.log_warn("Error getting the ctxt process log: %s" % ex)
+            return log_offset
+
+        if log_offset:
+            self.cont_out += new_log
+        else:
+            self.cont_out = initial_cont_out + new_log
+        return new_offset
 
     def is_configured(self):
         if self.inf.is_configured() is False:
@@ -939,6 +1260,22 @@ class VirtualMachine(LoggerMixin):
                 # Otherwise return the value of configured
                 return self.configured
 
+    @staticmethod
+    def sanitize_ctxt_log(data):
+        """
+        Remove the non printable chars of the log of the ctxt process
+        """
+        return bytes(data).translate(None, VirtualMachine.NON_PRINTABLE_CHARS).decode("ascii")
+
+    def read_ctxt_log(self, remote_dir, ssh, offset=0):
+        """
+        Read the log of the ctxt process from an offset.
+
+        Return: a tuple with the new contents of the log and the new offset.
+        """
+        data = ssh.sftp_read(remote_dir + '/ctxt_agent.log', offset)
+        return self.sanitize_ctxt_log(data), offset + len(data)
+
     def get_ctxt_log(self, remote_dir, ssh, delete=False):
         tmp_dir = tempfile.mkdtemp()
 
@@ -948,16 +1285,9 @@ class VirtualMachine(LoggerMixin):
             self.log_debug("Get File: " + remote_dir + '/ctxt_agent.log')
             ssh.sftp_get(remote_dir + '/ctxt_agent.log', tmp_dir + '/ctxt_agent.log')
 
-            # patch for support python2 and avoid UnicodeDecodeError in python3
-            if sys.version_info[0] < 3:
-                open_args = {}
-            else:
-                open_args = {'encoding': 'utf-8'}
-
-            with open(tmp_dir + '/ctxt_agent.log', **open_args) as f:
+            with open(tmp_dir + '/ctxt_agent.log', 'rb') as f:
                 # Read removing problematic chars
-                conf_out = str("".join(list(filter(lambda x: x in string.printable,
-                                                   f.read()))).encode("ascii", "replace").decode("utf-8"))
+                conf_out = self.sanitize_ctxt_log(f.read())
             try:
                 if delete:
                     ssh.sftp_remove(remote_dir + '/ctxt_agent.log')
@@ -1029,6 +1359,7 @@ class VirtualMachine(LoggerMixin):
         """
         if 'CHANGE_CREDS' in ctxt_agent_out and ctxt_agent_out['CHANGE_CREDS']:
             self.info.systems[0].updateNewCredentialValues()
+            self.changed()
 
         if 'OK' in ctxt_agent_out and ctxt_agent_out['OK']:
             self.configured = True
@@ -1055,10 +1386,11 @@ class VirtualMachine(LoggerMixin):
         ansible_host = self.get_ansible_host()
         if ansible_host:
             (user, passwd, private_key) = ansible_host.getCredentialValues()
+            pool = VirtualMachine.get_ssh_pool()
             if retry:
-                return SSHRetry(ansible_host.getHost(), user, passwd, private_key, auto_close=auto_close)
+                return SSHRetry(ansible_host.getHost(), user, passwd, private_key, auto_close=auto_close, pool=pool)
             else:
-                return SSH(ansible_host.getHost(), user, passwd, private_key, auto_close=auto_close)
+                return SSH(ansible_host.getHost(), user, passwd, private_key, auto_close=auto_close, pool=pool)
         else:
             if self.inf.vm_master:
                 return self.inf.vm_master.get_ssh(retry=retry, auto_close=auto_close)
@@ -35,6 +35,15 @@ class Authentication:
         - auth_data(list of dicts or :py:class:`IM.Authentication`): Data to initialize the Authentication object
     """
 
+    checked = False
+    """Flag set when the credentials have been validated by the InfrastructureManager."""
+
+    cache_key = None
+    """Digest of the raw auth data used to cache the validated credentials."""
+
+    authorized_inf = None
+    """Infrastructure already loaded and authorized with these credentials, to reuse it in the same request."""
+
     def __init__(self, auth_data):
         if isinstance(auth_data, Authentication):
             self.auth_list = auth_data.auth_list
@@ -73,7 +73,20 @@ class Config:
     RECIPES_DB_FILE = CONTEXTUALIZATION_DIR + '/recipes_ansible.db'
     MAX_CONTEXTUALIZATION_TIME = 7200
     MAX_SIMULTANEOUS_LAUNCHES = 1
+    REQUEST_LANES = {}
+    REQUEST_QUEUE_MAX_SIZE = 0
+    REQUEST_PRIORITIES = {}
+    REQUEST_PRIORITY_AGING = 10
     DATA_DB = '/etc/im/inf.dat'
+    DB_POOL_MIN_SIZE = 1
+    DB_POOL_MAX_SIZE = 10
+    DB_POOL_MAX_IDLE_TIME = 300
+    DB_POOL_CHECK_INTERVAL = 30
+    DB_POOL_TIMEOUT = 30
+    DB_SAVE_DELAY = 0
+    DB_SAVE_MAX_PENDING = 100
+    CONTMSG_STORE = False
+    CONTMSG_MAX_SIZE = 1048576
     XMLRCP_SSL = False
     XMLRCP_SSL_KEYFILE = "/etc/im/pki/server-key.pem"
     XMLRCP_SSL_CERTFILE = "/etc/im/pki/server-cert.pem"
@@ -82,10 +95,38 @@ class Config:
     REST_SSL_KEYFILE = "/etc/im/pki/server-key.pem"
     REST_SSL_CERTFILE = "/etc/im/pki/server-cert.pem"
     REST_SSL_CA_CERTS = "/etc/im/pki/ca-chain.pem"
+    REST_MIN_THREADS = 10
+    REST_MAX_THREADS = 0
+    REST_REQUEST_QUEUE_SIZE = 32
+    REST_ACCEPTED_QUEUE_SIZE = -1
+    REST_ACCEPTED_QUEUE_TIMEOUT = 10
+    REST_TIMEOUT = 10
+    REST_KEEP_ALIVE_CONN_LIMIT = 10
+    REST_SSL_SESSION_TIMEOUT = 300
+    REST_PROCESSES = 1
+    REST_COMPRESS_MIN_SIZE = 4096
+    REST_STREAM_CHUNK_SIZE = 65536
+    REST_LONG_POLL_MAX_WAIT = 60
+    REST_LONG_POLL_MAX_CLIENTS = 5
+    REST_BATCH_MAX_OPERATIONS = 100
+    REST_BATCH_THREADS = 10
     PLAYBOOK_RETRIES = 1
     VM_INFO_UPDATE_FREQUENCY = 10
     # This value must be always higher than VM_INFO_UPDATE_FREQUENCY
     VM_INFO_UPDATE_ERROR_GRACE_PERIOD = 120
+    MAX_SIMULTANEOUS_VM_UPDATES = 1
+    MAX_SIMULTANEOUS_VM_UPDATES_PER_CLOUD = 0
+    SSH_POOL = False
+    SSH_POOL_MAX_CHANNELS = 8
+    SSH_POOL_MAX_SESSIONS_PER_HOST = 2
+    SSH_POOL_IDLE_TIME = 300
+    SSH_POOL_KEEPALIVE = 30
+    VM_INFO_UPDATE_TIMEOUT = 0
+    VM_STATE_POLLER = False
+    VM_STATE_POLLER_FAST_INTERVAL = 10
+    VM_STATE_POLLER_SLOW_INTERVAL = 120
+    VM_STATE_POLLER_JITTER = 10
+    VM_STATE_POLLER_IDLE_TIME = 600
     REMOTE_CONF_DIR = "/var/tmp/.im"
     MAX_SSH_ERRORS = 5
     PRIVATE_NET_MASKS = ["10.0.0.0/8", "172.16.0.0/12", "192.168.0.0/16",
@@ -93,6 +134,8 @@ class Config:
     CHECK_CTXT_PROCESS_INTERVAL = 10
     CONFMAMAGER_CHECK_STATE_INTERVAL = 5
     UPDATE_CTXT_LOG_INTERVAL = 20
+    CHECK_CTXT_PROCESS_MAX_INTERVAL = 60
+    CTXT_PROCESS_MONITOR_THREADS = 10
     ANSIBLE_INSTALL_TIMEOUT = 500
     SINGLE_SITE = False
     SINGLE_SITE_TYPE = ''
@@ -101,12 +144,23 @@ class Config:
     OIDC_ISSUERS = []
     OIDC_AUDIENCE = None
     INF_CACHE_TIME = 0
+    INF_CACHE_MAX_SIZE = 0
+    INF_CACHE_MAX_BYTES = 0
     VMINFO_JSON = False
     OIDC_CLIENT_ID = None
     OIDC_CLIENT_SECRET = None
     OIDC_SCOPES = []
     OIDC_USER_INFO_PATH = "/userinfo"
     OIDC_INSTROSPECT_PATH = "/introspect"
+    OIDC_CACHE_TIME = 0
+    OIDC_CACHE_NEGATIVE_TIME = 0
+    OIDC_CACHE_MAX_SIZE = 1000
+    AUTH_CACHE_TIME = 0
+    AUTH_CACHE_MAX_SIZE = 1000
+    VAULT_CACHE_TIME = 0
+    APPDB_CACHE_TIME = 0
+    OIDC_CONFIG_CACHE_TIME = 3600
+    OIDC_VERIFY_TOKEN = False
     VM_NUM_USE_CTXT_DIST = 30
     DELAY_BETWEEN_VM_RETRIES = 5
     VERIFI_SSL = False
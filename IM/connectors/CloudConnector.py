@@ -135,6 +135,26 @@ class CloudConnector(LoggerMixin):
 
         raise NotImplementedError("Should have implemented this")
 
+    def update_vms_info(self, vms, auth_data):
+        """
+        Updates the information of a list of VMs of this cloud provider.
+        Connectors able to get the info of several VMs with one call should override it.
+
+        Arguments:
+           - vms(list of :py:class:`IM.VirtualMachine`): VMs to update.
+           - auth_data(:py:class:`dict` of str objects): Authentication data to access cloud provider.
+
+        Returns: a list with a tuple (success, vm) per each VM (in the same order), as returned by updateVMInfo.
+        """
+        res = []
+        for vm in vms:
+            try:
+                res.append(self.updateVMInfo(vm, auth_data))
+            except Exception as ex:
+                self.log_exception("Error updating VM status.")
+                res.append((False, "Error updating VM status: %s" % ex))
+        return res
+
     def alterVM(self, vm, radl, auth_data):
         """
         Modifies the features of a VM
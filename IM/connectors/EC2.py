@@ -37,6 +37,7 @@ from .CloudConnector import CloudConnector
 from radl.radl import Feature
 from IM.config import Config
 from IM.SSH import SSH
+from IM import get_ex_error
 
 
 class InstanceTypeInfo:
@@ -1206,11 +1207,68 @@ class EC2CloudConnector(CloudConnector):
                 return (True, vm)
 
         instance = self.get_instance_by_id(instance_id, region, auth_data)
+        return self._update_vm_from_instance(vm, instance, instance_id, conn, auth_data)
+
+    def update_vms_info(self, vms, auth_data):
+        # Get all the instances of each region with one call
+        res = [None] * len(vms)
+        region_vms = {}
+        for num, vm in enumerate(vms):
+            region, instance_id = vm.id.split(";")
+            if instance_id[0] == "s":
+                # spot requests are checked one by one
+                res[num] = self._update_vm_info(vm, auth_data)
+            else:
+                region_vms.setdefault(region, []).append((num, vm, instance_id))
+
+        for region, vm_list in region_vms.items():
+            conn = None
+            instances = None
+            try:
+                # Use the connectors of the VMs as they cache the connection to its region
+                conn = vm_list[0][1].getCloudConnector().get_connection(region, auth_data)
+                instances = {}
+                for reservation in conn.get_all_instances([instance_id for _, _, instance_id in vm_list]):
+                    for instance in reservation.instances:
+                        instances[instance.id] = instance
+            except Exception:
+                # Some of the instances may not exist, get them one by one
+                self.log_exception("Error getting the instances of region %s. Getting them one by one." % region)
+                instances = None
+
+            for num, vm, instance_id in vm_list:
+                if instances is None:
+                    res[num] = self._update_vm_info(vm, auth_data)
+                else:
+                    try:
+                        res[num] = vm.getCloudConnector()._update_vm_from_instance(vm, instances.get(instance_id),
+                                                                                   instance_id, conn, auth_data,
+                                                                                   refresh=False)
+                    except Exception as ex:
+                        self.log_exception("Error updating VM status.")
+                        res[num] = (False, "Error updating VM status: %s" % get_ex_error(ex))
+        return res
+
+    def _update_vm_info(self, vm, auth_data):
+        """
+        Update the information of one VM with its connector, returning the error instead of raising it
+        """
+        try:
+            return vm.getCloudConnector().updateVMInfo(vm, auth_data)
+        except Exception as ex:
+            self.log_exception("Error updating VM status.")
+            return (False, "Error updating VM status: %s" % get_ex_error(ex))
+
+    def _update_vm_from_instance(self, vm, instance, instance_id, conn, auth_data, refresh=True):
+        """
+        Update the information of a VM with the data of the EC2 instance
+        """
         if instance:
             try:
-                # sometime if you try to update a recently created instance
-                # this operation fails
-                instance.update()
+                if refresh:
+                    # sometime if you try to update a recently created instance
+                    # this operation fails
+                    instance.update()
                 if "IM-USER" not in instance.tags:
                     im_username = "im_user"
                     if auth_data.getAuthInfo('InfrastructureManager'):
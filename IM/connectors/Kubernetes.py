@@ -452,16 +452,47 @@ class KubernetesCloudConnector(CloudConnector):
     def updateVMInfo(self, vm, auth_data):
         success, status, output = self._get_pod(vm, auth_data)
         if success:
-            output = json.loads(output)
-            vm.state = self.VM_STATE_MAP.get(output["status"]["phase"], VirtualMachine.UNKNOWN)
-
-            # Update the network info
-            self.setIPs(vm, output)
-            return (True, vm)
+            return self._update_vm_from_pod(vm, json.loads(output))
         else:
             self.log_error("Error getting info about the POD: code: %s, msg: %s" % (status, output))
             return (False, "Error getting info about the POD: code: %s, msg: %s" % (status, output))
 
+    def update_vms_info(self, vms, auth_data):
+        # Get all the PODs of each namespace with one call
+        pods = {}
+        for namespace in set([vm.inf.id for vm in vms]):
+            try:
+                uri = self._get_api_url(auth_data, namespace, "/pods")
+                resp = self.create_request('GET', uri, auth_data)
+                if resp.status_code == 200:
+                    for pod_info in json.loads(resp.text)["items"]:
+                        pods[(namespace, pod_info["metadata"]["name"])] = pod_info
+                else:
+                    self.log_warn("Error getting the PODs of namespace %s: code: %s, msg: %s" %
+                                  (namespace, resp.status_code, resp.text))
+            except Exception:
+                self.log_exception("Error getting the PODs of namespace %s" % namespace)
+
+        res = []
+        for vm in vms:
+            pod_info = pods.get((vm.inf.id, vm.id))
+            if pod_info:
+                res.append(self._update_vm_from_pod(vm, pod_info))
+            else:
+                # Get it alone to get the correct error message
+                res.append(self.updateVMInfo(vm, auth_data))
+        return res
+
+    def _update_vm_from_pod(self, vm, pod_info):
+        """
+        Update the information of a VM with the data of the POD
+        """
+        vm.state = self.VM_STATE_MAP.get(pod_info["status"]["phase"], VirtualMachine.UNKNOWN)
+
+        # Update the network info
+        self.setIPs(vm, pod_info)
+        return (True, vm)
+
     def setIPs(self, vm, pod_info):
         """
         Adapt the RADL information of the VM to the real IPs assigned by the cloud provider
@@ -523,6 +523,48 @@ class OpenStackCloudConnector(LibCloudCloudConnector):
 
     def updateVMInfo(self, vm, auth_data):
         node = self.get_node_with_id(vm.id, auth_data)
+        return self._update_vm_from_node(vm, node, auth_data)
+
+    def update_vms_info(self, vms, auth_data):
+        # Get all the nodes with one call
+        nodes = None
+        try:
+            driver = self.get_driver(auth_data)
+            nodes = {}
+            for node in driver.list_nodes():
+                nodes[node.id] = node
+            # for old infras add cloud extra fields
+            if not self.cloud.extra:
+                CloudInfo.add_extra_fields(auth_data.getAuthInfo(self.type, self.cloud.server)[0], self.cloud)
+        except Exception as ex:
+            self.log_warn("Error listing the nodes: %s. Updating the VMs one by one." % get_ex_error(ex))
+            nodes = None
+
+        res = []
+        sizes = {}
+        for vm in vms:
+            try:
+                if nodes is None:
+                    res.append(self.updateVMInfo(vm, auth_data))
+                    continue
+                node = nodes.get(vm.id)
+                if not node:
+                    # It may not be included in the list (e.g. paginated results or deleted)
+                    self.log_debug("VM %s not found in the list of nodes. Getting it alone." % vm.id)
+                    node = self.get_node_with_id(vm.id, auth_data)
+                res.append(self._update_vm_from_node(vm, node, auth_data, sizes))
+            except Exception as ex:
+                self.log_exception("Error updating VM status.")
+                res.append((False, "Error updating VM status: %s" % get_ex_error(ex)))
+        return res
+
+    def _update_vm_from_node(self, vm, node, auth_data, sizes=None):
+        """
+        Update the information of a VM with the data of the node.
+        The sizes dict is used to cache the flavors already requested.
+        """
+        if sizes is None:
+            sizes = {}
         if node:
             vm.state = self.VM_STATE_MAP.get(node.state, VirtualMachine.UNKNOWN)
 
@@ -534,7 +576,9 @@ class OpenStackCloudConnector(LibCloudCloudConnector):
 
             try:
                 flavorId = node.extra['flavorId']
-                if flavorId:
+                if flavorId and flavorId in sizes:
+                    instance_type = sizes[flavorId]
+                elif flavorId:
                     instance_type = node.driver.ex_get_size(flavorId)
                     if len(instance_type.extra) == 0:
                         try:
@@ -542,6 +586,7 @@ class OpenStackCloudConnector(LibCloudCloudConnector):
                             instance_type.extra = node.driver.ex_get_size_extra_specs(instance_type.id)
                         except Exception:
                             self.log_exception("Error trying to get flavor '%s' extra_specs." % instance_type.id)
+                    sizes[flavorId] = instance_type
                 elif node.extra['flavor_details']:
                     fdetails = node.extra['flavor_details']
                     instance_type = OpenStackNodeSize("id", fdetails.get("original_name"),
@@ -16,6 +16,8 @@
 
 """Class to manage DB operations"""
 import time
+import threading
+import logging
 
 try:
     from urlparse import urlparse
@@ -56,6 +58,8 @@ try:
 except Exception:
     MONGO_AVAILABLE = False
 
+from IM.config import Config
+
 
 # Class to manage DB operations
 class DataBase:
@@ -69,10 +73,14 @@ class DataBase:
     SQLITE = "SQLite"
     DB_TYPES = [MYSQL, SQLITE]
 
-    def __init__(self, db_url):
+    def __init__(self, db_url, pooled=False):
         self.db_url = db_url
         self.connection = None
         self.db_type = None
+        self.pooled = pooled
+        """Flag to get the connection from the shared :py:class:`DataBasePool` of this URL."""
+        self._pooled_db = None
+        self._broken = False
 
     def connect(self):
         """ Function to connect to the DB
@@ -80,6 +88,23 @@ class DataBase:
             Returns: True if the connection is established correctly
                      of False in case of errors.
         """
+        if self.pooled:
+            return self._connect_pool()
+        return self._connect()
+
+    def _connect_pool(self):
+        """ Get a connection from the shared pool of this DB URL """
+        if self._pooled_db:
+            return True
+        self._pooled_db = DataBasePool.get_pool(self.db_url).get()
+        if self._pooled_db is None:
+            return False
+        self.connection = self._pooled_db.connection
+        self.db_type = self._pooled_db.db_type
+        self._broken = False
+        return True
+
+    def _connect(self):
         uri = urlparse(self.db_url)
         protocol = uri[0]
         if protocol == "mongodb":
@@ -136,20 +161,27 @@ class DataBase:
 
     def _connect_sqlite(self, db_filename):
         if SQLITE_AVAILABLE:
-            self.connection = sqlite.connect(db_filename)
+            if SQLITE3_AVAILABLE:
+                # Pooled connections may be used by different threads (but never at the same time)
+                self.connection = sqlite.connect(db_filename, check_same_thread=False)
+            else:
+                self.connection = sqlite.connect(db_filename)
             self.db_type = DataBase.SQLITE
             return True
         else:
             return False
 
-    def _execute_retry(self, sql, args, fetch=False):
+    def _execute_retry(self, sql, args, fetch=False, many=False):
         """ Function to execute a SQL function, retrying in case of locked DB
 
             Arguments:
-            - sql: The SQL sentence
+            - sql: The SQL sentence or a list of tuples (sql, args) to execute in the same transaction
             - args: A List of arguments to substitute in the SQL sentence
             - fetch: If the function must fetch the results.
                     (Optional, default False)
+            - many: If args is a list of lists of arguments to execute the
+                    sentence once per element in the same transaction.
+                    (Optional, default False)
 
             Returns: True if fetch is False and the operation is performed
                      correctly or a list with the "Fetch" of the results
@@ -162,17 +194,25 @@ class DataBase:
             while retries_cont < self.MAX_RETRIES:
                 try:
                     cursor = self.connection.cursor()
-                    if args is not None:
-                        if self.db_type == DataBase.SQLITE:
-                            new_sql = sql.replace("%s", "?").replace("now()", "date('now')")
-                        elif self.db_type == DataBase.MYSQL:
-                            new_sql = sql.replace("?", "%s")
-                        cursor.execute(new_sql, args)
-                    else:
-                        cursor.execute(sql)
+                    sentences = sql if isinstance(sql, list) else [(sql, args)]
+                    for sentence, sentence_args in sentences:
+                        if sentence_args is not None:
+                            if self.db_type == DataBase.SQLITE:
+                                new_sql = sentence.replace("%s", "?").replace("now()", "date('now')")
+                            elif self.db_type == DataBase.MYSQL:
+                                new_sql = sentence.replace("?", "%s")
+                            if many:
+                                cursor.executemany(new_sql, sentence_args)
+                            else:
+                                cursor.execute(new_sql, sentence_args)
+                        else:
+                            cursor.execute(sentence)
 
                     if fetch:
                         res = list(cursor.fetchall())
+                        if self.pooled and self.db_type == DataBase.MYSQL:
+                            # End the transaction to avoid getting old snapshots in the next reads
+                            self.connection.commit()
                     else:
                         self.connection.commit()
                         res = True
@@ -181,6 +221,8 @@ class DataBase:
                 except sqlite.OperationalError as ex:
                     if str(ex).lower() == 'database is locked':
                         retries_cont += 1
+                        # discard the sentences already executed in the transaction
+                        self.connection.rollback()
                         # release the connection
                         self.close()
                         time.sleep(self.RETRY_SLEEP)
@@ -189,7 +231,13 @@ class DataBase:
                     else:
                         raise ex
                 except sqlite.IntegrityError:
+                    # discard the sentences already executed in the transaction
+                    self.connection.rollback()
                     raise IntegrityError()
+                except Exception:
+                    # Do not return a possibly broken connection to the pool
+                    self._broken = True
+                    raise
 
     def execute(self, sql, args=None):
         """ Executes a SQL sentence without returning results
@@ -205,6 +253,38 @@ class DataBase:
             raise Exception("Operation not supported in MongoDB")
         return self._execute_retry(sql, args)
 
+    def executemany(self, sql, args_list):
+        """ Executes a SQL sentence once per each element of args_list in one transaction
+
+            Arguments:
+            - sql: The SQL sentence
+            - args_list: A List of lists of arguments to substitute in the SQL sentence
+
+            Returns: True if the operation is performed correctly
+        """
+        if self.db_type == DataBase.MONGO:
+            raise Exception("Operation not supported in MongoDB")
+        if not args_list:
+            return True
+        return self._execute_retry(sql, args_list, many=True)
+
+    def executemany_transaction(self, sentences):
+        """ Executes several SQL sentences, each one once per each element of its list of arguments,
+            in one transaction
+
+            Arguments:
+            - sentences: A List of tuples (sql, args_list). If args_list is None
+                         the sentence is executed once without arguments.
+
+            Returns: True if the operation is performed correctly
+        """
+        if self.db_type == DataBase.MONGO:
+            raise Exception("Operation not supported in MongoDB")
+        sentences = [(sql, args_list) for sql, args_list in sentences if args_list is None or args_list]
+        if not sentences:
+            return True
+        return self._execute_retry(sentences, None, many=True)
+
     def select(self, sql, args=None):
         """ Executes a SQL sentence that returns results
 
@@ -219,8 +299,33 @@ class DataBase:
             raise Exception("Operation not supported in MongoDB")
         return self._execute_retry(sql, args, fetch=True)
 
+    def ping(self):
+        """ Checks that the DB connection is alive
+
+            Returns: True if the connection is usable or False otherwise
+        """
+        if self.connection is None:
+            return False
+        try:
+            if self.db_type == DataBase.MONGO:
+                self.connection.client.admin.command('ping')
+            elif self.db_type == DataBase.MYSQL:
+                self.connection.ping()
+            else:
+                self.connection.cursor().execute("select 1")
+            return True
+        except Exception:
+            return False
+
     def close(self):
         """ Closes the DB connection """
+        if self.pooled:
+            if self._pooled_db is None:
+                return False
+            DataBasePool.get_pool(self.db_url).put(self._pooled_db, self._broken)
+            self._pooled_db = None
+            self.connection = None
+            return True
         if self.connection is None:
             return False
         else:
@@ -281,6 +386,29 @@ class DataBase:
             res = self.connection[table_name].replace_one(filt, replacement, True)
             return res.modified_count == 1 or res.upserted_id is not None
 
+    def create_index(self, table_name, field):
+        """ create an index over a field (if it does not exist) """
+        if self.db_type != DataBase.MONGO:
+            raise Exception("Operation only supported in MongoDB")
+
+        if self.connection is None:
+            raise Exception("DataBase object not connected")
+        else:
+            return self.connection[table_name].create_index(field)
+
+    def index_exists(self, table_name, field):
+        """ checks if an index over a field exists """
+        if self.db_type != DataBase.MONGO:
+            raise Exception("Operation only supported in MongoDB")
+
+        if self.connection is None:
+            raise Exception("DataBase object not connected")
+        else:
+            for index in self.connection[table_name].index_information().values():
+                if field in [key for key, _ in index['key']]:
+                    return True
+            return False
+
     def delete(self, table_name, filt):
         """ delete elements """
         if self.db_type != DataBase.MONGO:
@@ -292,6 +420,175 @@ class DataBase:
             return self.connection[table_name].delete_many(filt).deleted_count
 
 
+class DataBasePool:
+    """
+    Thread-safe pool of long-lived connections to the same DB URL.
+
+    Connections are created on demand up to ``max_size``, idle ones are closed
+    after ``max_idle_time`` seconds (keeping at least ``min_size`` open) and the
+    ones idle for more than ``check_interval`` seconds are checked before being
+    returned. Broken connections are discarded and a new one is created.
+    """
+
+    logger = logging.getLogger('InfrastructureManager')
+    """Logger object."""
+
+    _pools = {}
+    """Map from DB URL to :py:class:`DataBasePool`."""
+
+    _pools_lock = threading.Lock()
+    """Threading Lock to avoid concurrency problems creating the pools."""
+
+    def __init__(self, db_url, min_size=1, max_size=10, max_idle_time=300, check_interval=30, timeout=30):
+        self.db_url = db_url
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.max_idle_time = max_idle_time
+        self.check_interval = check_interval
+        self.timeout = timeout
+        self._idle = []
+        """List of tuples (DataBase, time of the last use) of the connections not in use."""
+        self._size = 0
+        """Number of connections currently open (idle or in use)."""
+        self._cond = threading.Condition()
+        self.stats = {"created": 0, "reused": 0, "discarded": 0, "evicted": 0, "waits": 0}
+        """Counters of the pool operations."""
+
+    @staticmethod
+    def get_pool(db_url):
+        """ Get (or create) the pool associated to a DB URL """
+        with DataBasePool._pools_lock:
+            if db_url not in DataBasePool._pools:
+                DataBasePool._pools[db_url] = DataBasePool(db_url,
+                                                           Config.DB_POOL_MIN_SIZE,
+                                                           Config.DB_POOL_MAX_SIZE,
+                                                           Config.DB_POOL_MAX_IDLE_TIME,
+                                                           Config.DB_POOL_CHECK_INTERVAL,
+                                                           Config.DB_POOL_TIMEOUT)
+            return DataBasePool._pools[db_url]
+
+    @staticmethod
+    def close_pools():
+        """ Close all the connections of all the pools """
+        with DataBasePool._pools_lock:
+            pools = list(DataBasePool._pools.values())
+            DataBasePool._pools = {}
+        for pool in pools:
+            pool.close_all()
+
+    def _new_connection(self):
+        db = DataBase(self.db_url)
+        try:
+            if db.connect():
+                with self._cond:
+                    self.stats["created"] += 1
+                return db
+            self.logger.error("Error creating a new DB connection to the pool.")
+        except Exception:
+            self.logger.exception("Error creating a new DB connection to the pool.")
+        return None
+
+    def _evict_idle(self, now):
+        """ Close the connections idle for too long. Must be called with the lock acquired """
+        to_close = []
+        while len(self._idle) > 0 and self._size - len(to_close) > self.min_size:
+            db, last_use = self._idle[0]
+            if now - last_use <= self.max_idle_time:
+                break
+            to_close.append(db)
+            self._idle.pop(0)
+        self._size -= len(to_close)
+        self.stats["evicted"] += len(to_close)
+        return to_close
+
+    def get(self, timeout=None):
+        """
+        Get a connected :py:class:`DataBase` from the pool.
+        If all the connections are in use and the max size has been reached it waits
+        up to timeout secs for one to be released.
+
+        Returns: a connected DataBase object or None in case of error or timeout.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        deadline = time.time() + timeout
+        while True:
+            with self._cond:
+                to_close = self._evict_idle(time.time())
+                db = None
+                last_use = None
+                create = False
+                if self._idle:
+                    # Use the most recently used one (LIFO), so the rest can be evicted
+                    db, last_use = self._idle.pop()
+                elif self._size < self.max_size:
+                    self._size += 1
+                    create = True
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self.logger.error("Timeout waiting for a free DB connection in the pool.")
+                        return None
+                    self.stats["waits"] += 1
+                    self._cond.wait(remaining)
+                    continue
+
+            for elem in to_close:
+                elem.close()
+
+            if create:
+                db = self._new_connection()
+                if db is None:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                return db
+
+            if time.time() - last_use < self.check_interval or db.ping():
+                with self._cond:
+                    self.stats["reused"] += 1
+                return db
+
+            # The connection is not alive, discard it and try again
+            self.logger.warning("Discarding broken DB connection from the pool.")
+            self._discard(db)
+
+    def put(self, db, broken=False):
+        """ Return a connection to the pool. If broken is True the connection is discarded """
+        if broken:
+            self._discard(db)
+        else:
+            with self._cond:
+                self._idle.append((db, time.time()))
+                self._cond.notify()
+
+    def _discard(self, db):
+        db.close()
+        with self._cond:
+            self._size -= 1
+            self.stats["discarded"] += 1
+            self._cond.notify()
+
+    def close_all(self):
+        """ Close all the idle connections of the pool """
+        with self._cond:
+            to_close = [db for db, _ in self._idle]
+            self._idle = []
+            self._size -= len(to_close)
+        for db in to_close:
+            db.close()
+
+    def size(self):
+        """ Get the number of open connections and the number of idle ones """
+        with self._cond:
+            return self._size, len(self._idle)
+
+    def get_stats(self):
+        """ Get a copy of the counters of the pool operations """
+        with self._cond:
+            return dict(self.stats)
+
+
 try:
     class IntegrityError(sqlite.IntegrityError):
         """ Class to return IntegrityError independently of the DB used"""
@@ -20,6 +20,11 @@ import json
 import base64
 import re
 
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+
 
 class JWT(object):
 
@@ -71,3 +76,62 @@ class JWT(object):
         part = tuple(token.encode("utf-8").split(b"."))
         part = [JWT.b64d(p) for p in part]
         return json.loads(part[1].decode("utf-8"))
+
+    @staticmethod
+    def get_header(token):
+        """
+        Returns the JSON decoded header of a JWT (part 0)
+
+        :param token: The JWT token
+        """
+        part = token.encode("utf-8").split(b".")[0]
+        return json.loads(JWT.b64d(part).decode("utf-8"))
+
+    @staticmethod
+    def _b64_to_int(value):
+        return int.from_bytes(JWT.b64d(value.encode("utf-8")), "big")
+
+    @staticmethod
+    def get_public_key(jwk):
+        """
+        Get the public key of a JSON Web Key (only RSA and EC P-256 keys are supported)
+
+        :param jwk: dict with the JWK data
+        """
+        if jwk.get("kty") == "RSA":
+            return rsa.RSAPublicNumbers(JWT._b64_to_int(jwk["e"]), JWT._b64_to_int(jwk["n"])).public_key()
+        elif jwk.get("kty") == "EC" and jwk.get("crv") == "P-256":
+            return ec.EllipticCurvePublicNumbers(JWT._b64_to_int(jwk["x"]), JWT._b64_to_int(jwk["y"]),
+                                                 ec.SECP256R1()).public_key()
+        else:
+            raise Exception("Key type not supported: %s" % jwk.get("kty"))
+
+    @staticmethod
+    def verify(token, jwk):
+        """
+        Verifies the signature of a JWT with the specified JSON Web Key (RS256 and ES256 algorithms supported),
+        returning the token info if it is valid. Raises Exception otherwise.
+
+        :param token: The JWT token
+        :param jwk: dict with the JWK data
+        """
+        header = JWT.get_header(token)
+        signing_input, signature = token.encode("utf-8").rsplit(b".", 1)
+        signature = JWT.b64d(signature)
+        key = JWT.get_public_key(jwk)
+
+        try:
+            if header.get("alg") == "RS256" and isinstance(key, rsa.RSAPublicKey):
+                key.verify(signature, signing_input, padding.PKCS1v15(), hashes.SHA256())
+            elif header.get("alg") == "ES256" and isinstance(key, ec.EllipticCurvePublicKey):
+                if len(signature) != 64:
+                    raise Exception("Invalid ES256 signature length")
+                der_signature = encode_dss_signature(int.from_bytes(signature[:32], "big"),
+                                                     int.from_bytes(signature[32:], "big"))
+                key.verify(der_signature, signing_input, ec.ECDSA(hashes.SHA256()))
+            else:
+                raise Exception("Algorithm %s not supported with key type %s" % (header.get("alg"), jwk.get("kty")))
+        except InvalidSignature:
+            raise Exception("Invalid token signature")
+
+        return JWT.get_info(token)
@@ -25,12 +25,19 @@ from .JWT import JWT
 class OpenIDClient(object):
 
     ISSUER_CONFIG_CACHE = {}
+    ISSUER_CONFIG_CACHE_TIME = 3600
+    _ISSUER_CONFIG_UPDATE = {}
+    JWKS_CACHE = {}
+    JWKS_MIN_REFRESH_TIME = 60
+    _JWKS_UPDATE = {}
 
     @staticmethod
     def get_openid_configuration(iss, verify_ssl=False):
         try:
             if iss in OpenIDClient.ISSUER_CONFIG_CACHE:
-                return OpenIDClient.ISSUER_CONFIG_CACHE[iss]
+                last_update = OpenIDClient._ISSUER_CONFIG_UPDATE.get(iss, 0)
+                if time.time() - last_update < OpenIDClient.ISSUER_CONFIG_CACHE_TIME:
+                    return OpenIDClient.ISSUER_CONFIG_CACHE[iss]
             url = "%s/.well-known/openid-configuration" % iss
             resp = requests.request("GET", url, verify=verify_ssl)
             if resp.status_code != 200:
@@ -38,10 +45,62 @@ class OpenIDClient(object):
             # Only store currently needed data
             OpenIDClient.ISSUER_CONFIG_CACHE[iss] = {"userinfo_endpoint": resp.json()["userinfo_endpoint"],
                                                      "introspection_endpoint": resp.json()["introspection_endpoint"]}
+            if resp.json().get("jwks_uri"):
+                OpenIDClient.ISSUER_CONFIG_CACHE[iss]["jwks_uri"] = resp.json()["jwks_uri"]
+            OpenIDClient._ISSUER_CONFIG_UPDATE[iss] = time.time()
             return resp.json()
         except Exception as ex:
             return {"error": str(ex)}
 
+    @staticmethod
+    def get_jwks(iss, verify_ssl=False, refresh=False):
+        """
+        Get the JSON Web Keys of an issuer indexed by kid. They are cached ISSUER_CONFIG_CACHE_TIME secs.
+        If refresh is set they are downloaded again (e.g. in case of key rotation),
+        but not more than once every JWKS_MIN_REFRESH_TIME secs.
+        """
+        last_update = OpenIDClient._JWKS_UPDATE.get(iss, 0)
+        elapsed = time.time() - last_update
+        if iss in OpenIDClient.JWKS_CACHE and elapsed < OpenIDClient.ISSUER_CONFIG_CACHE_TIME:
+            if not refresh or elapsed < OpenIDClient.JWKS_MIN_REFRESH_TIME:
+                return OpenIDClient.JWKS_CACHE[iss]
+
+        conf = OpenIDClient.get_openid_configuration(iss, verify_ssl=verify_ssl)
+        if "jwks_uri" not in conf:
+            raise Exception("Error getting the JWKS URI of issuer %s: %s" % (iss, conf.get("error")))
+        resp = requests.request("GET", conf["jwks_uri"], verify=verify_ssl)
+        if resp.status_code != 200:
+            raise Exception("Error getting the JWKS of issuer %s. Code: %d. Message: %s." %
+                            (iss, resp.status_code, resp.text))
+        keys = {}
+        for key in resp.json().get("keys", []):
+            if key.get("use", "sig") == "sig":
+                keys[key.get("kid")] = key
+        OpenIDClient.JWKS_CACHE[iss] = keys
+        OpenIDClient._JWKS_UPDATE[iss] = time.time()
+        return keys
+
+    @staticmethod
+    def verify_token(token, verify_ssl=False):
+        """
+        Verify the signature of a token with the keys published by its issuer
+        """
+        try:
+            decoded_token = JWT().get_info(token)
+            kid = JWT().get_header(token).get("kid")
+            keys = OpenIDClient.get_jwks(decoded_token['iss'], verify_ssl)
+            if kid not in keys:
+                # The keys may have been rotated
+                keys = OpenIDClient.get_jwks(decoded_token['iss'], verify_ssl, refresh=True)
+            if kid not in keys:
+                if kid is None and len(keys) == 1:
+                    kid = list(keys.keys())[0]
+                else:
+                    return False, "Key %s not found in the issuer keys" % kid
+            return True, JWT().verify(token, keys[kid])
+        except Exception as ex:
+            return False, str(ex)
+
     @staticmethod
     def get_user_info_request(token, verify_ssl=False):
         """
@@ -40,9 +40,41 @@ class RequestQueue(Queue):
     """
     Modela una cola del sistema que procesa las peticiones encoladas de acuerdo a unas prioridades.
     Se elige la prioridad con indice menor, siguiendo la prioridad convencional de las PriorityQueue
-    estandar.
+    estandar. Las peticiones con la misma prioridad se procesan en orden de llegada.
+
+    Para evitar que las peticiones de baja prioridad no se procesen nunca, su prioridad aumenta un
+    nivel por cada REQUEST_PRIORITY_AGING segundos que pasan en la cola.
+
+    Las prioridades solo tienen efecto en las colas de los carriles del RequestExecutor (REQUEST_LANES),
+    donde las peticiones esperan a un thread libre. La cola general del sistema despacha cada peticion
+    en cuanto llega, lanzando un thread por peticion si no se ha configurado REQUEST_LANES.
     """
 
+    def _init(self, maxsize):
+        self.queue = []
+        self._counter = 0
+
+    def _qsize(self):
+        return len(self.queue)
+
+    def _put(self, item):
+        priority, request = item
+        self._counter += 1
+        self.queue.append((priority, self._counter, time.time(), request))
+
+    def _get(self):
+        now = time.time()
+        best = None
+        best_key = None
+        for pos, (priority, num, put_time, _) in enumerate(self.queue):
+            if Config.REQUEST_PRIORITY_AGING > 0:
+                priority -= (now - put_time) / float(Config.REQUEST_PRIORITY_AGING)
+            if best is None or (priority, num) < best_key:
+                best = pos
+                best_key = (priority, num)
+        priority, _, _, request = self.queue.pop(best)
+        return priority, request
+
     def process_requests(self, max_requests, wait_time_for_element=0):
         """
         Procesa solicitudes de la cola, utilizando el metodo "process" de la clase
@@ -133,6 +165,143 @@ def get_system_queue():
     return SYSTEM_REQUESTS_QUEUE
 
 
+class RequestExecutor(object):
+    """
+    Ejecuta las peticiones asincronas en un conjunto fijo de threads, en lugar de lanzar un thread
+    por cada peticion. Las peticiones se reparten en "carriles" (por ejemplo lecturas o creacion de
+    infraestructuras), cada uno con su propia cola y su numero maximo de peticiones simultaneas, de
+    forma que las peticiones costosas no bloqueen a las baratas.
+    """
+
+    DEFAULT_LANE = "default"
+    """Carril utilizado para las peticiones que no indican carril o indican uno que no existe."""
+
+    DEFAULT_LANE_WORKERS = 10
+    """Numero de threads del carril por defecto si no se especifica."""
+
+    def __init__(self, lanes, max_queue_size=0):
+        """
+        * lanes: diccionario con el nombre de cada carril y su numero de threads
+        * max_queue_size: numero maximo de peticiones esperando un thread libre en cada carril
+          (0 sin limite). Las peticiones que superen este limite se rechazan.
+        """
+        lanes = dict(lanes)
+        lanes.setdefault(RequestExecutor.DEFAULT_LANE, RequestExecutor.DEFAULT_LANE_WORKERS)
+        # Las peticiones de cada carril se procesan segun su prioridad
+        self._max_queue_size = max_queue_size
+        self._stopped = False
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._stats = {}
+        self._threads = []
+        for lane, workers in lanes.items():
+            self._queues[lane] = RequestQueue()
+            self._stats[lane] = {"workers": int(workers), "queue_depth": 0, "active": 0, "processed": 0,
+                                 "rejected": 0, "max_wait_time": 0.0, "total_wait_time": 0.0}
+            for num in range(int(workers)):
+                thread = threading.Thread(target=self._worker, args=(lane,), name="%s-%d" % (lane, num))
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, request, lane=None):
+        """
+        Encola la peticion en el carril indicado. Devuelve False si la peticion se rechaza por estar la
+        cola llena o el executor parado.
+        """
+        if lane not in self._queues:
+            lane = RequestExecutor.DEFAULT_LANE
+        with self._lock:
+            stats = self._stats[lane]
+            pending = stats["queue_depth"] + stats["active"]
+            if self._stopped or (self._max_queue_size > 0 and pending >= stats["workers"] + self._max_queue_size):
+                stats["rejected"] += 1
+                return False
+            stats["queue_depth"] += 1
+        self._queues[lane].put((request.priority, (time.time(), request)))
+        return True
+
+    def _worker(self, lane):
+        """
+        Procesa las peticiones de un carril hasta recibir None
+        """
+        queue = self._queues[lane]
+        stats = self._stats[lane]
+        while True:
+            _, item = queue.get()
+            if item is None:
+                break
+            submit_time, request = item
+            wait_time = time.time() - submit_time
+            with self._lock:
+                stats["queue_depth"] -= 1
+                stats["active"] += 1
+                stats["max_wait_time"] = max(stats["max_wait_time"], wait_time)
+                stats["total_wait_time"] += wait_time
+            try:
+                Request.process(request)
+            except Exception:
+                # El error ya ha sido tratado por la peticion, no debe parar el thread
+                pass
+            finally:
+                with self._lock:
+                    stats["active"] -= 1
+                    stats["processed"] += 1
+
+    def get_stats(self):
+        """
+        Obtiene las metricas de cada carril: workers, queue_depth, active, processed, rejected,
+        max_wait_time y total_wait_time
+        """
+        with self._lock:
+            return dict((lane, dict(stats)) for lane, stats in self._stats.items())
+
+    def stop(self):
+        """
+        Para los threads una vez procesadas las peticiones encoladas. Las nuevas peticiones se rechazan.
+        """
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+        for lane, queue in self._queues.items():
+            for _ in range(self._stats[lane]["workers"]):
+                # Con prioridad infinita para que se procese despues de las peticiones encoladas
+                queue.put((float("inf"), None))
+        for thread in self._threads:
+            thread.join()
+
+
+def get_request_executor():
+    """
+    Obtiene el executor de las peticiones asincronas, creandolo la primera vez de acuerdo a la
+    configuracion. Devuelve None si no se ha configurado REQUEST_LANES, en cuyo caso se lanza un
+    thread por cada peticion.
+    """
+    global REQUEST_EXECUTOR
+    try:
+        REQUEST_EXECUTOR
+    except Exception:
+        REQUEST_EXECUTOR = None
+        if Config.REQUEST_LANES:
+            REQUEST_EXECUTOR = RequestExecutor(Config.REQUEST_LANES, Config.REQUEST_QUEUE_MAX_SIZE)
+    return REQUEST_EXECUTOR
+
+
+def stop_request_executor():
+    """
+    Para el executor de las peticiones asincronas (si se ha creado), esperando a que se procesen las
+    peticiones encoladas.
+    """
+    global REQUEST_EXECUTOR
+    try:
+        executor = REQUEST_EXECUTOR
+    except NameError:
+        executor = None
+    if executor:
+        executor.stop()
+
+
 class Request(object):
     """
     Clase generica para modelar las peticiones que se van a hacer al sistema. Al crear la peticion, esta se
@@ -162,6 +331,7 @@ class Request(object):
         self.__value = None
         self.__status = Request.STATUS_PENDING
         self.__arguments = arguments
+        self.__priority = priority
 
         # Este semaforo es para acceder a los atributos y que sea "threadsafe"
         self.__semaphore = threading.Lock()
@@ -177,6 +347,13 @@ class Request(object):
         """
         return self.__arguments
 
+    @property
+    def priority(self):
+        """
+        Devuelve la prioridad de la peticion
+        """
+        return self.__priority
+
     def wait(self):
         """
         Espera a que se reciba la señal de fin de procesamiento de la peticion
@@ -250,19 +427,35 @@ class Request(object):
 class AsyncRequest(Request):
     """
     Esta clase, que desciende de Request, es un tipo especial de peticiones que hace que se ejecuten
-    de forma asincrona, en un thread independiente
+    de forma asincrona, en un thread independiente o en el RequestExecutor si esta configurado
     """
 
+    LANE = RequestExecutor.DEFAULT_LANE
+    """Carril del RequestExecutor en el que se ejecuta la peticion."""
+
     def __init__(self, arguments=(), priority=Request.PRIORITY_NORMAL):
         Request.__init__(self, arguments, priority)
         self.__thread = None
 
     def process(self):
         """
-        En este caso lo que se hace es lanzar el thread
+        En este caso lo que se hace es lanzar el thread o encolar la peticion en el executor
         """
-        self.__thread = threading.Thread(target=Request.process, args=[self])
-        self.__thread.start()
+        executor = get_request_executor()
+        if executor:
+            if not executor.submit(self, self.LANE):
+                self.reject("Too many requests in the queue. Try again later.")
+        else:
+            self.__thread = threading.Thread(target=Request.process, args=[self])
+            self.__thread.start()
+
+    def reject(self, msg):
+        """
+        Finaliza la peticion con error sin procesarla
+        """
+        self.set(msg)
+        self.set_status(Request.STATUS_ERROR)
+        self.wake_up()
 
 
 class AsyncXMLRPCServer(ThreadingMixIn, SimpleXMLRPCServer):
@@ -26,7 +26,7 @@ import time
 import argparse
 import psutil
 
-from IM.request import Request, AsyncXMLRPCServer, get_system_queue
+from IM.request import Request, AsyncXMLRPCServer, get_system_queue, stop_request_executor
 from IM.config import Config
 from IM.InfrastructureManager import InfrastructureManager
 from IM.InfrastructureList import InfrastructureList
@@ -38,6 +38,8 @@ if sys.version_info <= (2, 6):
     sys.exit(1)
 
 logger = logging.getLogger('InfrastructureManager')
+# PIDs of the extra processes serving the REST API
+rest_workers = []
 
 
 class ExtraInfoFilter(logging.Filter):
@@ -226,14 +228,86 @@ def GetInfrastructureOwners(inf_id, auth_data):
     return WaitRequest(request)
 
 
+def check_rest_workers_config():
+    """
+    Check that the options that keep the state in each process are compatible
+    with the multi-process REST mode (REST_PROCESSES > 1).
+
+    Return: a str with the error or None if the config is correct.
+    """
+    if not Config.INF_CACHE_TIME:
+        return "INF_CACHE_TIME must be set with REST_PROCESSES > 1."
+    if Config.VM_STATE_POLLER:
+        return "VM_STATE_POLLER cannot be enabled with REST_PROCESSES > 1."
+    return None
+
+
+def fork_rest_workers():
+    """
+    Launch the extra processes serving the REST API (sharing the port with SO_REUSEPORT).
+    It must be called before connecting with the DB.
+
+    Return: True in the child processes.
+    """
+    if Config.REST_LONG_POLL_MAX_WAIT:
+        # The versions of the state of the infrastructures are not shared among the processes
+        logger.warning("REST long-poll is disabled with REST_PROCESSES > 1.")
+        Config.REST_LONG_POLL_MAX_WAIT = 0
+    for _ in range(Config.REST_PROCESSES - 1):
+        pid = os.fork()
+        if pid == 0:
+            del rest_workers[:]
+            # Save the pending data when the main process stops the workers
+            signal.signal(signal.SIGTERM, signal_int_handler)
+            return True
+        rest_workers.append(pid)
+    return False
+
+
+def stop_rest_workers():
+    """
+    Stop the extra REST processes waiting them to save their pending data
+    """
+    for pid in rest_workers:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass
+    end = time.time() + max(Config.DB_POOL_TIMEOUT, Config.DB_SAVE_DELAY, 1)
+    for pid in rest_workers:
+        while time.time() < end:
+            try:
+                if os.waitpid(pid, os.WNOHANG)[0] == pid:
+                    break
+            except OSError:
+                # It is not a child process or it has already finished
+                break
+            time.sleep(0.1)
+    del rest_workers[:]
+
+
 def launch_daemon():
     """
     Launch the IM daemon
     """
+    rest_worker = False
+    if Config.ACTIVATE_REST and Config.REST_PROCESSES > 1:
+        error = check_rest_workers_config()
+        if error:
+            print("Incorrect configuration: %s" % error)
+            sys.exit(2)
+        rest_worker = fork_rest_workers()
+
     if not InfrastructureList.init_table():
         print("Error connecting with the DB!!.")
         sys.exit(2)
 
+    if rest_worker:
+        # The extra processes only serve the REST API
+        import IM.REST
+        IM.REST.run(host=Config.REST_ADDRESS, port=Config.REST_PORT)
+        return
+
     if Config.XMLRCP_SSL:
         # if specified launch the secure version
         import ssl
@@ -362,6 +436,8 @@ def im_stop():
         # Assure that the IM data are correctly saved
         InfrastructureManager.logger.info(
             'Stopping Infrastructure Manager daemon...')
+        # Process the requests waiting in the lane queues before saving the data
+        stop_request_executor()
         InfrastructureManager.stop()
 
         if Config.ACTIVATE_REST:
@@ -371,6 +447,8 @@ def im_stop():
     except Exception:
         InfrastructureManager.logger.exception("Error stopping Infrastructure Manager daemon")
 
+    # Let the REST processes save their data before killing them
+    stop_rest_workers()
     # Assure that there are no Ansible process pending
     kill_childs()
 
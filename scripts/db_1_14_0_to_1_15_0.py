@@ -0,0 +1,78 @@
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Creates the index of infrastructure owners used to list the infrastructures of a user
+
+import sys
+
+sys.path.append("..")
+sys.path.append(".")
+
+from IM.config import Config
+from IM.db import DataBase
+from IM.InfrastructureInfo import InfrastructureInfo
+
+
+def get_owners(data):
+    try:
+        inf = InfrastructureInfo.deserialize_auth(data)
+        return inf.get_owner_keys()
+    except Exception as ex:
+        sys.stderr.write("Error reading infrastructure data: %s. Ignoring it.\n" % ex)
+        return []
+
+
+if __name__ == "__main__":
+    if not Config.DATA_DB:
+        sys.stderr.write("No DATA_DB defined in the im.cfg file!!")
+        sys.exit(-1)
+
+    db = DataBase(Config.DATA_DB)
+    if db.connect():
+        if db.table_exists("inf_list"):
+            sys.stdout.write("Updating DB: %s.\n" % Config.DATA_DB)
+            if db.db_type == DataBase.MONGO:
+                db.create_index("inf_list", "owners")
+                res = db.find("inf_list", {}, {"id": True, "deleted": True, "data": True, "date": True})
+                for elem in res:
+                    elem["owners"] = get_owners(elem["data"])
+                    db.replace("inf_list", {"id": elem["id"]}, elem)
+            else:
+                sentences = []
+                if db.table_exists("inf_owners"):
+                    sys.stdout.write("Table inf_owners already exists. Regenerating it.\n")
+                    sentences.append(("delete from inf_owners", None))
+                elif db.db_type == DataBase.MYSQL:
+                    db.execute("CREATE TABLE inf_owners(id VARCHAR(255), owner VARCHAR(64),"
+                               " PRIMARY KEY (id, owner), INDEX owner_idx (owner))")
+                else:
+                    db.execute("CREATE TABLE inf_owners(id VARCHAR(255), owner VARCHAR(64),"
+                               " PRIMARY KEY (id, owner))")
+                    db.execute("CREATE INDEX owner_idx ON inf_owners(owner)")
+                res = db.select("select id, data from inf_list where deleted = 0")
+                # Regenerate the index in one transaction to avoid leaving it partially filled
+                sentences.append(("replace into inf_owners (id, owner) values (%s, %s)",
+                                  [(inf_id, owner) for inf_id, data in res for owner in get_owners(data)]))
+                db.executemany_transaction(sentences)
+            sys.stdout.write("%d infrastructures indexed.\n" % len(res))
+            db.close()
+        else:
+            sys.stdout.write("There are no inf_list table. Do not need to update.")
+    else:
+        sys.stderr.write("Error connecting with DB: %s\n" % Config.DATA_DB)
+        sys.exit(-1)
+
+    sys.exit(0)
@@ -21,16 +21,18 @@ sys.path.append("..")
 sys.path.append(".")
 
 from IM.config import Config
-from IM.db import DataBase
+from IM.db import DataBase, DataBasePool
 
 
 class DeleteInfs():
 
     @staticmethod
     def delete_data_from_db(db_url, date):
-        db = DataBase(db_url)
+        db = DataBase(db_url, pooled=True)
         if db.connect():
             db.execute("DELETE FROM inf_list WHERE deleted = 1 and date < '%s';" % date)
+            if db.table_exists("inf_owners"):
+                db.execute("DELETE FROM inf_owners WHERE id NOT IN (SELECT id FROM inf_list);")
             db.close()
         else:
             sys.stderr.write("ERROR connecting with the database!.")
@@ -62,3 +64,4 @@ if __name__ == "__main__":
         sys.exit(1)
 
     DeleteInfs.delete_data_from_db(Config.DATA_DB, date)
+    DataBasePool.close_pools()
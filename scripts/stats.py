@@ -23,7 +23,7 @@ sys.path.append(".")
 
 import json
 import yaml
-from IM.db import DataBase
+from IM.db import DataBase, DataBasePool
 from IM.auth import Authentication
 
 
@@ -49,7 +49,7 @@ class Stats():
     @staticmethod
     def get_stats(db_url, date):
         stats = [("Inf ID.", "TOSCA", "User", "EC3", "Creation Date", "Last Date")]
-        db = DataBase(db_url)
+        db = DataBase(db_url, pooled=True)
         if db.connect():
             res = db.select("SELECT data, date, id FROM inf_list WHERE date > %s order by rowid desc;", (date,))
             for elem in res:
@@ -91,6 +91,7 @@ if __name__ == "__main__":
         sys.exit(-1)
 
     res = Stats.get_stats(im_db, date)
+    DataBasePool.close_pools()
     if res is None:
         sys.exit(-1)
     else:
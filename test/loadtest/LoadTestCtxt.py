@@ -0,0 +1,124 @@
+#! /usr/bin/env python
+#
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# End-to-end contextualization latency test: time since an infrastructure is created
+# with the Dummy connector until the ConfManager has finished all the contextualization steps
+# (the RADL disables the Ansible contextualization, so the steps are check_vm_ips and wait_all_vm_ips).
+# STEP_TIME secs are added to each step to emulate the delays of a real cloud provider.
+# Usage: python LoadTestCtxt.py [NUM_INFS] [NUM_VMS] [CHECK_STATE_INTERVAL] [STEP_TIME]
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append("..")
+sys.path.append(".")
+
+from IM.config import Config
+from IM.ConfManager import ConfManager
+from IM.InfrastructureList import InfrastructureList
+from IM.InfrastructureManager import InfrastructureManager as IM
+from IM.auth import Authentication
+
+NUM_INFS = 10
+NUM_VMS = 2
+CHECK_STATE_INTERVAL = 5
+STEP_TIME = 0.5
+FINISHED = {}
+
+RADL = """
+network privada ()
+system node (
+cpu.count>=1 and
+memory.size>=512m and
+net_interface.0.connection = 'privada' and
+disk.0.os.name = 'linux' and
+disk.0.image.url = 'dummy://server.com/image' and
+disk.0.os.credentials.username = 'user' and
+disk.0.os.credentials.password = 'pass'
+)
+contextualize ()
+deploy node %d
+"""
+
+
+def get_auth():
+    """ Get the auth data to use the Dummy connector """
+    return Authentication([{'id': 'im', 'type': 'InfrastructureManager', 'username': 'user', 'password': 'pass'},
+                           {'id': 'dummy', 'type': 'Dummy'}])
+
+
+check_vm_ips = ConfManager.check_vm_ips
+wait_all_vm_ips = ConfManager.wait_all_vm_ips
+
+
+def slow_check_vm_ips(self, *args, **kwargs):
+    """ Add STEP_TIME secs to the first contextualization step """
+    time.sleep(STEP_TIME)
+    return check_vm_ips(self, *args, **kwargs)
+
+
+def timed_wait_all_vm_ips(self, *args, **kwargs):
+    """ Add STEP_TIME secs to the last contextualization step and store the time when it finishes """
+    time.sleep(STEP_TIME)
+    res = wait_all_vm_ips(self, *args, **kwargs)
+    FINISHED[self.inf.id] = time.time()
+    return res
+
+
+def create_inf(auth, num_vms):
+    """ Create an infrastructure and return the time needed to have it configured """
+    start = time.time()
+    inf_id = IM.CreateInfrastructure(RADL % num_vms, auth)
+    while inf_id not in FINISHED and time.time() - start < 600:
+        time.sleep(0.01)
+    latency = FINISHED.get(inf_id, time.time()) - start
+    if not IM.get_infrastructure(inf_id, auth).configured:
+        print("Inf ID %s not configured." % inf_id)
+    IM.DestroyInfrastructure(inf_id, auth)
+    return latency
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        NUM_INFS = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        NUM_VMS = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        CHECK_STATE_INTERVAL = float(sys.argv[3])
+    if len(sys.argv) > 4:
+        STEP_TIME = float(sys.argv[4])
+
+    tmp_db = tempfile.mkstemp(suffix=".db")[1]
+    Config.DATA_DB = "sqlite://" + tmp_db
+    Config.CONFMAMAGER_CHECK_STATE_INTERVAL = CHECK_STATE_INTERVAL
+    ConfManager.check_vm_ips = slow_check_vm_ips
+    ConfManager.wait_all_vm_ips = timed_wait_all_vm_ips
+
+    try:
+        InfrastructureList.init_table()
+        auth = get_auth()
+        latencies = [create_inf(auth, NUM_VMS) for _ in range(NUM_INFS)]
+
+        print("Infs;VMs;Step time (s);Avg. latency (s);Min latency (s);Max latency (s)")
+        print("%d;%d;%.3f;%.3f;%.3f;%.3f" % (NUM_INFS, NUM_VMS, STEP_TIME, sum(latencies) / len(latencies),
+                                             min(latencies), max(latencies)))
+    finally:
+        InfrastructureList.stop()
+        os.unlink(tmp_db)
@@ -0,0 +1,124 @@
+#! /usr/bin/env python
+#
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Microbenchmark of the time and memory needed to load an infrastructure from the DB data.
+# Usage: python LoadTestDeserialize.py [NUM_VMS] [NUM_ITERATIONS]
+
+import sys
+import time
+import tracemalloc
+
+sys.path.append("..")
+sys.path.append(".")
+
+from IM.InfrastructureInfo import InfrastructureInfo
+from IM.VirtualMachine import VirtualMachine
+from IM.CloudInfo import CloudInfo
+from IM.auth import Authentication
+from radl.radl_parse import parse_radl
+
+NUM_VMS = 200
+NUM_ITERATIONS = 10
+
+RADL = """
+network publica (outbound = 'yes')
+network privada ()
+
+system node (
+cpu.count>=2 and
+memory.size>=4g and
+net_interface.0.connection = 'publica' and
+net_interface.0.ip = '8.8.8.%d' and
+net_interface.1.connection = 'privada' and
+net_interface.1.ip = '10.0.0.%d' and
+net_interface.1.dns_name = 'node-%d' and
+disk.0.os.name = 'linux' and
+disk.0.image.url = 'one://server.com/1' and
+disk.0.os.credentials.username = 'ubuntu' and
+disk.0.os.credentials.password = 'password' and
+disk.0.applications contains (name = 'ansible.roles.grycap.docker') and
+disk.1.size = 10g and
+disk.1.mount_path = '/mnt/disk'
+)
+
+configure node (
+@begin
+---
+ - tasks:
+    - debug: msg="Configuring node"
+@end
+)
+
+deploy node 1
+"""
+
+
+def create_inf_data(num_vms):
+    """ Create the serialized data of an infrastructure with num_vms VMs """
+    inf = InfrastructureInfo()
+    inf.auth = Authentication([{'type': 'InfrastructureManager', 'username': 'user', 'password': 'pass'}])
+    inf.radl = parse_radl(RADL % (0, 0, 0))
+    cloud = CloudInfo()
+    cloud.type = "Dummy"
+    for i in range(num_vms):
+        radl = parse_radl(RADL % (i % 256, i % 256, i))
+        vm = VirtualMachine(inf, str(i), cloud, radl, radl)
+        vm.im_id = i
+        vm.state = VirtualMachine.RUNNING
+        inf.vm_list.append(vm)
+    return inf.serialize()
+
+
+def load(data, access_radl):
+    """ Load the infrastructure and get the state of the VMs, parsing the RADLs if access_radl is True """
+    inf = InfrastructureInfo.deserialize(data)
+    states = [vm.state for vm in inf.vm_list]
+    if access_radl:
+        inf.radl
+        for vm in inf.vm_list:
+            vm.info
+            vm.requested_radl
+    return inf, states
+
+
+def run(data, access_radl, num_iterations):
+    before = time.time()
+    for _ in range(num_iterations):
+        load(data, access_radl)
+    elapsed = (time.time() - before) / num_iterations
+
+    tracemalloc.start()
+    inf = load(data, access_radl)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del inf
+    return elapsed, memory
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        NUM_VMS = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        NUM_ITERATIONS = int(sys.argv[2])
+
+    data = create_inf_data(NUM_VMS)
+    print("Mode;VMs;Data size (KB);Load time (ms);Memory (KB)")
+    for access_radl in [True, False]:
+        elapsed, memory = run(data, access_radl, NUM_ITERATIONS)
+        mode = "full" if access_radl else "state only"
+        print("%s;%d;%d;%.1f;%d" % (mode, NUM_VMS, len(data) // 1024, elapsed * 1000, memory // 1024))
@@ -0,0 +1,137 @@
+#! /usr/bin/env python
+#
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Stress test of the InfrastructureList: concurrent clients modifying and saving different infrastructures.
+# Usage: python LoadTestInfList.py [DB_URL] [DURATION] [MAX_CLIENTS] [LATENCY_MS]
+# By default a temporary SQLite DB is used, adding LATENCY_MS to each SQL sentence to emulate a remote DB.
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append("..")
+sys.path.append(".")
+
+from IM.config import Config
+from IM.db import DataBase
+from IM.InfrastructureInfo import InfrastructureInfo
+from IM.InfrastructureList import InfrastructureList
+from IM.VirtualMachine import VirtualMachine
+from IM.CloudInfo import CloudInfo
+from IM.auth import Authentication
+from radl.radl_parse import parse_radl
+
+DURATION = 5
+MAX_CLIENTS = 16
+NUM_VMS = 5
+LATENCY_MS = 5
+
+RADL = """
+network publica (outbound = 'yes')
+system node (
+cpu.count>=2 and
+memory.size>=4g and
+net_interface.0.connection = 'publica' and
+net_interface.0.ip = '8.8.8.8' and
+disk.0.os.name = 'linux' and
+disk.0.image.url = 'one://server.com/1'
+)
+deploy node 1
+"""
+
+
+def create_inf(num_vms):
+    """ Create and store an infrastructure with num_vms VMs """
+    inf = InfrastructureInfo()
+    inf.auth = Authentication([{'type': 'InfrastructureManager', 'username': 'user', 'password': 'pass'}])
+    inf.radl = parse_radl(RADL)
+    cloud = CloudInfo()
+    cloud.type = "Dummy"
+    for i in range(num_vms):
+        radl = parse_radl(RADL)
+        vm = VirtualMachine(inf, str(i), cloud, radl, radl, None, i)
+        vm.state = VirtualMachine.RUNNING
+        inf.vm_list.append(vm)
+    InfrastructureList.add_infrastructure(inf)
+    InfrastructureList.save_data(inf.id)
+    return inf.id
+
+
+def client(inf_id, end, ops):
+    """ Modify and save the same infrastructure until the end time """
+    num = 0
+    while time.time() < end:
+        inf = InfrastructureList.get_infrastructure(inf_id)
+        vm = inf.get_vm_list()[num % NUM_VMS]
+        vm.state = VirtualMachine.STOPPED if vm.state == VirtualMachine.RUNNING else VirtualMachine.RUNNING
+        InfrastructureList.save_data(inf_id)
+        num += 1
+    ops.append(num)
+
+
+def run(inf_ids, duration):
+    """ Launch one client per infrastructure and return the number of operations per second """
+    ops = []
+    end = time.time() + duration
+    threads = [threading.Thread(target=client, args=(inf_id, end, ops)) for inf_id in inf_ids]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(ops) / float(duration)
+
+
+if __name__ == "__main__":
+    tmp_db = None
+    if len(sys.argv) > 1 and sys.argv[1]:
+        Config.DATA_DB = sys.argv[1]
+    else:
+        tmp_db = tempfile.mkstemp(suffix=".db")[1]
+        Config.DATA_DB = "sqlite://" + tmp_db
+    if len(sys.argv) > 2:
+        DURATION = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        MAX_CLIENTS = int(sys.argv[3])
+    if len(sys.argv) > 4:
+        LATENCY_MS = int(sys.argv[4])
+
+    if LATENCY_MS:
+        execute_retry = DataBase._execute_retry
+
+        def remote_execute_retry(*args, **kwargs):
+            time.sleep(LATENCY_MS / 1000.0)
+            return execute_retry(*args, **kwargs)
+
+        DataBase._execute_retry = remote_execute_retry
+
+    try:
+        InfrastructureList.init_table()
+        inf_ids = [create_inf(NUM_VMS) for _ in range(MAX_CLIENTS)]
+
+        print("Clients;Ops/s;Ops/s per client")
+        clients = 1
+        while clients <= MAX_CLIENTS:
+            ops = run(inf_ids[:clients], DURATION)
+            print("%d;%.1f;%.1f" % (clients, ops, ops / clients))
+            clients *= 2
+    finally:
+        InfrastructureList.stop()
+        if tmp_db:
+            os.unlink(tmp_db)
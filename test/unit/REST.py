@@ -20,6 +20,10 @@ import os
 import json
 import unittest
 import sys
+import gzip
+import time
+import threading
+import bottle
 from io import BytesIO
 from mock import patch, MagicMock
 from IM.InfrastructureInfo import InfrastructureInfo
@@ -32,11 +36,14 @@ sys.path.append(".")
 
 from IM.config import Config
 from IM import __version__ as version
-from IM.InfrastructureManager import (DeletedInfrastructureException,
+from IM.InfrastructureManager import (InfrastructureManager,
+                                      DeletedInfrastructureException,
                                       IncorrectInfrastructureException,
                                       UnauthorizedUserException,
                                       InvaliddUserException)
 from IM.InfrastructureInfo import IncorrectVMException, DeletedVMException, IncorrectStateException
+from IM.InfrastructureList import InfrastructureList
+from IM.StateNotifier import StateNotifier
 from IM.REST import (RESTDestroyInfrastructure,
                      RESTGetInfrastructureInfo,
                      RESTGetInfrastructureProperty,
@@ -58,8 +65,12 @@ from IM.REST import (RESTDestroyInfrastructure,
                      RESTImportInfrastructure,
                      RESTGetCloudInfo,
                      RESTChangeInfrastructureAuth,
+                     RESTBatch,
+                     get_auth_header,
                      return_error,
-                     format_output)
+                     format_output,
+                     app,
+                     MyCherryPy)
 
 
 def read_file_as_bytes(file_name):
@@ -1092,6 +1103,324 @@ class TestREST(unittest.TestCase):
         res = RESTGetInfrastructureProperty("1", "authorization")
         self.assertEqual(res, '{"authorization": ["user1", "user2"]}')
 
+    @patch("IM.InfrastructureManager.InfrastructureManager.GetVMContMsg")
+    @patch("bottle.request")
+    def test_GetVMContMsgRange(self, bottle_request, GetVMContMsg):
+        """Test REST GetVMProperty contmsg with ranges."""
+        bottle_request.return_value = MagicMock()
+        bottle_request.headers = {"AUTHORIZATION": "type = InfrastructureManager; username = user; password = pass",
+                                  "Range": "bytes=4-"}
+        bottle_request.params = {}
+        GetVMContMsg.return_value = u"line\xe1\nline2"
+
+        res = RESTGetVMProperty("1", "1", "contmsg")
+        self.assertEqual(res, u"\xe1\nline2".encode("utf-8"))
+        self.assertEqual(bottle.response.status_code, 206)
+        self.assertEqual(bottle.response.headers["Content-Range"], "bytes 4-11/12")
+
+        bottle_request.headers["Range"] = "bytes=12-"
+        res = RESTGetVMProperty("1", "1", "contmsg")
+        self.assertEqual(res, "Requested range not satisfiable")
+        self.assertEqual(bottle.response.status_code, 416)
+        self.assertEqual(bottle.response.headers["Content-Range"], "bytes */12")
+
+        del bottle_request.headers["Range"]
+        bottle_request.headers["Accept"] = "application/json"
+        # The offset is set in characters
+        bottle_request.params = {"offset": "5"}
+        res = RESTGetVMProperty("1", "1", "contmsg")
+        self.assertEqual(json.loads(res), {"contmsg": "\nline2"})
+
+        bottle_request.params = {"offset": "-1"}
+        res = RESTGetVMProperty("1", "1", "contmsg")
+        self.assertEqual(json.loads(res), {"message": "Incorrect value in offset parameter", "code": 400})
+
+    @patch("IM.InfrastructureManager.InfrastructureManager.GetInfrastructureContMsg")
+    def test_encode_output(self, GetInfrastructureContMsg):
+        """Test REST compressed and streamed responses."""
+        cont_msg = "Task OK\n" * 10000
+        GetInfrastructureContMsg.return_value = cont_msg
+
+        def call(accept_encoding=None):
+            environ = {"REQUEST_METHOD": "GET", "PATH_INFO": "/infrastructures/1/contmsg",
+                       "HTTP_HOST": "imserver.com", "wsgi.input": BytesIO(),
+                       "HTTP_AUTHORIZATION": "type = InfrastructureManager; username = user; password = pass"}
+            if accept_encoding:
+                environ["HTTP_ACCEPT_ENCODING"] = accept_encoding
+            headers = {}
+
+            def start_response(status, response_headers, exc_info=None):
+                headers.update(response_headers)
+
+            chunks = list(app(environ, start_response))
+            return chunks, headers
+
+        chunks, headers = call("gzip, deflate")
+        self.assertEqual(headers["Content-Encoding"], "gzip")
+        self.assertNotIn("Content-Length", headers)
+        self.assertEqual(gzip.decompress(b"".join(chunks)).decode(), cont_msg)
+
+        chunks, headers = call("gzip;q=0, deflate")
+        self.assertEqual(headers["Content-Encoding"], "deflate")
+
+        # The uncompressed response is sent in chunks
+        chunks, headers = call()
+        self.assertNotIn("Content-Encoding", headers)
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(b"".join(chunks).decode(), cont_msg)
+
+        # Small responses are not compressed
+        GetInfrastructureContMsg.return_value = "Task OK"
+        chunks, headers = call("gzip")
+        self.assertNotIn("Content-Encoding", headers)
+        self.assertEqual(chunks, [b"Task OK"])
+
+    @patch("IM.InfrastructureManager.InfrastructureManager.GetInfrastructureState")
+    @patch("IM.InfrastructureManager.InfrastructureManager.GetInfrastructureRADL")
+    @patch("IM.InfrastructureManager.InfrastructureManager.get_infrastructure")
+    @patch("IM.InfrastructureManager.InfrastructureManager.check_auth_data")
+    @patch("bottle.request")
+    def test_etag(self, bottle_request, check_auth_data, get_infrastructure, GetInfrastructureRADL,
+                  GetInfrastructureState):
+        """Test REST conditional GETs."""
+        inf = InfrastructureInfo()
+        get_infrastructure.return_value = inf
+        InfrastructureList.infrastructure_list[inf.id] = inf
+        GetInfrastructureRADL.return_value = "radl"
+        GetInfrastructureState.return_value = {'state': "running", 'vm_states': {"0": "running"}}
+        bottle_request.headers = {"AUTHORIZATION": "type = InfrastructureManager; username = user; password = pass"}
+        bottle_request.path = "/infrastructures/%s/radl" % inf.id
+        bottle_request.query_string = ""
+
+        try:
+            res = RESTGetInfrastructureProperty(inf.id, "radl")
+            self.assertEqual(res, "radl")
+            etag = bottle.response.headers["ETag"]
+            self.assertEqual(bottle.response.headers["Cache-Control"], "private, no-cache")
+
+            # The data is not obtained again if it has not been modified
+            bottle_request.headers["If-None-Match"] = etag
+            res = RESTGetInfrastructureProperty(inf.id, "radl")
+            self.assertEqual(res, "")
+            self.assertEqual(bottle.response.status_code, 304)
+            self.assertEqual(GetInfrastructureRADL.call_count, 1)
+
+            # The ETag depends on the requested range
+            bottle_request.headers["Range"] = "bytes=0-1"
+            res = RESTGetInfrastructureProperty(inf.id, "radl")
+            self.assertEqual(res, "radl")
+            self.assertNotEqual(bottle.response.headers["ETag"], etag)
+            del bottle_request.headers["Range"]
+
+            inf.changed()
+            get_infrastructure.reset_mock()
+            res = RESTGetInfrastructureProperty(inf.id, "radl")
+            self.assertEqual(res, "radl")
+            self.assertNotEqual(bottle.response.headers["ETag"], etag)
+            self.assertEqual(GetInfrastructureRADL.call_count, 3)
+            # The Inf loaded checking the ETag is reused to get the data
+            self.assertEqual(get_infrastructure.call_count, 1)
+            self.assertIs(GetInfrastructureRADL.call_args[0][1], check_auth_data.return_value)
+            self.assertIs(check_auth_data.return_value.authorized_inf, inf)
+
+            # The state of the VMs must be updated before checking the ETag
+            bottle_request.path = "/infrastructures/%s/state" % inf.id
+            del bottle_request.headers["If-None-Match"]
+            bottle.response.status = 200
+            res = RESTGetInfrastructureProperty(inf.id, "state")
+            self.assertEqual(json.loads(res)["state"]["state"], "running")
+            bottle_request.headers["If-None-Match"] = bottle.response.headers["ETag"]
+            res = RESTGetInfrastructureProperty(inf.id, "state")
+            self.assertEqual(res, "")
+            self.assertEqual(bottle.response.status_code, 304)
+            self.assertEqual(GetInfrastructureState.call_count, 2)
+        finally:
+            del InfrastructureList.infrastructure_list[inf.id]
+            bottle.response.status = 200
+
+    @patch("IM.InfrastructureManager.InfrastructureManager.GetInfrastructureState")
+    @patch("IM.InfrastructureManager.InfrastructureManager.get_infrastructure")
+    @patch("IM.InfrastructureManager.InfrastructureManager.check_auth_data")
+    @patch("bottle.request")
+    def test_state_long_poll(self, bottle_request, check_auth_data, get_infrastructure, GetInfrastructureState):
+        """Test REST state requests waiting for changes."""
+        inf = InfrastructureInfo()
+        get_infrastructure.return_value = inf
+        GetInfrastructureState.return_value = {'state': "running", 'vm_states': {"0": "running"}}
+        bottle_request.headers = {"AUTHORIZATION": "type = InfrastructureManager; username = user; password = pass"}
+        bottle_request.params = {}
+
+        RESTGetInfrastructureProperty(inf.id, "state")
+        version = bottle.response.headers["X-IM-State-Version"]
+
+        # No changes: wait until the timeout
+        bottle_request.params = {"wait": "0.5", "since": version}
+        before = time.time()
+        RESTGetInfrastructureProperty(inf.id, "state")
+        self.assertGreaterEqual(time.time() - before, 0.5)
+        self.assertEqual(bottle.response.headers["X-IM-State-Version"], version)
+
+        # The state changes while waiting
+        threading.Timer(0.2, inf.set_configured, args=(True,)).start()
+        bottle_request.params = {"wait": "10", "since": version}
+        before = time.time()
+        res = RESTGetInfrastructureProperty(inf.id, "state")
+        self.assertLess(time.time() - before, 5)
+        self.assertEqual(json.loads(res)["state"]["state"], "running")
+        new_version = bottle.response.headers["X-IM-State-Version"]
+        self.assertNotEqual(new_version, version)
+
+        # The client gets the changes produced between the requests
+        inf.add_cont_msg("Contextualization started")
+        bottle_request.params = {"wait": "10", "since": new_version}
+        before = time.time()
+        RESTGetInfrastructureProperty(inf.id, "state")
+        self.assertLess(time.time() - before, 1)
+        self.assertEqual(int(bottle.response.headers["X-IM-State-Version"]),
+                         StateNotifier.get_version(inf.id))
+
+        # Without the VMStatePoller the state of the VMs is updated while waiting
+        def update_vms_status(vm_list, auth, timeout):
+            if update.call_count == 3:
+                StateNotifier.notify(inf.id)
+
+        version = bottle.response.headers["X-IM-State-Version"]
+        Config.VM_INFO_UPDATE_FREQUENCY = 0.2
+        try:
+            with patch("IM.VirtualMachine.VirtualMachine.update_vms_status") as update:
+                update.side_effect = update_vms_status
+                bottle_request.params = {"wait": "10", "since": version}
+                before = time.time()
+                RESTGetInfrastructureProperty(inf.id, "state")
+                self.assertLess(time.time() - before, 5)
+                self.assertEqual(update.call_count, 3)
+                self.assertNotEqual(bottle.response.headers["X-IM-State-Version"], version)
+        finally:
+            Config.VM_INFO_UPDATE_FREQUENCY = 10
+
+        bottle_request.params = {"wait": "a"}
+        res = RESTGetInfrastructureProperty(inf.id, "state")
+        self.assertEqual(res, "Incorrect value in wait or since parameters")
+
+    def test_server_options(self):
+        """Test the REST server configuration."""
+        Config.REST_MIN_THREADS = 2
+        Config.REST_MAX_THREADS = 4
+        Config.REST_KEEP_ALIVE_CONN_LIMIT = 20
+        try:
+            adapter = MyCherryPy(host="127.0.0.1", port=0)
+            server = adapter.create_server(app)
+        finally:
+            Config.REST_MIN_THREADS = 10
+            Config.REST_MAX_THREADS = 0
+            Config.REST_KEEP_ALIVE_CONN_LIMIT = 10
+        self.assertEqual(server.requests.min, 2)
+        self.assertEqual(server.requests.max, 4)
+        self.assertEqual(server.request_queue_size, 32)
+        self.assertEqual(server.keep_alive_conn_limit, 20)
+
+        # The thread pool grows while there are waiting requests and shrinks when there are idle threads
+        server = MagicMock()
+        server.requests.qsize = 3
+        server.requests.idle = 0
+        adapter.SCALE_INTERVAL = 0
+        adapter.stopped = False
+
+        def grow(amount):
+            server.requests.qsize = 0
+            server.requests.idle = 13
+
+        def shrink(amount):
+            adapter.stopped = True
+
+        server.requests.grow.side_effect = grow
+        server.requests.shrink.side_effect = shrink
+        adapter.scale_threads(server)
+        self.assertEqual(server.requests.grow.call_args_list[0][0], (3,))
+        self.assertEqual(server.requests.shrink.call_args_list[0][0], (1,))
+
+    @patch("IM.InfrastructureManager.InfrastructureManager.GetInfrastructureRADL")
+    @patch("IM.InfrastructureManager.InfrastructureManager.GetInfrastructureState")
+    @patch("IM.InfrastructureManager.InfrastructureManager.GetInfrastructureInfo")
+    @patch("IM.InfrastructureManager.InfrastructureManager.check_auth_data")
+    @patch("bottle.request")
+    def test_batch(self, bottle_request, check_auth_data, GetInfrastructureInfo, GetInfrastructureState,
+                   GetInfrastructureRADL):
+        """Test REST batch requests."""
+        bottle_request.environ = {'HTTP_HOST': 'imserver.com'}
+        bottle_request.headers = {"AUTHORIZATION": "type = InfrastructureManager; username = user; password = pass",
+                                  "Accept": "application/json"}
+        auth = Authentication([{'type': 'InfrastructureManager', 'username': 'user', 'password': 'pass'}])
+        check_auth_data.return_value = auth
+        GetInfrastructureInfo.return_value = ["1", "2"]
+        GetInfrastructureState.return_value = {'state': "running", 'vm_states': {"1": "running"}}
+        GetInfrastructureRADL.side_effect = [UnauthorizedUserException(), "radl"]
+
+        operations = [{"infid": "1", "operation": "info"},
+                      {"infid": "1", "operation": "state"},
+                      {"infid": "2", "operation": "radl"},
+                      {"infid": "3", "operation": "radl"},
+                      {"infid": "1", "operation": "delete"}]
+        bottle_request.body = BytesIO(json.dumps(operations).encode())
+        res = json.loads(RESTBatch())
+        self.assertEqual(bottle.response.status_code, 207)
+        self.assertEqual(check_auth_data.call_count, 1)
+        results = res["results"]
+        self.assertEqual([(r["infid"], r["operation"]) for r in results],
+                         [(op["infid"], op["operation"]) for op in operations])
+        self.assertEqual(results[0]["code"], 200)
+        self.assertEqual(results[0]["result"], ["http://imserver.com/infrastructures/1/vms/1",
+                                                "http://imserver.com/infrastructures/1/vms/2"])
+        self.assertEqual(results[1]["result"], GetInfrastructureState.return_value)
+        self.assertEqual(sorted(r["code"] for r in results[2:4]), [200, 403])
+        self.assertEqual(results[4]["code"], 400)
+        self.assertIn("Incorrect infid or operation", results[4]["message"])
+        self.assertEqual(GetInfrastructureInfo.call_args[0], ("1", auth))
+
+        bottle_request.body = BytesIO(b"no json")
+        res = RESTBatch()
+        self.assertEqual(bottle.response.status_code, 400)
+
+        Config.REST_BATCH_MAX_OPERATIONS = 2
+        try:
+            bottle_request.body = BytesIO(json.dumps(operations).encode())
+            res = RESTBatch()
+        finally:
+            Config.REST_BATCH_MAX_OPERATIONS = 100
+        self.assertEqual(json.loads(res)["message"], "Too many operations in the batch request (max. 2).")
+
+        check_auth_data.side_effect = InvaliddUserException()
+        bottle_request.body = BytesIO(json.dumps(operations).encode())
+        res = RESTBatch()
+        self.assertEqual(bottle.response.status_code, 401)
+
+    @patch("IM.InfrastructureManager.InfrastructureManager.check_im_user")
+    @patch("bottle.request")
+    def test_auth_cache(self, bottle_request, check_im_user):
+        """Test the cache of the validated auth headers."""
+        check_im_user.return_value = True
+        bottle_request.environ = {'HTTP_HOST': 'imserver.com'}
+        bottle_request.headers = {"AUTHORIZATION": ("type = InfrastructureManager; username = user; password = pass\\n"
+                                                    "id = one; type = OpenNebula; host = onedock.i3m.upv.es:2633; "
+                                                    "username = user; password = pass")}
+        Config.AUTH_CACHE_TIME = 300
+        try:
+            auth = get_auth_header()
+            self.assertFalse(auth.checked)
+            self.assertIsNotNone(auth.cache_key)
+            InfrastructureManager.check_auth_data(auth)
+
+            with patch("IM.REST.parse_auth_header") as parse_auth_header:
+                auth = get_auth_header()
+                self.assertEqual(parse_auth_header.call_count, 0)
+            self.assertTrue(auth.checked)
+            self.assertEqual(auth.getAuthInfo("OpenNebula")[0]["host"], "onedock.i3m.upv.es:2633")
+            self.assertIs(InfrastructureManager.check_auth_data(auth), auth)
+            self.assertEqual(check_im_user.call_count, 1)
+        finally:
+            Config.AUTH_CACHE_TIME = 0
+            InfrastructureManager._auth_cache.clear()
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -18,8 +18,11 @@
 
 import unittest
 import os
+import threading
+import time
 
 from IM.SSHRetry import SSHRetry, SSH
+from IM.SSH import SSHSessionPool
 from mock import patch, MagicMock
 
 
@@ -82,6 +85,28 @@ class TestSSH(unittest.TestCase):
 
         ssh.sftp_get("some_file", "some_file")
 
+    @patch('paramiko.SSHClient')
+    @patch('paramiko.SFTPClient')
+    def test_sftp_read(self, sftp_client, ssh_client):
+        ssh = SSHRetry("host", "user", "passwd", read_file_as_string("../files/privatekey.pem"))
+        sftp = MagicMock()
+        sftp_client.from_transport.return_value = sftp
+        remote_file = sftp.open.return_value.__enter__.return_value
+        remote_file.read.return_value = b"data"
+
+        self.assertEqual(ssh.sftp_read("some_file", 10), b"data")
+        sftp.open.assert_called_with("some_file", "rb")
+        remote_file.seek.assert_called_with(10)
+
+        # Use tail if SFTP is not available
+        ssh_client.return_value.get_transport.return_value.active = False
+        channel = ssh_client.return_value.get_transport.return_value.open_session.return_value
+        channel.makefile.return_value.read.return_value = b"data\xe1"
+        channel.makefile_stderr.return_value.read.return_value = b""
+        channel.recv_exit_status.return_value = 0
+        self.assertEqual(ssh.sftp_read("some file", 10), b"data\xe1")
+        channel.exec_command.assert_called_with("tail -c +11 'some file'\n")
+
     @patch('paramiko.SSHClient')
     @patch('paramiko.SFTPClient')
     def test_sftp_get_files(self, sftp_client, ssh_client):
@@ -198,6 +223,98 @@ class TestSSH(unittest.TestCase):
         res = ssh.sftp_remove("some_file")
         self.assertTrue(res)
 
+    @patch('paramiko.SSHClient')
+    def test_session_pool(self, ssh_client):
+        clients = []
+
+        def new_client():
+            client = MagicMock()
+            client.get_transport.return_value.open_session.return_value.makefile.return_value = ["out"]
+            client.get_transport.return_value.open_session.return_value.makefile_stderr.return_value = []
+            clients.append(client)
+            return client
+
+        ssh_client.side_effect = new_client
+        pool = SSHSessionPool(max_channels=2, max_sessions_per_host=3, idle_time=300)
+
+        # Sequential operations reuse the same connection
+        for _ in range(3):
+            ssh = SSHRetry("host", "user", "passwd", pool=pool)
+            self.assertEqual(ssh.execute("ls")[0], "out")
+        self.assertEqual(len(clients), 1)
+        self.assertEqual(clients[0].close.call_count, 0)
+        clients[0].get_transport().set_keepalive.assert_called_with(30)
+
+        # Other credentials use other connection
+        SSH("host", "user", "other", pool=pool).execute("ls")
+        self.assertEqual(len(clients), 2)
+
+        # Concurrent users share the connection up to max_channels
+        sshs = [SSH("host", "user", "passwd", pool=pool, auto_close=False) for _ in range(5)]
+        for ssh in sshs:
+            ssh.connect()
+        self.assertIs(sshs[0].client, sshs[1].client)
+        self.assertIsNot(sshs[0].client, sshs[2].client)
+        # and the host limit is reached
+        self.assertIn(sshs[4].client, [sshs[0].client, sshs[2].client])
+        self.assertEqual(len(clients), 3)
+        for ssh in sshs:
+            ssh.close()
+
+        # The broken connections are not used
+        clients[0].get_transport().is_active.return_value = False
+        ssh = SSH("host", "user", "passwd", pool=pool)
+        ssh.execute("ls")
+        self.assertEqual(clients[0].close.call_count, 1)
+        self.assertEqual(len(clients), 3)
+
+        pool.close()
+        self.assertEqual([client.close.call_count for client in clients], [1, 1, 1])
+
+        # The idle connections are closed
+        pool.idle_time = -1
+        ssh.execute("ls")
+        self.assertEqual(len(clients), 4)
+        self.assertEqual(clients[3].close.call_count, 1)
+
+    @patch('paramiko.SSHClient')
+    @patch('paramiko.SFTPClient.from_transport')
+    def test_session_pool_errors(self, from_transport, ssh_client):
+        pool = SSHSessionPool(max_channels=2, max_sessions_per_host=2, idle_time=0)
+
+        # The failed operations return the connection to the pool
+        from_transport.return_value.get.side_effect = IOError("No such file")
+        for _ in range(3):
+            with self.assertRaises(IOError):
+                SSH("host", "user", "passwd", pool=pool).sftp_get("/tmp/ctxt_agent.log", "/tmp/file")
+        self.assertEqual(sum(s["users"] for sessions in pool._sessions.values() for s in sessions), 0)
+        self.assertEqual(pool._clients, {})
+
+        # The concurrent callers wait for the connection in progress
+        pool.close()
+        connected = threading.Event()
+        clients = []
+
+        def new_client():
+            client = MagicMock()
+            client.connect.side_effect = lambda *args, **kwargs: connected.wait(5)
+            clients.append(client)
+            return client
+
+        ssh_client.side_effect = new_client
+        sshs = [SSH("host", "user", "passwd", pool=pool, auto_close=False) for _ in range(2)]
+        threads = [threading.Thread(target=ssh.connect) for ssh in sshs]
+        for th in threads:
+            th.start()
+        time.sleep(0.2)
+        connected.set()
+        for th in threads:
+            th.join()
+        self.assertEqual(len(clients), 1)
+        self.assertIs(sshs[0].client, sshs[1].client)
+        for ssh in sshs:
+            ssh.close()
+
     @patch('paramiko.SSHClient')
     @patch('paramiko.SFTPClient.from_transport')
     def test_sftp_chmod(self, from_transport, ssh_client):
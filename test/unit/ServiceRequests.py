@@ -207,6 +207,25 @@ class TestServiceRequests(unittest.TestCase):
             IM.ServiceRequests.IMBaseRequest.GET_INFRASTRUCTURE_OWNERS, ("", ""))
         req._call_function()
 
+    def test_priorities(self):
+        import IM.ServiceRequests
+        from IM.request import Request
+        from IM.config import Config
+        IMBaseRequest = IM.ServiceRequests.IMBaseRequest
+        req = IMBaseRequest.create_request(IMBaseRequest.GET_VERSION)
+        self.assertEqual(req.priority, Request.PRIORITY_HIGH)
+        req = IMBaseRequest.create_request(IMBaseRequest.STOP_VM, ("", "", ""))
+        self.assertEqual(req.priority, Request.PRIORITY_NORMAL)
+        req = IMBaseRequest.create_request(IMBaseRequest.CREATE_INFRASTRUCTURE, ("", "", True))
+        self.assertEqual(req.priority, Request.PRIORITY_LOW)
+
+        Config.REQUEST_PRIORITIES = {IMBaseRequest.CREATE_INFRASTRUCTURE: 0}
+        try:
+            req = IMBaseRequest.create_request(IMBaseRequest.CREATE_INFRASTRUCTURE, ("", "", True))
+            self.assertEqual(req.priority, Request.PRIORITY_HIGH)
+        finally:
+            Config.REQUEST_PRIORITIES = {}
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -18,9 +18,17 @@
 
 import unittest
 import os
+import json
+import time
 import tempfile
+import threading
 
 from IM.VirtualMachine import VirtualMachine
+from IM.CloudInfo import CloudInfo
+from IM.config import Config
+from IM.StateNotifier import StateNotifier
+from IM.CtxtProcessMonitor import CtxtProcessMonitor
+from IM.connectors.CloudConnector import CloudConnector
 from radl import radl_parse
 from mock import patch, MagicMock
 
@@ -99,6 +107,46 @@ class TestVirtualMachine(unittest.TestCase):
         cont_log = vm.get_ctxt_log("", ssh, delete=True)
         self.assertEqual(cont_log, "cont_log")
 
+    def test_update_ctxt_log(self):
+        radl = radl_parse.parse_radl("network public (outbound = 'yes')\n"
+                                     "system test (net_interface.0.connection = 'public' and "
+                                     "net_interface.0.ip = '8.8.8.8')")
+        inf = MagicMock()
+        inf.id = "inf"
+        vm = VirtualMachine(inf, "1", None, radl, radl, None, 1)
+        remote_log = b"line1\n\x00caf\xc3\xa9\tok\n"
+
+        ssh = MagicMock()
+        ssh.sftp_read.side_effect = lambda path, offset: remote_log[offset:]
+        self.assertEqual(VirtualMachine.sanitize_ctxt_log(remote_log), "line1\ncaf\tok\n")
+
+        offset = vm.update_ctxt_log(ssh, "init ")
+        self.assertEqual(offset, len(remote_log))
+        self.assertEqual(vm.cont_out, "init line1\ncaf\tok\n")
+        ssh.sftp_read.assert_called_with("/var/tmp/.im/inf/8.8.8.8_1/ctxt_agent.log", 0)
+
+        # Only the new contents of the log are read
+        remote_log += b"line3\n"
+        offset = vm.update_ctxt_log(ssh, "init ", offset)
+        self.assertEqual(offset, len(remote_log))
+        self.assertEqual(vm.cont_out, "init line1\ncaf\tok\nline3\n")
+        ssh.sftp_read.assert_called_with("/var/tmp/.im/inf/8.8.8.8_1/ctxt_agent.log", offset - 6)
+
+        # In case of error the offset does not change
+        ssh.sftp_read.side_effect = IOError()
+        self.assertEqual(vm.update_ctxt_log(ssh, "init ", offset), offset)
+        self.assertEqual(vm.cont_out, "init line1\ncaf\tok\nline3\n")
+
+        # When the process finishes only the end of the log is read
+        remote_log += b"end\n"
+        ssh.sftp_read.side_effect = lambda path, offset: remote_log[offset:]
+        vm.get_ctxt_output = MagicMock(return_value="output ")
+        vm.ctxt_pid = "1"
+        vm.get_ctxt_process_outputs(ssh, "init ", offset)
+        self.assertEqual(vm.cont_out, "init output line1\ncaf\tok\nline3\nend\n")
+        ssh.sftp_remove.assert_called_with("/var/tmp/.im/inf/8.8.8.8_1/ctxt_agent.log")
+        self.assertIsNone(vm.ctxt_pid)
+
     @patch("tempfile.mkdtemp")
     def test_get_ctxt_output(self, mkdtemp):
         ssh = MagicMock()
@@ -168,6 +216,188 @@ class TestVirtualMachine(unittest.TestCase):
         vm.update_status(None)
         self.assertEqual(vm.info.systems[0].getValue('net_interface.0.dns_name'), "vnode-1")
 
+    def test_lazy_deserialize(self):
+        radl_data = """
+            system test (
+            net_interface.0.connection = 'public' and
+            net_interface.0.ip = '8.8.8.8'
+            )"""
+        radl = radl_parse.parse_radl(radl_data)
+        vm = VirtualMachine(None, "1", None, radl, radl, None, 1)
+        data = vm.serialize()
+
+        vm = VirtualMachine.deserialize(data)
+        # The RADL is not parsed until it is accessed
+        self.assertNotIn('info', vm.__dict__)
+        self.assertEqual(json.loads(vm.serialize())['info'], json.loads(data)['info'])
+        self.assertEqual(vm.info.systems[0].getValue('net_interface.0.ip'), "8.8.8.8")
+        self.assertIn('info', vm.__dict__)
+        self.assertEqual(vm.get_version(), 0)
+
+        vm.info.systems[0].setValue('net_interface.0.ip', "8.8.8.4")
+        new_vm = VirtualMachine.deserialize(vm.serialize())
+        self.assertEqual(new_vm.info.systems[0].getValue('net_interface.0.ip'), "8.8.8.4")
+        self.assertEqual(new_vm.requested_radl.systems[0].getValue('net_interface.0.ip'), "8.8.8.8")
+
+    def test_update_vms_status(self):
+        radl = radl_parse.parse_radl("system test ()")
+        running = {"current": 0, "max": 0}
+        lock = threading.Lock()
+
+        def updateVMInfo(vm, auth):
+            with lock:
+                running["current"] += 1
+                running["max"] = max(running["max"], running["current"])
+            time.sleep(vm.id)
+            with lock:
+                running["current"] -= 1
+            vm.state = VirtualMachine.RUNNING
+            return True, vm
+
+        cloud_con = MagicMock()
+        cloud_con.updateVMInfo.side_effect = updateVMInfo
+        cloud = CloudInfo()
+        cloud.type = "Dummy"
+        vms = [VirtualMachine(None, 0.1, cloud, radl, radl, cloud_con, i) for i in range(6)]
+        vms.append(VirtualMachine(None, 2, cloud, radl, radl, cloud_con, 6))
+        for vm in vms:
+            # force the update of the information
+            vm.last_update = 0
+
+        Config.MAX_SIMULTANEOUS_VM_UPDATES = 4
+        Config.MAX_SIMULTANEOUS_VM_UPDATES_PER_CLOUD = 2
+        try:
+            not_updated = VirtualMachine.update_vms_status(vms, None, 1)
+        finally:
+            Config.MAX_SIMULTANEOUS_VM_UPDATES = 1
+            Config.MAX_SIMULTANEOUS_VM_UPDATES_PER_CLOUD = 0
+
+        # The slow VM returns the previous state
+        self.assertEqual(not_updated, [vms[6]])
+        self.assertEqual(vms[6].state, VirtualMachine.PENDING)
+        self.assertEqual([vm.state for vm in vms[:6]], [VirtualMachine.RUNNING] * 6)
+        self.assertEqual(running["max"], 2)
+
+    def test_update_vms_status_bulk(self):
+        radl = radl_parse.parse_radl("system test ()")
+
+        class BulkConnector(CloudConnector):
+            calls = []
+            locked = []
+
+            def update_vms_info(self, vms, auth_data):
+                BulkConnector.calls.append(sorted(vm.id for vm in vms))
+                # The locks of the VMs are not held while calling the cloud provider
+                BulkConnector.locked.extend(vm._lock.locked() for vm in vms)
+                res = []
+                for vm in vms:
+                    if vm.id == "2":
+                        res.append((False, "Error"))
+                    else:
+                        vm.state = VirtualMachine.RUNNING
+                        res.append((True, vm))
+                return res
+
+        cloud = CloudInfo()
+        cloud.type = "Dummy"
+        cloud.id = "cloud"
+        cloud_con = BulkConnector(cloud, None)
+        inf = MagicMock()
+        vms = [VirtualMachine(inf, str(i), cloud, radl, radl, cloud_con, i) for i in range(3)]
+        for vm in vms:
+            # force the update of the information
+            vm.last_update = 0
+
+        state_version = StateNotifier.get_version(inf.id)
+        for pool_size in [1, 4]:
+            BulkConnector.calls = []
+            BulkConnector.locked = []
+            Config.MAX_SIMULTANEOUS_VM_UPDATES = pool_size
+            try:
+                not_updated = VirtualMachine.update_vms_status(vms, None, 5)
+            finally:
+                Config.MAX_SIMULTANEOUS_VM_UPDATES = 1
+
+            # Only one call to the connector to update all the VMs
+            self.assertEqual(BulkConnector.calls, [["0", "1", "2"]])
+            self.assertEqual(BulkConnector.locked, [False] * 3)
+            self.assertEqual(not_updated, [])
+            self.assertEqual([vm.state for vm in vms], [VirtualMachine.RUNNING, VirtualMachine.RUNNING,
+                                                        VirtualMachine.PENDING])
+            for vm in vms:
+                vm.state = VirtualMachine.PENDING
+                vm.last_update = 0
+
+        # The state changes are notified
+        self.assertNotEqual(StateNotifier.get_version(inf.id), state_version)
+
+    @patch('IM.VirtualMachine.VirtualMachine.get_ctxt_output')
+    @patch('IM.VirtualMachine.VirtualMachine.get_ctxt_log')
+    @patch('IM.VirtualMachine.VirtualMachine.get_ssh_ansible_master')
+    def test_ctxt_process_monitor(self, get_ssh_ansible_master, get_ctxt_log, get_ctxt_output):
+        radl = radl_parse.parse_radl("network public (outbound = 'yes')\n"
+                                     "system test (net_interface.0.connection = 'public' and "
+                                     "net_interface.0.ip = '8.8.8.8')")
+        ssh = MagicMock()
+        ssh.host = "master"
+        ssh.port = 22
+        ssh.username = "user"
+        ssh.execute.return_value = "1\n3\n%s\n" % CtxtProcessMonitor.END_MARK, "", 0
+        get_ssh_ansible_master.return_value = ssh
+        get_ctxt_log.return_value = "log"
+        get_ctxt_output.return_value = "output"
+        inf = MagicMock()
+        inf.id = "inf"
+        vms = [VirtualMachine(inf, str(i), None, radl, radl, None, i) for i in range(3)]
+
+        Config.CHECK_CTXT_PROCESS_INTERVAL = 0.1
+        Config.CHECK_CTXT_PROCESS_MAX_INTERVAL = 0.4
+        Config.UPDATE_CTXT_LOG_INTERVAL = 0
+        try:
+            for i, vm in enumerate(vms):
+                vm.ctxt_pid = str(i + 1)
+                vm.cont_out = "init "
+                vm.launch_check_ctxt_process()
+            self.assertEqual(CtxtProcessMonitor.get_stats(), {"masters": 1, "vms": 3})
+
+            before = time.time()
+            while vms[1].ctxt_pid and time.time() - before < 5:
+                time.sleep(0.05)
+            # All the processes are checked with a single command
+            self.assertIn("for pid in 1 2 3;", ssh.execute.call_args_list[0][0][0])
+            self.assertIsNone(vms[1].ctxt_pid)
+            self.assertEqual(vms[1].cont_out, "init outputlog")
+            get_ctxt_log.assert_called_with("/var/tmp/.im/inf/8.8.8.8_1", ssh, True)
+            self.assertEqual([vm.ctxt_pid for vm in [vms[0], vms[2]]], ["1", "3"])
+
+            # The master is not reachable: back off until the VMs fail
+            ssh.execute.side_effect = Exception("Connection error")
+            ssh.execute.reset_mock()
+            Config.MAX_SSH_ERRORS = 2
+            before = time.time()
+            while vms[0].ctxt_pid and time.time() - before < 5:
+                time.sleep(0.05)
+            self.assertGreaterEqual(time.time() - before, 0.1 + 0.2 + 0.4 - 0.2)
+            self.assertEqual(ssh.execute.call_count, 3)
+            self.assertIsNone(vms[0].ctxt_pid)
+            self.assertFalse(vms[2].configured)
+            self.assertIn("Too much errors getting the status of ctxt process", vms[2].cont_out)
+
+            # Killed processes stop being checked
+            vms[0].ctxt_pid = "1"
+            vms[0].launch_check_ctxt_process()
+            vms[0].ctxt_pid = None
+            before = time.time()
+            while CtxtProcessMonitor.get_stats()["vms"] and time.time() - before < 5:
+                time.sleep(0.05)
+            self.assertEqual(CtxtProcessMonitor.get_stats(), {"masters": 0, "vms": 0})
+        finally:
+            Config.CHECK_CTXT_PROCESS_INTERVAL = 10
+            Config.CHECK_CTXT_PROCESS_MAX_INTERVAL = 60
+            Config.UPDATE_CTXT_LOG_INTERVAL = 20
+            Config.MAX_SSH_ERRORS = 5
+            CtxtProcessMonitor.stop()
+
 
 if __name__ == '__main__':
     unittest.main()
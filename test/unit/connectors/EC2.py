@@ -27,7 +27,7 @@ from IM.auth import Authentication
 from radl import radl_parse
 from IM.VirtualMachine import VirtualMachine
 from IM.InfrastructureInfo import InfrastructureInfo
-from IM.connectors.EC2 import EC2CloudConnector
+from IM.connectors.EC2 import EC2CloudConnector, InstanceTypeInfo
 from IM.config import Config
 from mock import patch, MagicMock, call
 
@@ -506,6 +506,79 @@ class TestEC2Connector(TestCloudConnectorBase):
         self.assertTrue(success, msg="ERROR: updating VM info.")
         self.assertNotIn("ERROR", self.log.getvalue(), msg="ERROR found in log: %s" % self.log.getvalue())
 
+    @patch('IM.connectors.EC2.EC2CloudConnector.get_instance_type_by_name')
+    @patch('IM.connectors.EC2.EC2CloudConnector.get_connection')
+    def test_35_update_vms_info(self, get_connection, get_instance_type_by_name):
+        radl_data = """
+            network net (outbound = 'yes')
+            system test (
+            cpu.arch='x86_64' and
+            cpu.count=1 and
+            memory.size=512m and
+            net_interface.0.connection = 'net' and
+            disk.0.os.name = 'linux' and
+            disk.0.image.url = 'one://server.com/1' and
+            disk.0.os.credentials.username = 'user' and
+            disk.0.os.credentials.password = 'pass'
+            )"""
+        radl = radl_parse.parse_radl(radl_data)
+        radl.check()
+
+        auth = Authentication([{'id': 'ec2', 'type': 'EC2', 'username': 'user', 'password': 'pass'}])
+        ec2_cloud = self.get_ec2_cloud()
+        get_instance_type_by_name.return_value = InstanceTypeInfo("t1.micro", ["x86_64"], 1, 1, 613)
+
+        def get_instance(instance_id, ip):
+            instance = MagicMock()
+            instance.id = instance_id
+            instance.tags = []
+            instance.virtualization_type = "vt"
+            instance.placement = "us-east-1"
+            instance.state = "running"
+            instance.instance_type = "t1.micro"
+            instance.launch_time = "2016-12-31T00:00:00"
+            instance.ip_address = ip
+            instance.private_ip_address = "10.0.0.1"
+            return instance
+
+        conns = {"us-east-1": MagicMock(), "us-west-1": MagicMock()}
+        get_connection.side_effect = lambda region, auth_data: conns[region]
+        reservation = MagicMock()
+        reservation.instances = [get_instance("id-1", "158.42.1.1"), get_instance("id-2", "158.42.1.2")]
+        conns["us-east-1"].get_all_instances.return_value = [reservation]
+        conns["us-east-1"].get_all_addresses.return_value = []
+        sir = MagicMock()
+        sir.state = "open"
+        sir.id = "sid-4"
+        sir.instance_id = None
+        conns["us-east-1"].get_all_spot_instance_requests.return_value = [sir]
+        # The list of instances of the region fails: they are updated one by one
+        reservation3 = MagicMock()
+        reservation3.instances = [get_instance("id-3", "158.42.1.3")]
+        conns["us-west-1"].get_all_instances.side_effect = [Exception("Error listing"), [reservation3]]
+        conns["us-west-1"].get_all_addresses.return_value = []
+
+        inf = MagicMock()
+        vms = [VirtualMachine(inf, vm_id, ec2_cloud.cloud, radl, radl, ec2_cloud, num)
+               for num, vm_id in enumerate(["us-east-1;id-1", "us-east-1;id-2", "us-west-1;id-3",
+                                            "us-east-1;sid-4"])]
+
+        res = ec2_cloud.update_vms_info(vms, auth)
+
+        self.assertEqual([success for success, _ in res], [True] * 4)
+        self.assertEqual([vm.state for vm in vms], [VirtualMachine.RUNNING] * 3 + [VirtualMachine.PENDING])
+        self.assertEqual([vm.getPublicIP() for vm in vms[:3]], ["158.42.1.1", "158.42.1.2", "158.42.1.3"])
+        # The instances of the same region are requested with one call
+        self.assertEqual(conns["us-east-1"].get_all_instances.call_args_list, [call(["id-1", "id-2"])])
+        self.assertEqual(conns["us-west-1"].get_all_instances.call_args_list, [call(["id-3"]), call(["id-3"])])
+        self.assertEqual(conns["us-east-1"].get_all_spot_instance_requests.call_count, 1)
+
+        # A connection error in one region does not affect the rest
+        conns["us-west-1"].get_all_instances.side_effect = None
+        get_connection.side_effect = lambda region, auth_data: conns[region] if region == "us-east-1" else 1 / 0
+        res = ec2_cloud.update_vms_info(vms[:3], auth)
+        self.assertEqual([success for success, _ in res], [True, True, False])
+
     @patch('IM.connectors.EC2.EC2CloudConnector.get_connection')
     def test_40_stop(self, get_connection):
         auth = Authentication([{'id': 'ec2', 'type': 'EC2', 'username': 'user', 'password': 'pass'}])
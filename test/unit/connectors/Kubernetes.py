@@ -89,6 +89,10 @@ class TestKubernetesConnector(TestCloudConnectorBase):
                 resp.text = ('{"metadata": {"namespace":"namespace", "name": "name"}, "status": '
                              '{"phase":"Running", "hostIP": "158.42.1.1", "podIP": "10.0.0.1"}, '
                              '"spec": {"volumes": [{"persistentVolumeClaim": {"claimName" : "cname"}}]}}')
+            elif url.endswith("/pods"):
+                resp.status_code = 200
+                resp.text = ('{"items": [{"metadata": {"namespace":"namespace", "name": "2"}, "status": '
+                             '{"phase":"Pending", "hostIP": "158.42.1.2", "podIP": "10.0.0.2"}}]}')
             if url == "/api/v1/namespaces/infid":
                 resp.status_code = 200
         elif method == "POST":
@@ -185,6 +189,41 @@ class TestKubernetesConnector(TestCloudConnectorBase):
         self.assertEqual(vm.info.systems[0].getValue("net_interface.1.ip"), "10.0.0.1")
         self.assertNotIn("ERROR", self.log.getvalue(), msg="ERROR found in log: %s" % self.log.getvalue())
 
+    @patch('requests.request')
+    def test_35_update_vms_info(self, requests):
+        radl_data = """
+            network net (outbound = 'yes')
+            system test (
+            net_interface.0.connection = 'net' and
+            disk.0.image.url = 'docker://someimage'
+            )"""
+        radl = radl_parse.parse_radl(radl_data)
+        radl.check()
+
+        auth = Authentication([{'id': 'kube', 'type': 'Kubernetes',
+                                'host': 'http://server.com:8080', 'token': 'token'}])
+        kube_cloud = self.get_kube_cloud()
+
+        inf = MagicMock()
+        inf.id = "namespace"
+        vm1 = VirtualMachine(inf, "1", kube_cloud.cloud, radl, radl, kube_cloud, 1)
+        vm2 = VirtualMachine(inf, "2", kube_cloud.cloud, radl.clone(), radl, kube_cloud, 2)
+
+        requests.side_effect = self.get_response
+
+        res = kube_cloud.update_vms_info([vm1, vm2], auth)
+
+        self.assertEqual(res, [(True, vm1), (True, vm2)])
+        self.assertEqual(vm1.state, VirtualMachine.RUNNING)
+        self.assertEqual(vm1.info.systems[0].getValue("net_interface.1.ip"), "10.0.0.1")
+        self.assertEqual(vm2.state, VirtualMachine.PENDING)
+        self.assertEqual(vm2.info.systems[0].getValue("net_interface.1.ip"), "10.0.0.2")
+        # The POD 2 is get in the list of PODs and the POD 1 individually
+        urls = [call[0][1] for call in requests.call_args_list]
+        self.assertEqual(len([url for url in urls if url.endswith("/namespaces/namespace/pods")]), 1)
+        self.assertEqual(len([url for url in urls if "/pods/2" in url]), 0)
+        self.assertNotIn("ERROR", self.log.getvalue(), msg="ERROR found in log: %s" % self.log.getvalue())
+
     @patch('requests.request')
     def test_55_alter(self, requests):
         radl_data = """
@@ -511,6 +511,77 @@ class TestOSTConnector(TestCloudConnectorBase):
         self.assertEqual(request.call_args_list[0][1]['headers']['Authorization'], auth)
         self.assertNotIn("ERROR", self.log.getvalue(), msg="ERROR found in log: %s" % self.log.getvalue())
 
+    @patch('libcloud.compute.drivers.openstack.OpenStackNodeDriver')
+    def test_35_update_vms_info(self, get_driver):
+        radl_data = """
+            network net (outbound = 'yes')
+            system test (
+            cpu.arch='x86_64' and
+            cpu.count=1 and
+            memory.size=512m and
+            net_interface.0.connection = 'net' and
+            disk.0.os.name = 'linux' and
+            disk.0.image.url = 'ost://server.com/ami-id' and
+            disk.0.os.credentials.username = 'user' and
+            disk.0.os.credentials.password = 'pass'
+            )"""
+        radl = radl_parse.parse_radl(radl_data)
+        radl.check()
+
+        auth = Authentication([{'id': 'ost', 'type': 'OpenStack', 'username': 'user',
+                                'password': 'pass', 'tenant': 'tenant', 'host': 'https://server.com:5000'}])
+        ost_cloud = self.get_ost_cloud()
+
+        inf = MagicMock()
+        inf.vm_list = []
+        vms = [VirtualMachine(inf, str(num), ost_cloud.cloud, radl, radl, ost_cloud, num) for num in range(3)]
+
+        driver = MagicMock()
+        get_driver.return_value = driver
+
+        nodes = {}
+        for num in range(3):
+            node = MagicMock()
+            node.id = str(num)
+            node.state = "running"
+            node.extra = {'flavorId': 'small', 'addresses': {'public': [{'version': '4', 'addr': '8.8.8.%d' % num}]}}
+            node.public_ips = []
+            node.private_ips = []
+            node.driver = driver
+            nodes[node.id] = node
+        # The last node is not in the list (e.g. paginated results)
+        driver.list_nodes.return_value = [nodes["0"], nodes["1"]]
+        driver.ex_get_node_details.side_effect = lambda node_id: nodes[node_id]
+
+        node_size = MagicMock()
+        node_size.ram = 512
+        node_size.price = 1
+        node_size.disk = 1
+        node_size.vcpus = 1
+        node_size.name = "small"
+        node_size.extra = {'some': 'value'}
+        driver.ex_get_size.return_value = node_size
+        driver.ex_list_networks.return_value = []
+        driver.ex_list_ports.return_value = []
+
+        res = ost_cloud.update_vms_info(vms, auth)
+
+        self.assertEqual([success for success, _ in res], [True] * 3)
+        self.assertEqual([vm.state for vm in vms], [VirtualMachine.RUNNING] * 3)
+        self.assertEqual([vm.getPublicIP() for vm in vms], ["8.8.8.0", "8.8.8.1", "8.8.8.2"])
+        self.assertEqual(driver.list_nodes.call_count, 1)
+        # Only the missing node is requested alone
+        self.assertEqual(driver.ex_get_node_details.call_args_list, [call("2")])
+        # The flavor is only requested once
+        self.assertEqual(driver.ex_get_size.call_count, 1)
+
+        # If the list of nodes fails the VMs are updated one by one
+        driver.ex_get_node_details.reset_mock()
+        driver.list_nodes.side_effect = Exception("Error listing nodes")
+        res = ost_cloud.update_vms_info(vms, auth)
+        self.assertEqual([success for success, _ in res], [True] * 3)
+        self.assertEqual(driver.ex_get_node_details.call_args_list, [call("0"), call("1"), call("2")])
+
     @patch('libcloud.compute.drivers.openstack.OpenStackNodeDriver')
     def test_40_stop(self, get_driver):
         auth = Authentication([{'id': 'ost', 'type': 'OpenStack', 'username': 'user',
@@ -17,9 +17,11 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import unittest
+import threading
+import time
 import os
 
-from IM.db import DataBase
+from IM.db import DataBase, DataBasePool
 from mock import patch, MagicMock
 
 
@@ -41,6 +43,19 @@ class TestDataBase(unittest.TestCase):
         db.execute("insert into test (id, data, date) values (%s, %s, now())", (1, "Data"))
         res = db.select("select data from test where id = %s", (1,))
         self.assertEqual(res, [("Data",)])
+
+        # The sentences are executed in one transaction
+        self.assertTrue(db.executemany_transaction([("delete from test", None),
+                                                    ("insert into test (id, data, date) values (%s, %s, now())",
+                                                     [(2, "Data2"), (3, "Data3")])]))
+        self.assertEqual(db.select("select id from test order by id"), [(2,), (3,)])
+        with self.assertRaises(Exception):
+            db.executemany_transaction([("delete from test", None),
+                                        ("insert into test (id, data, date) values (%s, %s, now())",
+                                         [(4, "Data4"), (4, "Data4")])])
+        db.close()
+        self.assertTrue(db.connect())
+        self.assertEqual(db.select("select id from test order by id"), [(2,), (3,)])
         db.close()
 
     @patch('IM.db.mdb.connect')
@@ -102,6 +117,86 @@ class TestDataBase(unittest.TestCase):
 
         db.close()
 
+    def test_sqlite_pool(self):
+        filename = "/tmp/inf_pool.dat"
+        if os.path.exists(filename):
+            os.unlink(filename)
+        db_url = "sqlite://" + filename
+        DataBasePool.close_pools()
+        db = DataBase(db_url, pooled=True)
+        self.assertTrue(db.connect())
+        db.execute("CREATE TABLE test(id int PRIMARY KEY, date TIMESTAMP, data LONGBLOB)")
+        db.execute("insert into test (id, data, date) values (%s, %s, now())", (1, "Data"))
+        connection = db.connection
+        self.assertTrue(db.close())
+        self.assertIsNone(db.connection)
+
+        pool = DataBasePool.get_pool(db_url)
+        self.assertEqual(pool.size(), (1, 1))
+
+        # The same connection must be reused
+        db2 = DataBase(db_url, pooled=True)
+        self.assertTrue(db2.connect())
+        self.assertIs(db2.connection, connection)
+        self.assertEqual(db2.select("select data from test where id = %s", (1,)), [("Data",)])
+        self.assertEqual(pool.size(), (1, 0))
+        db2.close()
+        self.assertEqual(pool.get_stats()["created"], 1)
+        self.assertEqual(pool.get_stats()["reused"], 1)
+
+        DataBasePool.close_pools()
+        self.assertEqual(pool.size(), (0, 0))
+
+    def test_pool_max_size(self):
+        db_url = "sqlite:///tmp/inf_pool_max.dat"
+        pool = DataBasePool(db_url, min_size=0, max_size=2, timeout=0.5)
+        db1 = pool.get()
+        db2 = pool.get()
+        self.assertEqual(pool.size(), (2, 0))
+        before = time.time()
+        self.assertIsNone(pool.get())
+        self.assertGreaterEqual(time.time() - before, 0.5)
+
+        # A waiting thread gets the connection when released
+        res = []
+        th = threading.Thread(target=lambda: res.append(pool.get(5)))
+        th.start()
+        time.sleep(0.2)
+        pool.put(db1)
+        th.join()
+        self.assertIs(res[0], db1)
+
+        # A broken connection is discarded
+        pool.put(db2, broken=True)
+        self.assertEqual(pool.size(), (1, 0))
+        pool.put(db1)
+        pool.close_all()
+
+    def test_pool_evict_and_check(self):
+        db_url = "sqlite:///tmp/inf_pool_evict.dat"
+        pool = DataBasePool(db_url, min_size=1, max_size=5, max_idle_time=0, check_interval=0)
+        db1 = pool.get()
+        db2 = pool.get()
+        pool.put(db1)
+        pool.put(db2)
+        self.assertEqual(pool.size(), (2, 2))
+        time.sleep(0.01)
+        # The idle ones are evicted, keeping the min size
+        db3 = pool.get()
+        self.assertEqual(pool.size(), (1, 0))
+        self.assertEqual(pool.get_stats()["evicted"], 1)
+
+        # A connection that fails the health check is replaced
+        db3.connection.close()
+        pool.put(db3)
+        time.sleep(0.01)
+        db4 = pool.get()
+        self.assertIsNot(db4, db3)
+        self.assertTrue(db4.ping())
+        self.assertEqual(pool.get_stats()["discarded"], 1)
+        pool.put(db4)
+        pool.close_all()
+
 
 if __name__ == '__main__':
     unittest.main()
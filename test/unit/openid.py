@@ -19,8 +19,14 @@
 import unittest
 import os
 import json
+import time
+import base64
 
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature
 from IM.openid.OpenIDClient import OpenIDClient
+from IM.openid.JWT import JWT
 from mock import patch, MagicMock
 
 
@@ -30,6 +36,61 @@ def read_file_as_string(file_name):
     return open(abs_file_path, 'r').read()
 
 
+def b64e(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def int_b64e(value):
+    return b64e(value.to_bytes((value.bit_length() + 7) // 8, "big")).decode()
+
+
+class LocalIssuer(object):
+    """
+    Stand-in OIDC issuer that signs tokens with its own keys
+    """
+
+    def __init__(self):
+        self.keys = {"rsa1": rsa.generate_private_key(public_exponent=65537, key_size=2048),
+                     "ec1": ec.generate_private_key(ec.SECP256R1())}
+
+    def jwks(self):
+        keys = []
+        for kid, key in self.keys.items():
+            numbers = key.public_key().public_numbers()
+            if isinstance(key, rsa.RSAPrivateKey):
+                keys.append({"kty": "RSA", "kid": kid, "use": "sig", "alg": "RS256",
+                             "n": int_b64e(numbers.n), "e": int_b64e(numbers.e)})
+            else:
+                keys.append({"kty": "EC", "kid": kid, "use": "sig", "alg": "ES256", "crv": "P-256",
+                             "x": int_b64e(numbers.x), "y": int_b64e(numbers.y)})
+        return {"keys": keys}
+
+    def sign(self, payload, kid):
+        key = self.keys[kid]
+        alg = "RS256" if isinstance(key, rsa.RSAPrivateKey) else "ES256"
+        header = {"alg": alg, "kid": kid, "typ": "JWT"}
+        signing_input = b64e(json.dumps(header).encode()) + b"." + b64e(json.dumps(payload).encode())
+        if alg == "RS256":
+            signature = key.sign(signing_input, padding.PKCS1v15(), hashes.SHA256())
+        else:
+            r, s = decode_dss_signature(key.sign(signing_input, ec.ECDSA(hashes.SHA256())))
+            signature = r.to_bytes(32, "big") + s.to_bytes(32, "big")
+        return (signing_input + b"." + b64e(signature)).decode()
+
+    def get_response(self, method, url, verify=False, **kwargs):
+        resp = MagicMock()
+        resp.status_code = 200
+        if url.endswith("/.well-known/openid-configuration"):
+            resp.json.return_value = {"introspection_endpoint": "https://issuer/introspect",
+                                      "userinfo_endpoint": "https://issuer/userinfo",
+                                      "jwks_uri": "https://issuer/jwks"}
+        elif url == "https://issuer/jwks":
+            resp.json.return_value = self.jwks()
+        else:
+            resp.status_code = 404
+        return resp
+
+
 class TestOpenIDClient(unittest.TestCase):
     """
     Class to test the TTCLient class
@@ -81,6 +142,73 @@ class TestOpenIDClient(unittest.TestCase):
         self.assertTrue(success)
         self.assertEqual(json.loads(token_info), token_info_resp)
 
+    @patch('requests.request')
+    def test_30_get_openid_configuration(self, requests):
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"introspection_endpoint": "/introspect",
+                                           "userinfo_endpoint": "/userinfo"}
+        requests.return_value = mock_response
+
+        OpenIDClient.get_openid_configuration("https://issuer")
+        conf = OpenIDClient.get_openid_configuration("https://issuer")
+        self.assertEqual(conf["userinfo_endpoint"], "/userinfo")
+        self.assertEqual(requests.call_count, 1)
+
+        # The configuration is downloaded again after ISSUER_CONFIG_CACHE_TIME
+        OpenIDClient._ISSUER_CONFIG_UPDATE["https://issuer"] -= OpenIDClient.ISSUER_CONFIG_CACHE_TIME
+        OpenIDClient.get_openid_configuration("https://issuer")
+        self.assertEqual(requests.call_count, 2)
+
+    def test_40_jwt_verify(self):
+        issuer = LocalIssuer()
+        jwks = dict((key["kid"], key) for key in issuer.jwks()["keys"])
+        payload = {"iss": "https://issuer", "sub": "user", "exp": int(time.time()) + 100}
+        for kid in ["rsa1", "ec1"]:
+            token = issuer.sign(payload, kid)
+            self.assertEqual(JWT.verify(token, jwks[kid]), payload)
+
+            # Modified tokens are rejected
+            header, _, signature = token.split(".")
+            other_payload = b64e(json.dumps({"iss": "https://issuer", "sub": "admin"}).encode()).decode()
+            with self.assertRaises(Exception):
+                JWT.verify("%s.%s.%s" % (header, other_payload, signature), jwks[kid])
+
+        # And the ones signed with other keys
+        with self.assertRaises(Exception):
+            JWT.verify(issuer.sign(payload, "rsa1"), LocalIssuer().jwks()["keys"][0])
+
+    @patch('requests.request')
+    def test_50_verify_token(self, requests):
+        issuer = LocalIssuer()
+        requests.side_effect = issuer.get_response
+        OpenIDClient.ISSUER_CONFIG_CACHE = {}
+        OpenIDClient.JWKS_CACHE = {}
+        payload = {"iss": "https://issuer", "sub": "user", "exp": int(time.time()) + 100}
+
+        success, info = OpenIDClient.verify_token(issuer.sign(payload, "rsa1"))
+        self.assertTrue(success, msg=info)
+        self.assertEqual(info, payload)
+        calls = requests.call_count
+        success, info = OpenIDClient.verify_token(issuer.sign(payload, "ec1"))
+        self.assertTrue(success, msg=info)
+        # The keys are cached
+        self.assertEqual(requests.call_count, calls)
+
+        # Key rotation: the keys are downloaded again if the kid is not found
+        issuer.keys["rsa2"] = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        OpenIDClient._JWKS_UPDATE["https://issuer"] -= OpenIDClient.JWKS_MIN_REFRESH_TIME
+        success, info = OpenIDClient.verify_token(issuer.sign(payload, "rsa2"))
+        self.assertTrue(success, msg=info)
+        self.assertEqual(requests.call_count, calls + 1)
+
+        # But not too often
+        issuer.keys["rsa3"] = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        success, info = OpenIDClient.verify_token(issuer.sign(payload, "rsa3"))
+        self.assertFalse(success)
+        self.assertEqual(info, "Key rsa3 not found in the issuer keys")
+        self.assertEqual(requests.call_count, calls + 1)
+
 
 if __name__ == '__main__':
     unittest.main()
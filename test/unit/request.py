@@ -17,9 +17,12 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import unittest
+import threading
 import time
 
-from IM.request import Request, RequestQueue, AsyncRequest
+from mock import patch
+from IM.request import Request, RequestQueue, AsyncRequest, RequestExecutor, stop_request_executor
+from IM.config import Config
 
 
 class DummyRequest(AsyncRequest):
@@ -37,6 +40,24 @@ class SleepRequest(AsyncRequest):
         return True
 
 
+class OKRequest(AsyncRequest):
+    def _execute(self):
+        self.set("OK")
+        return True
+
+
+class BlockingRequest(AsyncRequest):
+    LANE = "read"
+    RUNNING = []
+    EVENT = threading.Event()
+
+    def _execute(self):
+        BlockingRequest.RUNNING.append(self)
+        BlockingRequest.EVENT.wait()
+        self.set("OK")
+        return True
+
+
 class TestRequest(unittest.TestCase):
     """
     Class to test the Requests classes
@@ -72,6 +93,71 @@ class TestRequest(unittest.TestCase):
         time.sleep(2.5)
         self.assertEqual(sr.status(), Request.STATUS_PROCESSED)
 
+    def test_request_priorities(self):
+        queue = RequestQueue()
+        low = Request()
+        normal = Request()
+        high = Request()
+        queue.put((Request.PRIORITY_LOW, low))
+        queue.put((Request.PRIORITY_NORMAL, normal))
+        queue.put((Request.PRIORITY_HIGH, high))
+        self.assertEqual([queue.get()[1] for _ in range(3)], [high, normal, low])
+
+        # Old low priority requests are promoted
+        Config.REQUEST_PRIORITY_AGING = 1
+        try:
+            queue.put((Request.PRIORITY_LOW, low))
+            time.sleep(1.1)
+            queue.put((Request.PRIORITY_NORMAL, normal))
+            queue.put((Request.PRIORITY_HIGH, high))
+            self.assertEqual([queue.get()[1] for _ in range(3)], [high, low, normal])
+        finally:
+            Config.REQUEST_PRIORITY_AGING = 10
+
+    def test_request_executor(self):
+        executor = RequestExecutor({"read": 2}, max_queue_size=1)
+        with patch('IM.request.get_request_executor', return_value=executor):
+            queue = RequestQueue()
+            requests = [BlockingRequest() for _ in range(4)]
+            for req in requests:
+                queue.put((1, req))
+            # The requests of other lanes are not blocked
+            dr = OKRequest()
+            queue.put((1, dr))
+            queue.process_requests(-1)
+            dr.wait()
+            self.assertEqual(dr.status(), Request.STATUS_PROCESSED)
+
+            for _ in range(20):
+                if len(BlockingRequest.RUNNING) == 2:
+                    break
+                time.sleep(0.05)
+            # Two requests are running, one waits in the queue and the last one is rejected
+            self.assertEqual(len(BlockingRequest.RUNNING), 2)
+            self.assertEqual(requests[3].status(), Request.STATUS_ERROR)
+            self.assertEqual(requests[3].get(), "Too many requests in the queue. Try again later.")
+            stats = executor.get_stats()
+            self.assertEqual(stats["read"]["queue_depth"], 1)
+            self.assertEqual(stats["read"]["active"], 2)
+            self.assertEqual(stats["read"]["rejected"], 1)
+            self.assertEqual(stats["default"]["workers"], 10)
+
+            BlockingRequest.EVENT.set()
+            requests[2].wait()
+            self.assertEqual(requests[2].status(), Request.STATUS_PROCESSED)
+            with patch('IM.request.REQUEST_EXECUTOR', executor, create=True):
+                stop_request_executor()
+            stats = executor.get_stats()
+            self.assertEqual(stats["read"]["processed"], 3)
+            self.assertEqual(stats["read"]["queue_depth"], 0)
+            self.assertGreater(stats["read"]["max_wait_time"], 0)
+
+            # The requests are rejected once the executor is stopped
+            dr = OKRequest()
+            queue.put((1, dr))
+            queue.process_requests(-1)
+            self.assertEqual(dr.status(), Request.STATUS_ERROR)
+
 
 if __name__ == '__main__':
     unittest.main()
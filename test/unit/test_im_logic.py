@@ -23,6 +23,9 @@ import unittest
 import sys
 import json
 import base64
+import hashlib
+import threading
+from collections import OrderedDict
 
 from mock import Mock, patch, MagicMock
 
@@ -35,8 +38,10 @@ Config.MAX_SIMULTANEOUS_LAUNCHES = 2
 
 from IM.VirtualMachine import VirtualMachine
 from IM.InfrastructureManager import InfrastructureManager as IM
-from IM.InfrastructureManager import DisabledFunctionException
+from IM.InfrastructureManager import DisabledFunctionException, InvaliddUserException, UnauthorizedUserException
 from IM.InfrastructureList import InfrastructureList
+from IM.VMStatePoller import VMStatePoller
+from IM.StateNotifier import StateNotifier
 from IM.auth import Authentication
 from radl.radl import RADL, system, deploy, Feature, SoftFeatures
 from radl.radl_parse import parse_radl
@@ -45,6 +50,8 @@ from IM.CloudInfo import CloudInfo
 from IM.connectors.CloudConnector import CloudConnector
 from IM.SSH import SSH
 from IM.InfrastructureInfo import InfrastructureInfo
+from IM.ConfManager import ConfManager
+from IM.db import DataBase
 
 
 def read_file_as_string(file_name):
@@ -134,7 +141,7 @@ class TestIM(unittest.TestCase):
         return cloud
 
     @staticmethod
-    def gen_token(aud=None, exp=None, user_sub="user_sub"):
+    def gen_token(aud=None, exp=None, user_sub="user_sub", username=None):
         data = {
             "sub": user_sub,
             "iss": "https://iam-test.indigo-datacloud.eu/",
@@ -144,6 +151,8 @@ class TestIM(unittest.TestCase):
         }
         if aud:
             data["aud"] = aud
+        if username:
+            data["preferred_username"] = username
         if exp:
             data["exp"] = int(time.time()) + exp
         return ("eyJ0eXAiOiJKV1QiLCJhbGciOiJIUzI1NiJ9.%s.ignored" %
@@ -631,6 +640,318 @@ class TestIM(unittest.TestCase):
         IM.DestroyInfrastructure(infId, auth)
         IM.DestroyInfrastructure(infId1, auth)
 
+    def test_get_infrastructure_reuse(self):
+        """Reuse the infrastructure already loaded in the request."""
+        auth0 = self.getAuth([0], [], [("Dummy", 0)])
+        infId = IM.CreateInfrastructure("", auth0)
+        auth1 = self.getAuth([1], [], [("Dummy", 0)])
+
+        inf = IM.get_infrastructure(infId, auth0)
+        auth0.authorized_inf = inf
+        with patch('IM.InfrastructureList.InfrastructureList.get_inf_ids') as get_inf_ids:
+            self.assertIs(IM.get_infrastructure(infId, auth0), inf)
+            self.assertEqual(get_inf_ids.call_count, 0)
+            # It is only reused once
+            self.assertIsNone(auth0.authorized_inf)
+            # It is still authorized
+            auth1.authorized_inf = inf
+            with self.assertRaises(UnauthorizedUserException):
+                IM.get_infrastructure(infId, auth1)
+
+        IM.DestroyInfrastructure(infId, auth0)
+
+    def test_get_infrastructure_list_owners_index(self):
+        """Get infrastructure List using the owners index."""
+        filename = "/tmp/inf_owners.dat"
+        if os.path.exists(filename):
+            os.unlink(filename)
+        Config.DATA_DB = "sqlite://" + filename
+        InfrastructureList.load_data()
+        self.assertTrue(InfrastructureList._has_owners_index(Config.DATA_DB))
+
+        auth0, auth1, auth2 = self.getAuth([0]), self.getAuth([1]), self.getAuth([2])
+        infId0 = IM.CreateInfrastructure("", auth0)
+        infId1 = IM.CreateInfrastructure("", auth1)
+
+        with patch('IM.InfrastructureList.InfrastructureList._get_data_from_db') as get_data:
+            self.assertEqual(IM.GetInfrastructureList(auth0), [infId0])
+            self.assertEqual(IM.GetInfrastructureList(auth1), [infId1])
+            self.assertEqual(IM.GetInfrastructureList(auth2), [])
+            auth = self.getAuth([0, 1])
+            self.assertEqual(sorted(IM.GetInfrastructureList(auth)), sorted([infId0, infId1]))
+            # The infrastructure data must not be loaded
+            self.assertEqual(get_data.call_count, 0)
+
+        IM.ChangeInfrastructureAuth(infId0, auth2, False, auth0)
+        self.assertEqual(IM.GetInfrastructureList(auth2), [infId0])
+        IM.ChangeInfrastructureAuth(infId0, auth2, True, auth0)
+        self.assertEqual(IM.GetInfrastructureList(auth0), [])
+
+        Config.ADMIN_USER = {"username": "user1", "password": "pass1"}
+        inf_ids = IM.GetInfrastructureList(auth1)
+        # The admin username with other password is not the admin user
+        wrong_pass_auth = Authentication([{'type': 'InfrastructureManager', 'username': 'user1', 'password': 'bad'}])
+        wrong_pass_inf_ids = InfrastructureList.get_inf_ids(wrong_pass_auth)
+        Config.ADMIN_USER = {}
+        self.assertEqual(sorted(inf_ids), sorted([infId0, infId1]))
+        self.assertEqual(wrong_pass_inf_ids, [])
+
+        # The passwords are not stored in the index
+        db = DataBase(Config.DATA_DB)
+        self.assertTrue(db.connect())
+        owners = [owner for _, owner in db.select("select id, owner from inf_owners")]
+        db.close()
+        self.assertIn(hashlib.sha256(b"user:user1").hexdigest(), owners)
+        # The owners stored are tracked with the rest of the saved state of the Inf
+        inf = IM.get_infrastructure(infId1, auth1)
+        self.assertEqual(inf._saved_state[4], [hashlib.sha256(b"user:user1").hexdigest()])
+
+        IM.DestroyInfrastructure(infId0, auth2)
+        self.assertEqual(IM.GetInfrastructureList(auth2), [])
+
+        # The index candidates must pass the same checks of InfrastructureInfo.is_authorized
+        token = self.gen_token()
+        inf = IM.get_infrastructure(infId1, auth1)
+        inf.auth = Authentication([{'type': 'InfrastructureManager', 'token': token,
+                                    'username': InfrastructureInfo.OPENID_USER_PREFIX + 'user_sub',
+                                    'password': 'https://iam-test.indigo-datacloud.eu/user_sub'}])
+        inf.changed()
+        InfrastructureList.save_data(infId1)
+        oidc_auth = Authentication([{'type': 'InfrastructureManager', 'token': token,
+                                     'username': InfrastructureInfo.OPENID_USER_PREFIX + 'user_sub'}])
+        self.assertEqual(InfrastructureList.get_inf_ids(oidc_auth), [infId1])
+        # Not OpenID username with the same token
+        no_prefix_auth = Authentication([{'type': 'InfrastructureManager', 'token': token, 'username': 'user_sub'}])
+        self.assertEqual(InfrastructureList.get_inf_ids(no_prefix_auth), [])
+
+        inf.auth = auth1
+        IM.DestroyInfrastructure(infId1, auth1)
+
+    def test_save_only_changed_infs(self):
+        """Save only the modified infrastructures."""
+        auth0 = self.getAuth([0], [], [("Dummy", 0)])
+        infId = IM.CreateInfrastructure("", auth0)
+        inf = IM.get_infrastructure(infId, auth0)
+        InfrastructureList.save_data(infId)
+        serialize = InfrastructureInfo.serialize
+
+        with patch.object(InfrastructureInfo, 'serialize', autospec=True, side_effect=serialize) as ser:
+            IM.GetInfrastructureState(infId, auth0)
+            InfrastructureList.save_data()
+            self.assertEqual(ser.call_count, 0)
+
+            inf.add_cont_msg("Some message")
+            InfrastructureList.save_data(infId)
+            self.assertEqual(ser.call_count, 1)
+            InfrastructureList.save_data(infId)
+            self.assertEqual(ser.call_count, 1)
+
+            # In place modifications must be notified
+            inf.radl.add(system("s0"))
+            inf.changed()
+            InfrastructureList.save_data(infId)
+            self.assertEqual(ser.call_count, 2)
+
+        res = InfrastructureList._get_data_from_db(Config.DATA_DB, infId)
+        self.assertIn("Some message", res[infId].cont_out)
+        self.assertIsNotNone(res[infId].radl.get_system_by_name("s0"))
+
+        # The data loaded from the DB is not stored again
+        with patch.object(InfrastructureInfo, 'serialize', autospec=True, side_effect=serialize) as ser:
+            InfrastructureList._save_data_to_db(Config.DATA_DB, res)
+            self.assertEqual(ser.call_count, 0)
+
+        IM.DestroyInfrastructure(infId, auth0)
+
+    def test_write_behind_save(self):
+        """Save data in write-behind mode."""
+        auth0 = self.getAuth([0], [], [("Dummy", 0)])
+        Config.DB_SAVE_DELAY = 0.5
+        try:
+            infId = IM.CreateInfrastructure("", auth0)
+            inf = IM.get_infrastructure(infId, auth0)
+            inf.add_cont_msg("Some message")
+            InfrastructureList.save_data(infId)
+            self.assertEqual(InfrastructureList.get_save_stats()["queue_depth"], 1)
+
+            time.sleep(1)
+            self.assertEqual(InfrastructureList.get_save_stats()["queue_depth"], 0)
+            self.assertGreater(InfrastructureList.get_save_stats()["flushes"], 0)
+            res = InfrastructureList._get_data_from_db(Config.DATA_DB, infId)
+            self.assertIn("Some message", res[infId].cont_out)
+
+            # The failed saves are queued again
+            inf.add_cont_msg("Failed message")
+            InfrastructureList.save_data(infId)
+            with patch('IM.InfrastructureList.InfrastructureList._save_data_to_db', return_value=False):
+                InfrastructureList.flush_pending_saves()
+            self.assertEqual(InfrastructureList.get_save_stats()["queue_depth"], 1)
+            with patch('IM.InfrastructureList.InfrastructureList._save_data_to_db', side_effect=Exception("error")):
+                InfrastructureList.flush_pending_saves()
+            self.assertEqual(InfrastructureList.get_save_stats()["queue_depth"], 1)
+            InfrastructureList.flush_pending_saves()
+            self.assertEqual(InfrastructureList.get_save_stats()["queue_depth"], 0)
+            res = InfrastructureList._get_data_from_db(Config.DATA_DB, infId)
+            self.assertIn("Failed message", res[infId].cont_out)
+
+            # The pending data must be stored on shutdown
+            inf.add_cont_msg("Other message")
+            InfrastructureList.save_data(infId)
+            InfrastructureList.stop()
+            res = InfrastructureList._get_data_from_db(Config.DATA_DB, infId)
+            self.assertIn("Other message", res[infId].cont_out)
+        finally:
+            Config.DB_SAVE_DELAY = 0
+
+    def test_save_locks(self):
+        """Saves of different Infs do not block each other."""
+        auth0 = self.getAuth([0], [], [("Dummy", 0)])
+        inf_ids = [IM.CreateInfrastructure("", auth0) for _ in range(2)]
+        for inf_id in inf_ids:
+            IM.get_infrastructure(inf_id, auth0).add_cont_msg("Some message")
+        save_locks = InfrastructureList._get_save_locks([inf_ids[0]])
+        self.assertEqual(len(save_locks), 1)
+        while save_locks == InfrastructureList._get_save_locks([inf_ids[1]]):
+            # Both Infs use the same lock, use a different number of stripes
+            InfrastructureList._save_locks.append(threading.Lock())
+            save_locks = InfrastructureList._get_save_locks([inf_ids[0]])
+
+        # Block the saves of the first Inf
+        with save_locks[0]:
+            saver = threading.Thread(target=InfrastructureList.save_data, args=(inf_ids[0],))
+            saver.start()
+            InfrastructureList.save_data(inf_ids[1])
+            res = InfrastructureList._get_data_from_db(Config.DATA_DB, inf_ids[1])
+            self.assertIn("Some message", res[inf_ids[1]].cont_out)
+            saver.join(0.2)
+            self.assertTrue(saver.is_alive())
+        saver.join()
+        res = InfrastructureList._get_data_from_db(Config.DATA_DB, inf_ids[0])
+        self.assertIn("Some message", res[inf_ids[0]].cont_out)
+
+    def test_inf_cache(self):
+        """Bounded cache of infrastructures."""
+        auth0 = self.getAuth([0], [], [("Dummy", 0)])
+        Config.INF_CACHE_MAX_SIZE = 2
+        try:
+            inf_ids = [IM.CreateInfrastructure("", auth0) for _ in range(3)]
+            for inf_id in inf_ids:
+                StateNotifier.notify(inf_id)
+            InfrastructureList.save_data()
+            inf_ids.append(IM.CreateInfrastructure("", auth0))
+            # The least recently used ones are removed
+            self.assertEqual(sorted(InfrastructureList.infrastructure_list.keys()), sorted(inf_ids[2:]))
+            self.assertEqual(InfrastructureList.get_cache_stats()["evictions"], 2)
+            # The versions of the evicted ones are discarded
+            self.assertNotIn(inf_ids[0], StateNotifier._versions)
+            self.assertNotIn(inf_ids[1], StateNotifier._versions)
+            self.assertIn(inf_ids[2], StateNotifier._versions)
+            # The used Infs are moved to the end of the cache
+            InfrastructureList.get_infrastructure(inf_ids[2])
+            self.assertEqual(list(InfrastructureList.infrastructure_list.keys()), [inf_ids[3], inf_ids[2]])
+
+            # Concurrent requests only load the Inf once
+            get_data = InfrastructureList._get_data_from_db
+
+            def slow_get_data(*args):
+                time.sleep(0.2)
+                return get_data(*args)
+
+            res = []
+
+            def get_inf():
+                res.append(InfrastructureList.get_infrastructure(inf_ids[0]))
+
+            with patch('IM.InfrastructureList.InfrastructureList._get_data_from_db',
+                       side_effect=slow_get_data) as get_data_mock:
+                threads = [threading.Thread(target=get_inf) for _ in range(4)]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+                self.assertEqual(get_data_mock.call_count, 1)
+            self.assertEqual(len(res), 4)
+            self.assertTrue(all(inf is res[0] for inf in res))
+            self.assertEqual(res[0].id, inf_ids[0])
+            self.assertEqual(InfrastructureList.get_cache_stats()["loads"], 1)
+            # inf_ids[3] has changes not stored so it cannot be removed
+            self.assertIn(inf_ids[3], InfrastructureList.infrastructure_list)
+        finally:
+            Config.INF_CACHE_MAX_SIZE = 0
+
+    def test_state_notifier_discard(self):
+        """Discard the versions of the infrastructures not cached."""
+        StateNotifier.notify("inf_discard")
+        version = StateNotifier.get_version("inf_discard")
+        waiter = threading.Thread(target=StateNotifier.wait, args=("inf_discard", version, 0.5))
+        waiter.start()
+        time.sleep(0.1)
+        # Keep the version while there are clients waiting
+        StateNotifier.discard("inf_discard")
+        self.assertEqual(StateNotifier.get_version("inf_discard"), version)
+        waiter.join()
+        self.assertNotIn("inf_discard", StateNotifier._versions)
+        self.assertNotIn("inf_discard", StateNotifier._waiters)
+
+        # A change after the discard keeps the new version
+        StateNotifier.notify("inf_discard")
+        version = StateNotifier.get_version("inf_discard")
+        waiter = threading.Thread(target=StateNotifier.wait, args=("inf_discard", version, 0.5))
+        waiter.start()
+        time.sleep(0.1)
+        StateNotifier.discard("inf_discard")
+        StateNotifier.notify("inf_discard")
+        waiter.join()
+        self.assertIn("inf_discard", StateNotifier._versions)
+        StateNotifier.notify("inf_discard", remove=True)
+
+    def test_vm_state_poller(self):
+        """Background refresh of the VM states."""
+        auth0 = self.getAuth([0], [], [("Dummy", 0)])
+        Config.VM_STATE_POLLER = True
+        Config.VM_STATE_POLLER_FAST_INTERVAL = 1
+        try:
+            radl = RADL()
+            radl.add(system("s0", [Feature("disk.0.image.url", "=", "mock0://linux.for.ev.er"),
+                                   Feature("disk.0.os.credentials.username", "=", "user"),
+                                   Feature("disk.0.os.credentials.password", "=", "pass")]))
+            radl.add(deploy("s0", 2))
+            infId = IM.CreateInfrastructure(str(radl), auth0)
+            vm_states = IM.GetInfrastructureState(infId, auth0)["vm_states"]
+            # Wait the poller to refresh the state of the VMs
+            for _ in range(30):
+                if VMStatePoller.get_stats()["polled"]:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(VMStatePoller.get_stats(), {"active": 1, "polled": 1})
+
+            # The poll does not scan the list of Infs in the DB
+            with patch('IM.InfrastructureList.InfrastructureList.get_inf_ids') as get_inf_ids:
+                VMStatePoller._poll(infId)
+                self.assertEqual(get_inf_ids.call_count, 0)
+            self.assertEqual(VMStatePoller.get_stats(), {"active": 1, "polled": 1})
+
+            inf = IM.get_infrastructure(infId, auth0)
+            with patch('IM.VirtualMachine.VirtualMachine.update_vms_status') as update_vms_status:
+                with patch('IM.VirtualMachine.VirtualMachine.update_status') as update_status:
+                    state = IM.GetInfrastructureState(infId, auth0)
+                    IM.GetVMInfo(infId, "0", auth0)
+                    self.assertEqual(update_vms_status.call_count, 0)
+                    self.assertEqual(update_status.call_count, 0)
+                    self.assertEqual(state["vm_states"], vm_states)
+
+                    # If the Inf is modified the state is updated again
+                    inf.get_vm_list()[0].changed()
+                    IM.GetInfrastructureState(infId, auth0)
+                    self.assertEqual(update_vms_status.call_count, 1)
+
+            IM.DestroyInfrastructure(infId, auth0)
+            VMStatePoller.stop()
+            self.assertEqual(VMStatePoller.get_stats()["active"], 0)
+        finally:
+            Config.VM_STATE_POLLER = False
+            Config.VM_STATE_POLLER_FAST_INTERVAL = 10
+
     def test_reconfigure(self):
         """Reconfigure."""
         radl_str = """"
@@ -747,7 +1068,7 @@ class TestIM(unittest.TestCase):
 
         inf = MagicMock()
         get_inf_ids.return_value = ["1"]
-        InfrastructureList.infrastructure_list = {"1": inf}
+        InfrastructureList.infrastructure_list = OrderedDict([("1", inf)])
         inf.id = "1"
         inf.auth = auth0
         inf.deleted = False
@@ -1068,6 +1389,65 @@ configure step2 (
 
         IM.DestroyInfrastructure(infId, auth0)
 
+    def test_contextualize_events(self):
+        """Test that the ConfManager goes to the next step when the previous one finishes."""
+        radl = """
+            network privada ()
+            system front (
+            cpu.count>=1 and
+            memory.size>=512m and
+            net_interface.0.connection = 'privada' and
+            disk.0.image.url = 'dummy://server.com/image' and
+            disk.0.os.credentials.username = 'user' and
+            disk.0.os.credentials.password = 'pass' and
+            disk.0.os.name = 'linux'
+            )
+            contextualize ()
+            deploy front 1
+        """
+
+        auth0 = Authentication([{'id': 'im', 'type': 'InfrastructureManager', 'username': 'user', 'password': 'pass'},
+                                {'id': 'dummy', 'type': 'Dummy'}])
+        Config.CONFMAMAGER_CHECK_STATE_INTERVAL = 10
+        check_vm_ips = ConfManager.check_vm_ips
+        finished = threading.Event()
+
+        def slow_check_vm_ips(cm):
+            time.sleep(0.5)
+            return check_vm_ips(cm)
+
+        def last_step(cm):
+            finished.set()
+            return True
+
+        try:
+            with patch.object(ConfManager, 'check_vm_ips', slow_check_vm_ips):
+                with patch.object(ConfManager, 'wait_all_vm_ips', last_step):
+                    before = time.time()
+                    infId = IM.CreateInfrastructure(radl, auth0)
+                    self.assertTrue(finished.wait(5))
+                    # The step is not delayed with the check state interval
+                    self.assertLess(time.time() - before, 3)
+            inf = IM.get_infrastructure(infId, auth0)
+
+            # The ConfManager waits for the events
+            since = inf.cm.get_event_version()
+            self.assertFalse(inf.cm.wait_event(since, 0.1))
+            threading.Timer(0.1, inf.vm_list[0]._set_state, (VirtualMachine.STOPPED,)).start()
+            self.assertTrue(inf.cm.wait_event(since, 5))
+            self.assertGreater(inf.cm.get_event_version(), since)
+
+            # The events do not update the VMs more than once every CHECK_CTXT_PROCESS_INTERVAL secs
+            with patch('IM.VirtualMachine.VirtualMachine.update_status') as update_status:
+                inf.cm._vm_updates = {}
+                self.assertTrue(inf.cm._update_vm_status(inf.vm_list[0]))
+                self.assertFalse(inf.cm._update_vm_status(inf.vm_list[0]))
+                self.assertEqual(update_status.call_count, 1)
+        finally:
+            Config.CONFMAMAGER_CHECK_STATE_INTERVAL = 5
+
+        IM.DestroyInfrastructure(infId, auth0)
+
     @patch('requests.request')
     def test_check_oidc_invalid_token(self, request):
         im_auth = {"token": self.gen_token()}
@@ -1143,6 +1523,87 @@ configure step2 (
         self.assertEqual(im_auth['username'], InfrastructureInfo.OPENID_USER_PREFIX + "micafer")
         self.assertEqual(im_auth['password'], "https://iam-test.indigo-datacloud.eu/sub")
 
+    @patch('IM.InfrastructureManager.OpenIDClient')
+    def test_check_oidc_token_cache(self, openidclient):
+        user_info = json.loads(read_file_as_string('../files/iam_user_info.json'))
+        openidclient.is_access_token_expired.return_value = False, "Valid Token for 100 seconds"
+        openidclient.get_user_info_request.return_value = True, user_info
+
+        Config.OIDC_ISSUERS = ["https://iam-test.indigo-datacloud.eu/"]
+        Config.OIDC_AUDIENCE = None
+        Config.OIDC_CACHE_TIME = 300
+        Config.OIDC_CACHE_NEGATIVE_TIME = 30
+        Config.OIDC_CACHE_MAX_SIZE = 2
+        try:
+            token = self.gen_token(exp=100)
+            for _ in range(3):
+                im_auth = {"token": token}
+                IM.check_oidc_token(im_auth)
+                self.assertEqual(im_auth['username'], InfrastructureInfo.OPENID_USER_PREFIX + "micafer")
+                self.assertEqual(im_auth['password'], "https://iam-test.indigo-datacloud.eu/sub")
+            # The issuer is only contacted once
+            self.assertEqual(openidclient.get_user_info_request.call_count, 1)
+
+            # The expired tokens are also cached
+            openidclient.is_access_token_expired.return_value = True, "Token expired"
+            token = self.gen_token(exp=100, user_sub="other")
+            for _ in range(2):
+                with self.assertRaises(Exception) as ex:
+                    IM.check_oidc_token({"token": token})
+                self.assertEqual(str(ex.exception),
+                                 "Invalid InfrastructureManager credentials. OIDC auth Token expired.")
+            self.assertEqual(openidclient.is_access_token_expired.call_count, 2)
+
+            # But not the ones rejected by the issuer
+            openidclient.is_access_token_expired.return_value = False, "Valid Token for 100 seconds"
+            openidclient.get_user_info_request.return_value = False, "Invalid token"
+            token = self.gen_token(exp=150)
+            for _ in range(2):
+                with self.assertRaises(Exception) as ex:
+                    IM.check_oidc_token({"token": token})
+                self.assertEqual(str(ex.exception), "Invalid InfrastructureManager credentials. Invalid token.")
+            self.assertEqual(openidclient.get_user_info_request.call_count, 3)
+
+            # The least recently used tokens are removed
+            openidclient.get_user_info_request.return_value = True, user_info
+            IM.check_oidc_token({"token": self.gen_token(exp=200)})
+            self.assertEqual(len(IM._oidc_cache), 2)
+            IM.check_oidc_token({"token": self.gen_token(exp=100)})
+            self.assertEqual(openidclient.get_user_info_request.call_count, 5)
+
+            # The cached data is not used after the token expiration
+            token = self.gen_token(exp=-1)
+            IM.check_oidc_token({"token": token})
+            IM.check_oidc_token({"token": token})
+            self.assertEqual(openidclient.get_user_info_request.call_count, 7)
+        finally:
+            Config.OIDC_CACHE_TIME = 0
+            Config.OIDC_CACHE_NEGATIVE_TIME = 0
+            Config.OIDC_CACHE_MAX_SIZE = 1000
+
+    @patch('IM.InfrastructureManager.OpenIDClient')
+    def test_check_oidc_verify_token(self, openidclient):
+        openidclient.is_access_token_expired.return_value = False, "Valid Token for 100 seconds"
+        openidclient.verify_token.return_value = False, "Invalid token signature"
+
+        Config.OIDC_ISSUERS = ["https://iam-test.indigo-datacloud.eu/"]
+        Config.OIDC_AUDIENCE = None
+        Config.OIDC_VERIFY_TOKEN = True
+        try:
+            with self.assertRaises(Exception) as ex:
+                IM.check_oidc_token({"token": self.gen_token(exp=100)})
+            self.assertEqual(str(ex.exception), "Invalid InfrastructureManager credentials. Invalid token signature.")
+
+            # The user info is obtained from the verified token
+            openidclient.verify_token.return_value = True, {}
+            im_auth = {"token": self.gen_token(exp=100, user_sub="sub", username="micafer")}
+            IM.check_oidc_token(im_auth)
+            self.assertEqual(im_auth['username'], InfrastructureInfo.OPENID_USER_PREFIX + "micafer")
+            self.assertEqual(im_auth['password'], "https://iam-test.indigo-datacloud.eu/sub")
+            self.assertEqual(openidclient.get_user_info_request.call_count, 0)
+        finally:
+            Config.OIDC_VERIFY_TOKEN = False
+
     def test_inf_auth_with_token(self):
         im_auth = {"token": (self.gen_token())}
         im_auth['username'] = InfrastructureInfo.OPENID_USER_PREFIX + "micafer"
@@ -1225,6 +1686,74 @@ configure step2 (
         self.assertEqual(res['1'].vm_master.info.systems[0].getValue("disk.0.image.url"), "mock0://linux.for.ev.er")
         self.assertTrue(res['1'].auth.compare(inf.auth, "InfrastructureManager"))
 
+    def test_contmsg_store(self):
+        """ Test the storage of the cont msgs in a separate table."""
+        inf = InfrastructureInfo()
+        inf.auth = self.getAuth([0], [], [("Dummy", 0)])
+        cloud = CloudInfo()
+        cloud.type = "Dummy"
+        radl = RADL()
+        radl.add(system("s0", [Feature("disk.0.image.url", "=", "mock0://linux.for.ev.er")]))
+        vm = VirtualMachine(inf, "1", cloud, radl, radl, None, 0)
+        inf.vm_list = [vm]
+        inf.add_cont_msg("Inf message")
+        vm.cont_out = "VM log"
+
+        Config.CONTMSG_STORE = True
+        Config.CONTMSG_MAX_SIZE = 20
+        try:
+            self.assertTrue(InfrastructureList._save_data_to_db(Config.DATA_DB, {inf.id: inf}))
+            # The messages are not stored with the Inf data
+            self.assertNotIn("VM log", inf.serialize(False))
+            self.assertNotIn("Inf message", inf.serialize(False))
+
+            res = InfrastructureList._get_data_from_db(Config.DATA_DB, inf.id)[inf.id]
+            self.assertNotIn('cont_out', res.vm_list[0].__dict__)
+            self.assertEqual(res.vm_list[0].cont_out, "VM log")
+            self.assertIn("Inf message", res.cont_out)
+
+            # Only the new segments are stored removing the oldest ones
+            with patch('IM.db.DataBase.executemany', autospec=True, side_effect=DataBase.executemany) as execute:
+                res.vm_list[0].cont_out += " line2"
+                InfrastructureList._save_data_to_db(Config.DATA_DB, {inf.id: res})
+                inserts = [call[0][2] for call in execute.call_args_list if "inf_contmsg" in call[0][1] and
+                           call[0][1].startswith("replace")]
+                self.assertEqual([row[2:4] for row in inserts[0]], [(1, 6)])
+            res.vm_list[0].cont_out += " line3 is longer"
+            self.assertTrue(InfrastructureList._save_data_to_db(Config.DATA_DB, {inf.id: res}))
+            res2 = InfrastructureList._get_data_from_db(Config.DATA_DB, inf.id)[inf.id]
+            self.assertEqual(res2.vm_list[0].cont_out, " line3 is longer")
+
+            # The messages replaced are also truncated
+            res2.vm_list[0].cont_out = "0123456789" * 3
+            self.assertTrue(InfrastructureList._save_data_to_db(Config.DATA_DB, {inf.id: res2}))
+            res3 = InfrastructureList._get_data_from_db(Config.DATA_DB, inf.id)[inf.id]
+            self.assertEqual(res3.vm_list[0].cont_out, "0123456789" * 2)
+
+            # The exported data includes the messages
+            self.assertIn("0123456789", res3.serialize())
+
+            # If the messages are not stored the Inf is not marked as saved
+            res3.vm_list[0].cont_out += " line4"
+            with patch('IM.ContMsgStore.ContMsgStore.save', return_value=False):
+                self.assertFalse(InfrastructureList._save_data_to_db(Config.DATA_DB, {inf.id: res3}))
+            with patch('IM.ContMsgStore.ContMsgStore.save', side_effect=Exception("DB error")):
+                self.assertFalse(InfrastructureList._save_data_to_db(Config.DATA_DB, {inf.id: res3}))
+            self.assertTrue(InfrastructureList._save_data_to_db(Config.DATA_DB, {inf.id: res3}))
+            res4 = InfrastructureList._get_data_from_db(Config.DATA_DB, inf.id)[inf.id]
+            self.assertEqual(res4.vm_list[0].cont_out, " line4")
+        finally:
+            Config.CONTMSG_STORE = False
+            Config.CONTMSG_MAX_SIZE = 1048576
+
+        # Without the ContMsgStore the messages are not truncated
+        Config.CONTMSG_MAX_SIZE = 20
+        try:
+            res4.vm_list[0].cont_out = "0123456789" * 3
+            self.assertIn("0123456789" * 3, res4.serialize())
+        finally:
+            Config.CONTMSG_MAX_SIZE = 1048576
+
     def test_inf_remove_two_clouds(self):
         """Test remove VMs from 2 cloud providers."""
         radl = """"
@@ -1438,6 +1967,19 @@ configure step2 (
         self.assertIn({'id': 'cloud1', 'type': 'OpenNebula', 'username': 'user', 'password': 'pass'}, res.auth_list)
         self.assertIn({'type': 'InfrastructureManager', 'token': 'atoken'}, res.auth_list)
 
+        Config.VAULT_CACHE_TIME = 300
+        try:
+            for _ in range(2):
+                auth = Authentication([{'type': 'Vault', 'host': 'http://vault.com:8200/', 'token': 'atoken'},
+                                       {'type': 'InfrastructureManager', 'token': 'atoken'}])
+                res = IM.get_auth_from_vault(auth)
+                self.assertIn({'id': 'cloud1', 'type': 'OpenNebula', 'username': 'user', 'password': 'pass'},
+                              res.auth_list)
+        finally:
+            Config.VAULT_CACHE_TIME = 0
+        # Vault is only contacted once for the same token
+        self.assertEqual(vault_mock.get_creds.call_count, 2)
+
     def test_change_inf_auth(self):
         """Try to access not owned Infs."""
         auth0, auth1, auth2 = self.getAuth([0]), self.getAuth([1]), self.getAuth([2])
@@ -1505,6 +2047,47 @@ configure step2 (
                        'host': 'https://ostsite.com:5000', 'domain': 'projectid'}, res.auth_list)
         self.assertIn({'type': 'InfrastructureManager', 'token': 'atoken'}, res.auth_list)
 
+    @patch('IM.InfrastructureManager.InfrastructureManager.translate_egi_to_ost')
+    @patch('IM.InfrastructureManager.InfrastructureManager.check_im_user')
+    def test_auth_cache(self, check_im_user, translate_egi_to_ost):
+        """Test the cache of validated credentials."""
+        check_im_user.return_value = True
+        translate_egi_to_ost.side_effect = lambda auth: auth
+        Config.AUTH_CACHE_TIME = 300
+        try:
+            for _ in range(3):
+                auth = IM.check_auth_data(self.getAuth([0], [], [("Dummy", 0)]))
+                self.assertTrue(auth.checked)
+                self.assertEqual(auth.getAuthInfo("InfrastructureManager")[0]["username"], "user0")
+                # The cached data must not be modified by the callers
+                auth.getAuthInfo("InfrastructureManager")[0]["username"] = "other"
+            self.assertEqual(check_im_user.call_count, 1)
+            self.assertEqual(translate_egi_to_ost.call_count, 1)
+
+            # Different credentials are validated again
+            auth = IM.check_auth_data(self.getAuth([1]))
+            self.assertEqual(auth.getAuthInfo("InfrastructureManager")[0]["username"], "user1")
+            self.assertEqual(check_im_user.call_count, 2)
+
+            # The invalid credentials are not cached
+            check_im_user.return_value = False
+            for _ in range(2):
+                with self.assertRaises(InvaliddUserException):
+                    IM.check_auth_data(self.getAuth([2]))
+            self.assertEqual(check_im_user.call_count, 4)
+
+            # The cached data is not used after the token expiration
+            check_im_user.return_value = True
+            auth = Authentication([{'type': 'InfrastructureManager', 'token': 'token'}])
+            auth.cache_key = "key"
+            with patch('IM.InfrastructureManager.InfrastructureManager.check_oidc_token'):
+                with patch('IM.InfrastructureManager.JWT.get_info') as get_info:
+                    get_info.return_value = {'exp': time.time() - 1}
+                    IM.check_auth_data(auth)
+            self.assertIsNone(IM.get_cached_auth("key"))
+        finally:
+            Config.AUTH_CACHE_TIME = 0
+
 
 if __name__ == "__main__":
     unittest.main()